@@ -0,0 +1,81 @@
+"""
+Compare the torch and ONNX Runtime embedding backends.
+
+Embeds the same synthetic chunks (ingestion) and questions (queries) with
+sentence-transformers, the float32 ONNX export and the int8 export, and
+reports throughput, speedup over torch and drift (cosine to torch).
+
+Usage (from the project root):
+    python bench/embedding_backends.py
+    python bench/embedding_backends.py --chunks 2000 --variants torch onnx
+"""
+import argparse
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "src"))
+sys.path.insert(0, BENCH_DIR)
+
+from harness import environment, save_json  # noqa: E402
+from synthetic import SAMPLE_QUESTIONS, make_paragraphs  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Embedding backend comparison")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"))
+    parser.add_argument("--chunks", type=int, default=512, help="Synthetic chunks embedded per pass")
+    parser.add_argument("--chunk-size", type=int, default=1500, help="Characters per chunk")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes per backend (best counts)")
+    parser.add_argument("--variants", nargs="+", choices=("torch", "onnx", "onnx-int8"),
+                        default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--min-cosine", type=float, default=None,
+                        help="Exit 1 if a backend drifts below this (default: EMBEDDING_ONNX_MIN_COSINE)")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "embedding_backends.json"))
+    return parser.parse_args()
+
+
+def print_report(title: str, report: dict):
+    print(f"\n{title} ({report['texts']} texts, batch {report['batch_size']})")
+    print(f"  {'backend':<10} {'seconds':>9} {'texts/s':>9} {'speedup':>8} {'min cos':>9} {'mean cos':>9}")
+    for name, entry in report["backends"].items():
+        print(f"  {name:<10} {entry['seconds']:>9.3f} {entry['texts_per_second']:>9.1f} "
+              f"{entry['speedup']:>7.2f}x {entry['min_cosine']:>9.5f} {entry['mean_cosine']:>9.5f}")
+
+
+def main():
+    args = parse_args()
+
+    from embeddings import EMBEDDING_ONNX_MIN_COSINE, compare_backends
+
+    paragraphs = make_paragraphs(args.chunks * args.chunk_size)
+    text = "\n".join(paragraphs)
+    chunks = [text[i:i + args.chunk_size] for i in range(0, len(text), args.chunk_size)][:args.chunks]
+
+    ingestion = compare_backends(args.model, chunks, args.batch_size, args.repeat, args.variants)
+    # Queries arrive one by one (or in small micro-batches)
+    queries = compare_backends(args.model, SAMPLE_QUESTIONS * 4, 1, args.repeat, args.variants)
+
+    print_report("Ingestion", ingestion)
+    print_report("Queries", queries)
+
+    save_json(args.output, {"environment": environment(), "ingestion": ingestion, "queries": queries})
+    print(f"\nResults written to {args.output}")
+
+    min_cosine = EMBEDDING_ONNX_MIN_COSINE if args.min_cosine is None else args.min_cosine
+    drifted = [
+        f"{name} ({entry['min_cosine']})"
+        for report in (ingestion, queries)
+        for name, entry in report["backends"].items()
+        if entry["min_cosine"] < min_cosine
+    ]
+    if drifted:
+        print(f"Drift beyond min cosine {min_cosine}: {', '.join(sorted(set(drifted)))}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
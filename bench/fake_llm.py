@@ -0,0 +1,31 @@
+"""
+Local stand-in for a chat model, so query benchmarks need no network or API key.
+"""
+from typing import Optional
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.output_parsers import StrOutputParser
+
+FAKE_ANSWER = (
+    "Based on the provided context, the document describes the retrieval "
+    "pipeline, its evaluation results and the measured latency."
+)
+
+
+def install_fake_llm(assistant, answer: str = FAKE_ANSWER, sleep: Optional[float] = None):
+    """
+    Point an assistant's default chain at a fake chat model
+
+    Queries made without a per-request config (the Streamlit path) then
+    exercise the real prompt template and output parser, but the model call
+    itself returns answer immediately (or after sleep seconds).
+
+    Args:
+        assistant: RAGAssistant
+        answer: Text the fake model returns
+        sleep: Optional simulated model latency in seconds
+    """
+    assistant.current_model = "fake-llm"
+    assistant.llm = FakeListChatModel(responses=[answer], sleep=sleep)
+    assistant.chain = assistant.prompt_template | assistant.llm | StrOutputParser()
+    return assistant
@@ -0,0 +1,170 @@
+"""
+Timing, memory and baseline-comparison helpers shared by the benchmarks.
+"""
+import gc
+import json
+import math
+import os
+import platform
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(1, rank)) - 1]
+
+
+def _rss_bytes() -> int:
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+class PeakRSS:
+    """
+    Samples the process RSS in a background thread while a block runs
+
+    Without psutil this falls back to the process-wide high-water mark,
+    which can only grow between benchmarks.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+        return False
+
+
+def measure(name: str, fn: Callable[[int], Optional[float]], repeat: int, warmup: int = 1,
+            unit: str = "ops") -> Dict:
+    """
+    Time fn(i) repeat times after warmup calls
+
+    Args:
+        name: Benchmark name
+        fn: Called with the iteration number; may return a work count
+            (e.g. chunks indexed) used for throughput, 1 otherwise
+        repeat: Timed iterations
+        warmup: Untimed iterations run first (model loads, caches)
+        unit: What the work count counts
+
+    Returns:
+        dict: p50/p95/p99/mean latency in ms, throughput per second, peak RSS in MB
+    """
+    for i in range(warmup):
+        fn(-1 - i)
+
+    gc.collect()
+    latencies: List[float] = []
+    work = 0.0
+
+    with PeakRSS() as rss:
+        for i in range(repeat):
+            start_time = time.perf_counter()
+            count = fn(i)
+            latencies.append(time.perf_counter() - start_time)
+            work += 1 if count is None else count
+
+    latencies.sort()
+    total = sum(latencies)
+    result = {
+        "n": repeat,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(total / len(latencies) * 1000, 3) if latencies else 0.0,
+        "throughput": round(work / total, 3) if total else 0.0,
+        "throughput_unit": f"{unit}/s",
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+    }
+    print(
+        f"{name:<28} p50 {result['p50_ms']:>10.2f} ms  p95 {result['p95_ms']:>10.2f} ms  "
+        f"p99 {result['p99_ms']:>10.2f} ms  {result['throughput']:>10.2f} {result['throughput_unit']:<12} "
+        f"rss {result['peak_rss_mb']:>8.1f} MB"
+    )
+    return result
+
+
+def environment() -> Dict:
+    """Facts about the machine, recorded next to the results"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """
+    Compare p95 latency and peak RSS against a baseline
+
+    Args:
+        results: Current results by benchmark name
+        baseline: Baseline results by benchmark name
+        threshold: Allowed relative increase, e.g. 0.2 for +20%
+
+    Returns:
+        List of regression descriptions (empty if none)
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ("p95_ms", "peak_rss_mb"):
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            marker = "REGRESSION" if change > threshold else "ok"
+            print(f"  {name:<28} {metric:<12} {before:>10.2f} -> {after:>10.2f} ({change:+.1%}) {marker}")
+            if change > threshold:
+                regressions.append(f"{name} {metric}: {before} -> {after} ({change:+.1%})")
+    return regressions
+
+
+def load_json(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(path: str, data: Dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
@@ -0,0 +1,391 @@
+"""
+Load generator for the FastAPI service.
+
+Drives /upload, /chat, /messages and /query concurrently and reports throughput,
+error rates and latency percentiles per endpoint. Pair it with the stub LLM
+provider (LLM_STUB_ENABLED=true, model 'stub') so results measure this
+service, not a remote provider's rate limits.
+
+Usage (from the project root):
+    # Against a running server (start it with LLM_STUB_ENABLED=true)
+    python bench/loadtest.py --concurrency 16 --duration 30
+
+    # Open-loop arrivals at a fixed rate, with think time between a user's requests
+    python bench/loadtest.py --rps 20 --concurrency 64 --think-time 500
+
+    # Find the saturation point of 1 vs 4 uvicorn workers (servers are started for you)
+    python bench/loadtest.py --spawn-workers 1 4 --saturate
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import httpx  # noqa: E402
+
+from harness import environment, percentile, save_json  # noqa: E402
+from synthetic import SAMPLE_QUESTIONS, make_paragraphs, make_pdf  # noqa: E402
+
+ENDPOINTS = ("chat", "query", "messages", "upload")
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """'chat=0.7,messages=0.2,upload=0.1' -> weights by endpoint"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_docs(text: str) -> List[Tuple[str, int]]:
+    """'txt:64,pdf:10' -> [('txt', 64 KB), ('pdf', 10 pages)]"""
+    docs = []
+    for part in text.split(","):
+        kind, _, size = part.partition(":")
+        kind = kind.strip().lower()
+        if kind not in ("txt", "pdf"):
+            raise argparse.ArgumentTypeError(f"Unknown document type: {kind}")
+        docs.append((kind, int(size or (64 if kind == "txt" else 10))))
+    return docs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="RAG Engine load generator")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of a running server")
+    parser.add_argument("--concurrency", type=int, default=8, help="Virtual users / max requests in flight")
+    parser.add_argument("--rps", type=float, default=0,
+                        help="Open-loop arrival rate; 0 = closed loop (each user sends as fast as it can)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per load level")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("chat=0.7,messages=0.2,upload=0.1"),
+                        help="Endpoint weights, e.g. chat=0.6,query=0.1,messages=0.2,upload=0.1")
+    parser.add_argument("--docs", type=parse_docs, default=parse_docs("txt:64,txt:256,pdf:10"),
+                        help="Document mix for uploads: type:size (TXT in KB, PDF in pages)")
+    parser.add_argument("--new-doc-ratio", type=float, default=0.5,
+                        help="Share of uploads with new content (the rest hit the dedup cache)")
+    parser.add_argument("--sessions", type=int, default=4, help="Documents uploaded up front for queries")
+    parser.add_argument("--think-time", type=float, default=0, help="Mean pause between a user's requests (ms)")
+    parser.add_argument("--model", default="stub", help="Model saved via /api-key before the run")
+    parser.add_argument("--api-key", default="stub-key", help="API key saved via /api-key before the run")
+    parser.add_argument("--user-id", default="loadtest", help="X-User-Id of the virtual users")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--saturate", action="store_true",
+                        help="Double concurrency each level until throughput stops growing")
+    parser.add_argument("--max-concurrency", type=int, default=256, help="Upper bound for --saturate")
+    parser.add_argument("--saturation-gain", type=float, default=0.05,
+                        help="Stop when a level adds less than this relative throughput")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Stop when errors exceed this share")
+    parser.add_argument("--spawn-workers", type=int, nargs="+",
+                        help="Start uvicorn with each worker count in turn and test it")
+    parser.add_argument("--port", type=int, default=8765, help="Port for --spawn-workers servers")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "loadtest.json"))
+    return parser.parse_args()
+
+
+class Recorder:
+    """Latencies, status codes and errors per endpoint for one load level"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.errors: Dict[str, int] = {name: 0 for name in ENDPOINTS}
+        self.status_codes: Dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.finished = self.started
+
+    def record(self, endpoint: str, seconds: float, status: Optional[int]):
+        key = str(status) if status is not None else "exception"
+        self.status_codes[key] = self.status_codes.get(key, 0) + 1
+        if status is not None and status < 400:
+            self.latencies[endpoint].append(seconds)
+        else:
+            self.errors[endpoint] += 1
+
+    def summary(self) -> Dict:
+        elapsed = max(1e-9, self.finished - self.started)
+        endpoints = {}
+        total_ok = total_errors = 0
+        all_latencies: List[float] = []
+        for name in ENDPOINTS:
+            latencies = sorted(self.latencies[name])
+            ok, errors = len(latencies), self.errors[name]
+            if not ok and not errors:
+                continue
+            total_ok += ok
+            total_errors += errors
+            all_latencies.extend(latencies)
+            endpoints[name] = {
+                "requests": ok + errors,
+                "errors": errors,
+                "error_rate": round(errors / (ok + errors), 4),
+                "throughput_rps": round(ok / elapsed, 2),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            }
+        all_latencies.sort()
+        requests = total_ok + total_errors
+        return {
+            "duration_s": round(elapsed, 2),
+            "requests": requests,
+            "throughput_rps": round(total_ok / elapsed, 2),
+            "error_rate": round(total_errors / requests, 4) if requests else 0.0,
+            "p50_ms": round(percentile(all_latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(all_latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 1),
+            "endpoints": endpoints,
+            "status_codes": self.status_codes,
+        }
+
+
+class DocumentFactory:
+    """Upload payloads following the configured document mix"""
+
+    def __init__(self, docs: List[Tuple[str, int]], new_doc_ratio: float, rng: random.Random):
+        self.docs = docs
+        self.new_doc_ratio = new_doc_ratio
+        self.rng = rng
+        self._cache: Dict[Tuple[str, int, int], bytes] = {}
+        self._next_seed = 1000
+
+    def _render(self, kind: str, size: int, seed: int) -> bytes:
+        key = (kind, size, seed)
+        if key not in self._cache:
+            if kind == "txt":
+                data = "\n\n".join(make_paragraphs(size * 1024, seed)).encode("utf-8")
+            else:
+                with tempfile.TemporaryDirectory() as tmp:
+                    path = make_pdf(os.path.join(tmp, "doc.pdf"), size, seed=seed)
+                    with open(path, "rb") as f:
+                        data = f.read()
+            # Keep repeated documents only; new ones are used once
+            if seed < 1000:
+                self._cache[key] = data
+            return data
+        return self._cache[key]
+
+    def make(self, new: Optional[bool] = None) -> Tuple[str, bytes, str]:
+        """Returns (filename, content, content type)"""
+        kind, size = self.rng.choice(self.docs)
+        if new is None:
+            new = self.rng.random() < self.new_doc_ratio
+        if new:
+            seed = self._next_seed
+            self._next_seed += 1
+        else:
+            seed = self.rng.randrange(4)
+        content_type = "application/pdf" if kind == "pdf" else "text/plain"
+        return f"load-{kind}-{size}-{seed}.{kind}", self._render(kind, size, seed), content_type
+
+
+class LoadTest:
+    def __init__(self, args, base_url: str):
+        self.args = args
+        self.base_url = base_url.rstrip("/")
+        self.rng = random.Random(args.seed)
+        self.documents = DocumentFactory(args.docs, args.new_doc_ratio, self.rng)
+        self.sessions: List[str] = []
+        self.headers = {"X-User-Id": args.user_id}
+        names = list(args.mix)
+        self._endpoints = names
+        self._weights = [args.mix[name] for name in names]
+
+    async def setup(self, client: httpx.AsyncClient):
+        """Save the API key and upload the documents queries will run against"""
+        response = await client.post(
+            "/api-key", json={"api_key": self.args.api_key, "model": self.args.model}, headers=self.headers
+        )
+        response.raise_for_status()
+        for _ in range(self.args.sessions):
+            filename, content, content_type = self.documents.make(new=False)
+            response = await client.post(
+                "/upload", files={"file": (filename, content, content_type)}, headers=self.headers
+            )
+            response.raise_for_status()
+            self.sessions.append(response.json()["session_id"])
+        print(f"Setup: {len(self.sessions)} sessions ready")
+
+    async def _request(self, client: httpx.AsyncClient, endpoint: str) -> int:
+        if endpoint == "upload":
+            filename, content, content_type = self.documents.make()
+            response = await client.post(
+                "/upload", files={"file": (filename, content, content_type)}, headers=self.headers
+            )
+        else:
+            session_id = self.rng.choice(self.sessions)
+            question = self.rng.choice(SAMPLE_QUESTIONS)
+            if endpoint == "messages":
+                # Pure append: measures the history write path only
+                body = {"session_id": session_id, "role": "user", "content": question}
+            elif endpoint == "chat":
+                body = {"session_id": session_id, "question": question, "idempotency_key": uuid.uuid4().hex}
+            else:
+                body = {"session_id": session_id, "question": question, "n_results": 3}
+            response = await client.post(f"/{endpoint}", json=body, headers=self.headers)
+        return response.status_code
+
+    async def _timed(self, client: httpx.AsyncClient, recorder: Recorder, scheduled: float):
+        endpoint = self.rng.choices(self._endpoints, weights=self._weights)[0]
+        try:
+            status = await self._request(client, endpoint)
+        except httpx.HTTPError:
+            status = None
+        # Measured from the scheduled start, so queueing in an overloaded server counts
+        recorder.record(endpoint, time.perf_counter() - scheduled, status)
+
+    async def _think(self):
+        if self.args.think_time > 0:
+            await asyncio.sleep(self.rng.expovariate(1000.0 / self.args.think_time))
+
+    async def run_level(self, client: httpx.AsyncClient, concurrency: int) -> Dict:
+        """Run one load level for --duration seconds"""
+        recorder = Recorder()
+        deadline = time.perf_counter() + self.args.duration
+
+        if self.args.rps > 0:
+            # Open loop: Poisson arrivals, at most `concurrency` requests in flight
+            semaphore = asyncio.Semaphore(concurrency)
+            tasks = set()
+
+            async def arrival(scheduled: float):
+                async with semaphore:
+                    await self._timed(client, recorder, scheduled)
+
+            next_arrival = time.perf_counter()
+            while next_arrival < deadline:
+                await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+                task = asyncio.create_task(arrival(next_arrival))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                next_arrival += self.rng.expovariate(self.args.rps)
+            if tasks:
+                await asyncio.gather(*tasks)
+        else:
+            # Closed loop: each virtual user sends, waits for the answer, thinks, repeats
+            async def user():
+                while time.perf_counter() < deadline:
+                    await self._timed(client, recorder, time.perf_counter())
+                    await self._think()
+
+            await asyncio.gather(*(user() for _ in range(concurrency)))
+
+        recorder.finished = time.perf_counter()
+        summary = recorder.summary()
+        summary["concurrency"] = concurrency
+        print(
+            f"  concurrency {concurrency:>4}: {summary['throughput_rps']:>8.2f} req/s  "
+            f"p50 {summary['p50_ms']:>8.1f} ms  p95 {summary['p95_ms']:>8.1f} ms  "
+            f"p99 {summary['p99_ms']:>8.1f} ms  errors {summary['error_rate']:.2%}"
+        )
+        return summary
+
+    async def run(self) -> Dict:
+        limits = httpx.Limits(max_connections=self.args.max_concurrency, max_keepalive_connections=64)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.args.timeout, limits=limits) as client:
+            await self.setup(client)
+
+            if not self.args.saturate:
+                return {"levels": [await self.run_level(client, self.args.concurrency)]}
+
+            levels: List[Dict] = []
+            concurrency = 1
+            while concurrency <= self.args.max_concurrency:
+                level = await self.run_level(client, concurrency)
+                levels.append(level)
+                if level["error_rate"] > self.args.max_error_rate:
+                    print("  stopping: error rate above limit")
+                    break
+                if len(levels) > 1:
+                    previous = levels[-2]["throughput_rps"]
+                    if previous and (level["throughput_rps"] - previous) / previous < self.args.saturation_gain:
+                        print("  stopping: throughput stopped growing")
+                        break
+                concurrency *= 2
+
+            best = max(levels, key=lambda level: level["throughput_rps"])
+            print(
+                f"  saturation: {best['throughput_rps']:.2f} req/s at concurrency {best['concurrency']} "
+                f"(p95 {best['p95_ms']:.1f} ms)"
+            )
+            return {"levels": levels, "saturation": best}
+
+
+def start_server(workers: int, port: int, workdir: str) -> subprocess.Popen:
+    """Start uvicorn with the stub provider enabled, in an isolated working directory"""
+    env = dict(os.environ, LLM_STUB_ENABLED="true", MAINTENANCE_INTERVAL_SECONDS="0")
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--app-dir", os.path.join(PROJECT_ROOT, "src"),
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning",
+    ]
+    return subprocess.Popen(command, cwd=workdir, env=env)
+
+
+def wait_until_up(base_url: str, process: subprocess.Popen, timeout: float = 180):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("Server did not become ready in time")
+
+
+def main():
+    args = parse_args()
+    report = {"environment": environment(), "parameters": {
+        key: value for key, value in vars(args).items() if key not in ("output", "api_key")
+    }, "runs": {}}
+
+    if not args.spawn_workers:
+        print(f"Load testing {args.url}")
+        report["runs"]["external"] = asyncio.run(LoadTest(args, args.url).run())
+    else:
+        for workers in args.spawn_workers:
+            workdir = tempfile.mkdtemp(prefix="rag-load-")
+            base_url = f"http://127.0.0.1:{args.port}"
+            print(f"\n{workers} uvicorn worker(s) in {workdir}")
+            process = start_server(workers, args.port, workdir)
+            try:
+                wait_until_up(base_url, process)
+                report["runs"][f"workers_{workers}"] = asyncio.run(LoadTest(args, base_url).run())
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        if len(args.spawn_workers) > 1:
+            print("\nWorkers comparison:")
+            for name, run in report["runs"].items():
+                best = run.get("saturation") or run["levels"][-1]
+                print(f"  {name:<12} {best['throughput_rps']:>8.2f} req/s  p95 {best['p95_ms']:>8.1f} ms "
+                      f"at concurrency {best['concurrency']}")
+
+    save_json(args.output, report)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
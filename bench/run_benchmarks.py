@@ -0,0 +1,188 @@
+"""
+Benchmarks for the ingestion and query hot paths.
+
+Runs entirely offline: documents are generated, the embedding model is the
+configured sentence-transformers model, and the LLM is a local fake.
+
+Usage (from the project root):
+    python bench/run_benchmarks.py                    # run and compare with bench/baseline.json
+    python bench/run_benchmarks.py --save-baseline    # record the current numbers as the baseline
+    python bench/run_benchmarks.py --only search query --repeat 50
+"""
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "src"))
+sys.path.insert(0, BENCH_DIR)
+
+from harness import compare, environment, load_json, measure, save_json  # noqa: E402
+from synthetic import SAMPLE_QUESTIONS, make_pdf, make_txt  # noqa: E402
+
+BENCHMARKS = ("validate_txt", "validate_pdf", "chunk_text", "add_document", "search", "query")
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "latest.json")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="RAG Engine benchmark suite")
+    parser.add_argument("--txt-kb", type=int, default=256, help="Size of the synthetic TXT file")
+    parser.add_argument("--pdf-pages", type=int, default=40, help="Pages of the synthetic PDF")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic documents")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed iterations for fast benchmarks")
+    parser.add_argument("--ingest-repeat", type=int, default=3, help="Timed iterations for add_document")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="Run only these benchmarks")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to write this run's results")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative p95/RSS increase before a regression is reported")
+    parser.add_argument("--no-fail", action="store_true", help="Exit 0 even if regressions are found")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the temporary ChromaDB/SQLite files")
+    return parser.parse_args()
+
+
+def run(args) -> dict:
+    selected = set(args.only or BENCHMARKS)
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+
+    # ChromaDB and SQLite paths are relative to the working directory
+    os.chdir(workdir)
+    print(f"Working directory: {workdir}")
+
+    from utils import validate_txt_or_pdf
+    from vectordb import VectorDB, get_vector_db
+    from app import RAGAssistant
+    from fake_llm import install_fake_llm
+
+    txt_path = make_txt(os.path.join(workdir, "bench.txt"), args.txt_kb, args.seed)
+    pdf_path = make_pdf(os.path.join(workdir, "bench.pdf"), args.pdf_pages, seed=args.seed)
+    text = validate_txt_or_pdf("bench.txt", txt_path)
+
+    results = {}
+    try:
+        if "validate_txt" in selected:
+            results["validate_txt"] = measure(
+                "validate_txt_or_pdf[txt]",
+                lambda i: len(validate_txt_or_pdf("bench.txt", txt_path)) / 1e6,
+                args.repeat, unit="MB-chars",
+            )
+
+        if "validate_pdf" in selected:
+            def validate_pdf(i):
+                validate_txt_or_pdf("bench.pdf", pdf_path)
+                return args.pdf_pages
+
+            results["validate_pdf"] = measure(
+                "validate_txt_or_pdf[pdf]", validate_pdf, args.repeat, unit="pages"
+            )
+
+        # A single handle: chunk_text does not touch the collection
+        scratch = VectorDB(collection_name="bench_scratch")
+
+        if "chunk_text" in selected:
+            results["chunk_text"] = measure(
+                "VectorDB.chunk_text",
+                lambda i: len(scratch.chunk_text(text)),
+                args.repeat, unit="chunks",
+            )
+
+        if "add_document" in selected:
+            collection_ids = itertools.count()
+
+            def add_document(i):
+                # A fresh collection each time, so every iteration measures a cold insert
+                vector_db = VectorDB(collection_name=f"bench_add_{next(collection_ids)}")
+                try:
+                    return vector_db.add_document(text, "bench_doc")
+                finally:
+                    vector_db.delete_collection()
+
+            results["add_document"] = measure(
+                "VectorDB.add_document", add_document, args.ingest_repeat, unit="chunks"
+            )
+
+        if {"search", "query"} & selected:
+            assistant = install_fake_llm(RAGAssistant(require_api_key=False))
+            upload = assistant.upload_document(txt_path, filename="bench.txt")
+            if upload.get("status") != "success":
+                raise RuntimeError(f"Could not ingest the benchmark document: {upload.get('error')}")
+            search_db = get_vector_db(upload["collection_name"])
+
+            if "search" in selected:
+                def search(i):
+                    search_db.search(SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)], n_results=3)
+                    return 1
+
+                results["search"] = measure("VectorDB.search", search, args.repeat, unit="queries")
+
+            if "query" in selected:
+                def query(i):
+                    result = assistant.query(
+                        SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)],
+                        session_id=upload["session_id"],
+                    )
+                    if result.get("status") == "error":
+                        raise RuntimeError(result.get("error"))
+                    return 1
+
+                results["query"] = measure("RAGAssistant.query", query, args.repeat, unit="queries")
+    finally:
+        os.chdir(PROJECT_ROOT)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return results
+
+
+def main():
+    args = parse_args()
+    results = run(args)
+
+    report = {
+        "environment": environment(),
+        "parameters": {
+            "txt_kb": args.txt_kb,
+            "pdf_pages": args.pdf_pages,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "ingest_repeat": args.ingest_repeat,
+        },
+        "results": results,
+    }
+    save_json(args.output, report)
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        save_json(args.baseline, report)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    baseline = load_json(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    if baseline.get("parameters") != report["parameters"]:
+        print("Warning: baseline was recorded with different parameters, comparison may be misleading")
+
+    print(f"\nComparison with baseline ({baseline['environment'].get('timestamp')}):")
+    regressions = compare(results, baseline.get("results", {}), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 0 if args.no_fail else 1
+
+    print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
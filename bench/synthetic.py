@@ -0,0 +1,97 @@
+"""
+Deterministic synthetic documents for the benchmarks.
+
+The same seed and size always produce the same bytes, so runs on different
+days (or machines) measure the same input.
+"""
+import random
+from typing import List
+
+# Mixed vocabulary so the text splitter sees realistic word and sentence lengths
+VOCABULARY = (
+    "the system document retrieval embedding vector query answer context model "
+    "latency throughput index chunk page section report analysis result method "
+    "data table figure summary introduction conclusion evaluation performance "
+    "database session storage cache request response provider token batch worker "
+    "a an of to in for on with by from at as is are was were be been has have "
+    "measurement baseline regression percentile distribution configuration value"
+).split()
+
+# Questions whose words appear in the vocabulary, used for search and query benchmarks
+SAMPLE_QUESTIONS = [
+    "What does the report say about retrieval latency?",
+    "Summarize the evaluation results of the model.",
+    "How is the cache configuration described?",
+    "What is the conclusion of the analysis section?",
+    "Which table shows throughput per worker?",
+    "How are tokens counted in each batch?",
+    "What baseline is used for the regression measurement?",
+    "Describe the storage and session database.",
+]
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(VOCABULARY) for _ in range(rng.randint(6, 22))]
+    return " ".join(words).capitalize() + "."
+
+
+def make_paragraphs(char_count: int, seed: int = 0) -> List[str]:
+    """
+    Generate paragraphs totalling about char_count characters
+
+    Args:
+        char_count: Approximate total length
+        seed: Random seed
+
+    Returns:
+        List of paragraphs
+    """
+    rng = random.Random(seed)
+    paragraphs: List[str] = []
+    total = 0
+    while total < char_count:
+        paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 8)))
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return paragraphs
+
+
+def make_txt(path: str, size_kb: int, seed: int = 0) -> str:
+    """
+    Write a UTF-8 TXT file of about size_kb kilobytes
+
+    Returns:
+        The path written
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(make_paragraphs(size_kb * 1024, seed)))
+    return path
+
+
+def make_pdf(path: str, pages: int, chars_per_page: int = 2500, seed: int = 0) -> str:
+    """
+    Write a PDF with selectable text on every page
+
+    Args:
+        path: Output path
+        pages: Number of pages
+        chars_per_page: Approximate text per page
+        seed: Random seed
+
+    Returns:
+        The path written
+    """
+    import fitz  # PyMuPDF, already a dependency of the ingestion path
+
+    doc = fitz.open()
+    try:
+        for page_number in range(pages):
+            text = "\n\n".join(make_paragraphs(chars_per_page, seed * 100003 + page_number))
+            page = doc.new_page()
+            margin = 36
+            rect = fitz.Rect(margin, margin, page.rect.width - margin, page.rect.height - margin)
+            page.insert_textbox(rect, text, fontsize=7)
+        doc.save(path)
+    finally:
+        doc.close()
+    return path
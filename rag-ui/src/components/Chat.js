@@ -8,8 +8,6 @@ const Chat = () => {
     fileProcessed, 
     wasProcessed,
     sessionId,
-    selectedModel,
-    apiKey,
     apiKeyStored
   } = useFileContext();
   
@@ -63,11 +61,9 @@ const Chat = () => {
     setChatError(null);
 
     try {
-      // Save user message to backend
-      await api.sendMessage(sessionId, 'user', userQuestion);
-
-      // Query the document for response
-      const response = await api.queryDocument(sessionId, userQuestion, selectedModel, apiKey);
+      // One request per question: the backend retrieves once, calls the LLM once
+      // and saves both messages. The key makes a retried request replay the answer.
+      const response = await api.chatTurn(sessionId, userQuestion, api.newIdempotencyKey());
       
       // Get the response text from the response
       const responseText = response.text || response.response || response.answer || "";
@@ -86,10 +82,6 @@ const Chat = () => {
             const assistantMessage = { role: 'assistant', content: responseText };
             setMessages(prev => [...prev, assistantMessage]);
             
-            // Save assistant message to backend
-            api.sendMessage(sessionId, 'assistant', responseText)
-              .catch(error => console.error('Failed to save assistant message:', error));
-            
             setStreamingText('');
             setIsStreaming(false);
             setIsLoading(false);
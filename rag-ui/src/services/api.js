@@ -73,17 +73,46 @@ export const checkApiKeyStatus = async () => {
   }
 };
 
-export const sendMessage = async (sessionId, content) => {
+// Unique key per logical request; reuse it when retrying so the server never repeats work
+export const newIdempotencyKey = () =>
+  (window.crypto && window.crypto.randomUUID)
+    ? window.crypto.randomUUID()
+    : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+// Appends a message to the history only (no LLM call)
+export const sendMessage = async (sessionId, role, content, idempotencyKey = newIdempotencyKey()) => {
   return request(`${API_BASE}/messages`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: {
+      "Content-Type": "application/json",
+      "Idempotency-Key": idempotencyKey,
+    },
     body: JSON.stringify({
       session_id: sessionId,
+      role,
       content,
     }),
   });
 };
 
+// One chat turn: a single retrieval + LLM call; the server stores the question and answer
+export const chatTurn = async (sessionId, question, idempotencyKey = newIdempotencyKey()) => {
+  const data = await request(`${API_BASE}/chat`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "Idempotency-Key": idempotencyKey,
+    },
+    body: JSON.stringify({
+      session_id: sessionId,
+      question,
+      n_results: 3,
+    }),
+  });
+
+  return { text: data?.answer || "", sources: data?.sources || [], replayed: !!data?.replayed };
+};
+
 export const getMessages = async (sessionId) => {
   return request(`${API_BASE}/messages/${sessionId}`);
 };
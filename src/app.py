@@ -1,16 +1,10 @@
 import os
+import json
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List, Tuple
 from dotenv import load_dotenv
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-
-from vectordb import VectorDB
-from utils import validate_txt_or_pdf
-from database import RAGDatabase
-from langchain_openai import ChatOpenAI
-from langchain_groq import ChatGroq
-from langchain_google_genai import ChatGoogleGenerativeAI
-
 
 # FIX: Create data directory at project root (one level up from src/)
 # If app.py is in src/, this goes to project root
@@ -18,9 +12,27 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(PROJECT_ROOT, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# Load environment variables
+# Load environment variables (before the local modules below read their settings)
 load_dotenv(dotenv_path=os.path.join(PROJECT_ROOT, ".env"))
 
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+from vectordb import get_vector_db, build_where, CHUNK_HIERARCHY, PARENT_FETCH_FACTOR
+from utils import validate_txt_or_pdf, iter_document_text, compute_file_checksum
+from database import RAGDatabase, COMPLETED, FAILED
+from llm_clients import get_llm_client, resolve_provider
+from llm_router import router
+from coalesce import SingleFlight, normalize_question
+from digests import DOCUMENT_DIGESTS, is_overview_question, retry_delay, summarize, jobs as digest_jobs
+from metrics import stage, annotate
+
+# LLM calls in flight at once for one query_many() batch
+QUERY_MANY_CONCURRENCY = int(os.getenv("QUERY_MANY_CONCURRENCY", "8"))
+
+# Most questions accepted in one query_many() batch
+QUERY_MANY_MAX_QUESTIONS = int(os.getenv("QUERY_MANY_MAX_QUESTIONS", "500"))
+
 def get_data_filepath():
     """
     FIX: Safely get the first file from data directory.
@@ -93,6 +105,9 @@ class RAGAssistant:
             "\n\nContext: {context}\n\nQuestion: {question}"
         )
         
+        # In-flight answers shared by identical concurrent queries
+        self._inflight = SingleFlight()
+        
         print("RAG Assistant initialized successfully (no LLM yet)")
 
     def _initialize_llm(self, require_api_key=True, model=None):
@@ -122,27 +137,19 @@ class RAGAssistant:
             api_key = os.getenv("GOOGLE_API_KEY")
             print(f"Using Google Gemini model: {model_name}")
             print(f"API Key (first 5 chars): {api_key[:5]}...")  
-            return ChatGoogleGenerativeAI(
-                google_api_key=api_key,
-                model=model_name,
-                temperature=0.1,
-            )
+            return get_llm_client("google", model_name, api_key)
         elif groq_key:
             model_name = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
             api_key = os.getenv("GROQ_API_KEY")
             print(f"Using Groq model: {model_name}")
             print(f"API Key (first 5 chars): {api_key[:5]}...") 
-            return ChatGroq(
-                api_key=api_key, model=model_name, temperature=0.1
-            )
+            return get_llm_client("groq", model_name, api_key)
         elif openai_key:
             model_name = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
             api_key = os.getenv("OPENAI_API_KEY")
             print(f"Using OpenAI model: {model_name}")
             print(f"API Key (first 5 chars): {api_key[:5]}...") 
-            return ChatOpenAI(
-                api_key=api_key, model=model_name, temperature=0.1
-            )
+            return get_llm_client("openai", model_name, api_key)
         
         else:
             print("No API keys found in environment variables")
@@ -173,72 +180,49 @@ class RAGAssistant:
         if model:
             self.current_model = model
         
-        # FIXED: Use model to determine the correct LLM initialization
-        if self.current_model:
-            if "gemini" in self.current_model.lower():
-                print(f"Setting Google Gemini API key for model: {self.current_model}")
-                self.llm = ChatGoogleGenerativeAI(
-                    google_api_key=api_key,
-                    model=self.current_model,
-                    temperature=0.1
-                )
-            elif "llama" in self.current_model.lower() or "groq" in self.current_model.lower():
-                print(f"Setting Groq API key for model: {self.current_model}")
-                self.llm = ChatGroq(
-                    api_key=api_key,
-                    model=self.current_model,
-                    temperature=0.1
-                )
-            elif "gpt" in self.current_model.lower():
-                print(f"Setting OpenAI API key for model: {self.current_model}")
-                self.llm = ChatOpenAI(
-                    api_key=api_key,
-                    model=self.current_model,
-                    temperature=0.1
-                )
-            else:
-                # Default to OpenAI
-                print(f"Setting generic API key with model: {self.current_model}")
-                self.llm = ChatOpenAI(
-                    api_key=api_key,
-                    model=self.current_model,
-                    temperature=0.1
-                )
-        else:
-            # FIXED: Fallback - try to determine from key format
-            if api_key.startswith("gsk_"):
-                print("Setting Groq API key")
-                self.llm = ChatGroq(
-                    api_key=api_key,
-                    model="llama-3.1-8b-instant",
-                    temperature=0.1
-                )
-            elif api_key.startswith("AIz"):
-                print("Setting Google API key")
-                self.llm = ChatGoogleGenerativeAI(
-                    google_api_key=api_key,
-                    model="gemini-2.0-flash-exp",
-                    temperature=0.1
-                )
-            else:
-                print("Setting OpenAI API key")
-                self.llm = ChatOpenAI(
-                    api_key=api_key,
-                    model="gpt-4o-mini",
-                    temperature=0.1
-                )
+        # FIXED: Use model (or key format) to determine the provider.
+        # Clients come from a shared registry, so switching models reuses
+        # existing clients and their pooled HTTP connections.
+        provider = resolve_provider(self.current_model, api_key)
+        print(f"Setting {provider} API key for model: {self.current_model or 'default'}")
+        self.llm = get_llm_client(provider, self.current_model, api_key)
         
         # Recreate the chain with the new LLM
         self.chain = self.prompt_template | self.llm | StrOutputParser()
         print("LLM initialized successfully")
+
+    def chain_for(self, config):
+        """
+        Get the RAG chain for an immutable per-request config.
+        
+        Unlike set_api_key() this never mutates the assistant, so one
+        instance can serve many tenants with different providers at once.
+        Chains are not cached: composing one is cheap, and the LLM client
+        comes from the registry, whose LRU bound (LLM_CLIENT_CACHE_SIZE)
+        decides how many clients and API keys stay in memory.
+        
+        Args:
+            config: AssistantConfig with provider, model and api_key
+        
+        Returns:
+            Runnable chain: prompt | llm | parser
+        """
+        llm = get_llm_client(config.provider, config.model, config.api_key)
+        return self.prompt_template | llm | StrOutputParser()
     
 
-    def upload_document(self, filepath: str) -> dict:
+    def upload_document(self, filepath: str, file_hash: str = None, filename: str = None, config=None) -> dict:
         """
         Add documents to the knowledge base. Works for both Streamlit and FastAPI.
 
         Args:
             filepath: path of the uploaded documents
+            file_hash: SHA256 of the raw file, if the caller already computed it
+                       while streaming the upload (computed from disk otherwise)
+            filename: original filename, needed when filepath is a
+                      content-addressed blob without an extension
+            config: Optional AssistantConfig of the uploader; with
+                    DOCUMENT_DIGESTS its LLM summarizes the document in the background
         
         Returns:
             dict: Always returns a dictionary with success/error info
@@ -250,31 +234,71 @@ class RAGAssistant:
             if not os.path.exists(filepath):
                 return {"error": f"File not found: {filepath}", "status": "error"}
             
-            filename = os.path.basename(filepath)
+            filename = filename or os.path.basename(filepath)
             
             # FIX: Validate file type before processing
             if not filename.lower().endswith(('.pdf', '.txt')):
                 return {"error": "Invalid file type. Only PDF and TXT files are supported.", "status": "error"}
             
-            # This will raise exceptions if PDF has issues
+            # This will raise exceptions if the file is too large or can't be opened.
+            # The text itself is streamed into the chunker below, page by page for PDFs.
             try:
-                doc_text = load_document(filename, filepath) 
+                doc_text = iter_document_text(filename, filepath)
             except Exception as load_error:
-                # Catch validation errors from validate_txt_or_pdf
+                # Catch validation errors from utils.py
                 return {"error": str(load_error), "status": "error"}
             
-            doc_in_bytes = doc_text.encode("utf-8")
+            # Hash the raw file in blocks instead of re-encoding the whole text
+            if not file_hash:
+                file_hash = compute_file_checksum(filepath)
             
-            result = db.process_file_upload(doc_in_bytes, filename)
+            with stage("db_write"):
+                result = db.process_file_upload(None, filename, file_hash=file_hash)
             
             document_id = result["document_id"]
             session_id = result["session_id"]
             was_processed = result["was_processed"]
             
             if was_processed:
-                vector_db = VectorDB(collection_name=result["collection_name"])
-                chunk_count = vector_db.add_document(doc_text, document_id)
-                db.update_chunk_count(document_id, chunk_count)
+                vector_db = get_vector_db(result["collection_name"])
+                # An interrupted earlier run left batches behind: only embed the rest
+                completed_batches = db.get_ingestion_checkpoints(document_id) if result.get("resume") else {}
+                try:
+                    chunk_count = vector_db.add_document(
+                        doc_text, document_id,
+                        completed_batches=completed_batches,
+                        on_batch_committed=lambda *batch: db.record_ingestion_checkpoint(document_id, *batch),
+                        replace=bool(result.get("resume")),
+                        on_parents=lambda parents: db.save_document_parents(document_id, parents),
+                        on_sections=lambda sections: db.save_document_sections(document_id, sections),
+                    )
+                except Exception as load_error:
+                    # Extraction or indexing failed mid-stream: keep what is
+                    # committed (batches and checkpoints) so a retry resumes
+                    db.fail_document(document_id, str(load_error))
+                    return {"error": str(load_error), "status": "error"}
+                
+                if hasattr(doc_text, "summary"):
+                    print(f"STEP: Page extraction timings: {doc_text.summary()}")
+                
+                if not chunk_count and db.get_ingestion_checkpoints(document_id):
+                    # Never drop batches an earlier run committed
+                    db.fail_document(document_id, "No chunks were indexed in this run")
+                    return {"error": "No chunks were indexed in this run. Upload the document again to resume.",
+                            "status": "error"}
+                
+                if not chunk_count:
+                    vector_db.delete_collection()
+                    db.delete_document(document_id)
+                    return {
+                        "error": "No text could be indexed from this document. "
+                                 "If it is a PDF, it may be a scanned image without selectable text.",
+                        "status": "error"
+                    }
+                
+                with stage("db_write"):
+                    db.complete_document(document_id, chunk_count)
+                self._schedule_digest(db, document_id, result["collection_name"], config)
 
                 self.current_session_id = session_id
                 self.current_collection_name = result["collection_name"]
@@ -287,9 +311,18 @@ class RAGAssistant:
                     "chunk_count": chunk_count,
                     "status": "success"
                 }
+            elif result.get("status") == "processing":
+                # Another worker is ingesting the same content right now
+                return {
+                    "session_id": session_id,
+                    "document_id": document_id,
+                    "error": "This document is still being processed. Try again shortly.",
+                    "status": "processing"
+                }
             else:
                 doc_info = db.get_document_by_session(session_id)
                 chunk_count = doc_info["chunk_count"] if doc_info else 0
+                self._schedule_digest(db, document_id, result["collection_name"], config)
 
                 self.current_session_id = session_id
                 self.current_collection_name = result["collection_name"]
@@ -311,7 +344,8 @@ class RAGAssistant:
         finally:
             db.close()
 
-    def query(self, question: str, session_id: str = None, n_results: int = 3) -> dict:
+    def query(self, question: str, session_id: str = None, n_results: int = 3, config=None,
+              filters: dict = None) -> dict:
         """
         Query the document (Works with both Streamlit and FastAPI).
 
@@ -320,15 +354,27 @@ class RAGAssistant:
             session_id: Optional session ID (for FastAPI stateless calls)
                         If None, uses self.current_session_id (for Streamlit)
             n_results: Number of relevant chunks to retrieve
+            config: Optional AssistantConfig resolved for this request (FastAPI).
+                    If None, uses the LLM set by set_api_key() (for Streamlit)
+            filters: Optional page_from/page_to, section and chunk_from/chunk_to;
+                     only matching chunks are searched (see vectordb.build_where)
 
         Returns:
             Dict containing the answer from the LLM or error message
+            (status 'invalid_filters' for unusable filters)
         """
+        try:
+            where = build_where(filters)
+        except (TypeError, ValueError) as e:
+            return {"error": f"Invalid filters: {e}", "status": "invalid_filters"}
+
         db = RAGDatabase(self.db_path)
         db.connect()
 
         try:
-            if not self.llm:
+            chain = self.chain_for(config) if config else self.chain
+            
+            if not chain:
                 return {"error": "No API key configured. Please add an api key to use the RAG functionality.","status":"error"}
             
             active_session_id = session_id or self.current_session_id
@@ -338,7 +384,8 @@ class RAGAssistant:
             
             # Save user message
             try:
-                db.add_message(active_session_id, "user", question)
+                with stage("db_write"):
+                    db.add_message(active_session_id, "user", question)
                 print(f"User message saved")
             except Exception as e:
                 print(f"Warning: Could not save user message: {e}")
@@ -348,81 +395,531 @@ class RAGAssistant:
             if not doc_info:
                 return {"error": "Session not found in database.", "status": "error"}
             
+            not_ready = self._not_ready(doc_info)
+            if not_ready:
+                return not_ready
+            
+            # Keep the session from expiring while it is in use
+            with stage("db_write"):
+                db.update_last_active(active_session_id)
+            
             collection_name = doc_info["collection_name"]
 
-            print(f"STEP: Processing query: {question}")
-            print(f"STEP: Using {n_results} results")
+            # Overview questions are answered from the precomputed digest
+            # (a scoped question is about part of the document, not all of it)
+            result = None if where else self._digest_answer(db, doc_info, question, chain, config)
+            if result is None:
+                # Identical concurrent questions on the same document share one
+                # retrieval + LLM call; every caller still records its own history
+                flight_key = (
+                    doc_info["document_id"], self._flight_model(config), normalize_question(question), n_results,
+                    json.dumps(where, sort_keys=True) if where else None,
+                )
+                result, shared = self._inflight.do(
+                    flight_key,
+                    lambda: self._answer(question, collection_name, n_results, chain, config, where)
+                )
+                if shared:
+                    print("STEP: Reused answer of an identical in-flight query")
+                annotate("coalesced", shared)
             
-            # Initialize vector database
-            vector_db = VectorDB(collection_name=collection_name)
+            if result["status"] == "error":
+                return result
 
-            # Retrieve relevant context chunks from vector database
-            print("STEP: Searching vector database...")
-            search_results = vector_db.search(question, n_results=n_results)
-            
-            print(f"STEP: Search results type: {type(search_results)}")
+            # Save assistant message
+            if result["status"] == "success":
+                try:
+                    with stage("db_write"):
+                        db.add_message(active_session_id, "assistant", result["answer"])
+                except Exception as e:
+                    print(f"Warning: Could not save assistant message: {e}")
             
-            # FIX: Better error handling for search results
-            if not search_results:
-                return {"error": "No search results returned", "status": "error"}
+            return {**result, "session_id": active_session_id}
             
-            if not isinstance(search_results, dict):
-                return {"error": "Invalid search results format", "status": "error"}
+        except KeyError as e:
+            return {"error": f"Key error: {e}. Check your vector database.", "status": "error"}
+        except Exception as e:
+            traceback.print_exc()
+            return {"error": f"Exception: {type(e).__name__}: {str(e)}", "status": "error"}
+        finally:
+            db.close()
+
+    def chat_turn(self, question: str, session_id: str, n_results: int = 3, config=None,
+                  idempotency_key: str = None) -> dict:
+        """
+        Answer one chat turn: one retrieval, one generation, and both
+        messages stored together.
+
+        Unlike query(), nothing is written until the answer exists, so a
+        failed turn leaves no orphaned user message. A retry carrying the
+        same idempotency key replays the stored answer without calling the
+        LLM again.
+
+        Args:
+            question: User's question
+            session_id: Session ID
+            n_results: Number of relevant chunks to retrieve
+            config: Optional AssistantConfig resolved for this request
+            idempotency_key: Optional client-chosen key identifying the turn
+
+        Returns:
+            Dict with answer, sources, status, session_id, provider, the two
+            message ids and replayed (True if served from a previous attempt)
+        """
+        db = RAGDatabase(self.db_path)
+        db.connect()
+
+        try:
+            if idempotency_key:
+                previous = db.get_turn(session_id, idempotency_key)
+                if previous:
+                    print("STEP: Replaying stored chat turn")
+                    return self._replayed_turn(previous, session_id)
+
+            chain = self.chain_for(config) if config else self.chain
             
-            documents = search_results.get('documents', [])
+            if not chain:
+                return {"error": "No API key configured. Please add an api key to use the RAG functionality.","status":"error"}
             
-            if not documents:
-                return {
-                    "answer": "I couldn't find any relevant information in the document to answer your question.",
-                    "sources": [],
-                    "status": "no_results",
-                    "session_id": active_session_id
-                }
+            doc_info = db.get_document_by_session(session_id)
+        
+            if not doc_info:
+                return {"error": "Session not found in database.", "status": "error"}
             
-            # Combine retrieved document chunks into a single context string
-            context = "\n\n".join(documents)
+            not_ready = self._not_ready(doc_info)
+            if not_ready:
+                return not_ready
             
-            if not context.strip():
-                return {
-                    "answer": "The retrieved context was empty. Please try rephrasing your question.",
-                    "sources": documents,
-                    "status": "empty_context",
-                    "session_id": active_session_id
-                }
+            # Keep the session from expiring while it is in use
+            with stage("db_write"):
+                db.update_last_active(session_id)
             
-            print(f"STEP: Context length: {len(context)} characters")
-            print(f"STEP: Retrieved {len(documents)} documents")
+            collection_name = doc_info["collection_name"]
+            result = self._digest_answer(db, doc_info, question, chain, config)
+            if result is None:
+                flight_key = (
+                    doc_info["document_id"], self._flight_model(config), normalize_question(question), n_results
+                )
+                result, shared = self._inflight.do(
+                    flight_key,
+                    lambda: self._answer(question, collection_name, n_results, chain, config)
+                )
+                annotate("coalesced", shared)
             
-            print("STEP: Generating response with LLM...")
-            # Use the chain to generate response with context and question
-            response = self.chain.invoke({
-                "context": context,
-                "question": question
-            })
+            if result["status"] == "error":
+                return result
 
-            # Save assistant message
-            try:
-                db.add_message(active_session_id, "assistant", response)
-            except Exception as e:
-                print(f"Warning: Could not save assistant message: {e}")
+            with stage("db_write"):
+                turn = db.add_turn(session_id, question, result["answer"], idempotency_key)
             
-            print(f"STEP: Response generated successfully: {len(response)} characters")
+            if turn is None:
+                # A concurrent attempt with the same key stored its turn first
+                previous = db.get_turn(session_id, idempotency_key) if idempotency_key else None
+                if previous:
+                    return self._replayed_turn(previous, session_id)
+                return {"error": "Could not save the chat turn.", "status": "error"}
             
-            return {
-                "answer": response,
-                "sources": documents,
-                "status": "success",
-                "session_id": active_session_id
-            }
+            return {**result, **turn, "session_id": session_id, "replayed": False}
             
-        except KeyError as e:
-            return {"error": f"Key error: {e}. Check your vector database.", "status": "error"}
         except Exception as e:
             traceback.print_exc()
             return {"error": f"Exception: {type(e).__name__}: {str(e)}", "status": "error"}
         finally:
             db.close()
 
+    def query_many(self, questions: List[str], session_id: str, n_results: int = 3, config=None,
+                   max_concurrency: int = QUERY_MANY_CONCURRENCY) -> Iterator[dict]:
+        """
+        Answer many questions about one document, yielding results as they complete.
+
+        All questions are embedded in one encode() pass and retrieved with
+        one multi-query ChromaDB search; the LLM calls then run with at most
+        max_concurrency in flight. A failing question yields an error item
+        and the rest of the batch carries on. Nothing is written to the chat
+        history, so bulk jobs don't flood the session.
+
+        Args:
+            questions: Questions, answered against the session's document
+            session_id: Session ID
+            n_results: Number of relevant chunks to retrieve per question
+            config: Optional AssistantConfig resolved for this request
+            max_concurrency: Maximum concurrent LLM calls
+
+        Yields:
+            Dicts with index (position in questions), question and the
+            query() result fields, in completion order. If the batch cannot
+            start at all, a single item with index None and status 'error'.
+        """
+        if not questions:
+            yield {"index": None, "status": "error", "error": "No questions provided."}
+            return
+        if len(questions) > QUERY_MANY_MAX_QUESTIONS:
+            yield {"index": None, "status": "error",
+                   "error": f"At most {QUERY_MANY_MAX_QUESTIONS} questions per batch."}
+            return
+
+        chain = self.chain_for(config) if config else self.chain
+        if not chain:
+            yield {"index": None, "status": "error",
+                   "error": "No API key configured. Please add an api key to use the RAG functionality."}
+            return
+
+        db = RAGDatabase(self.db_path)
+        db.connect()
+        digested = {}
+        try:
+            doc_info = db.get_document_by_session(session_id)
+            if doc_info and doc_info["status"] == COMPLETED:
+                # Keep the session from expiring while it is in use
+                with stage("db_write"):
+                    db.update_last_active(session_id)
+                # Overview questions are answered from the precomputed digest
+                for i, question in enumerate(questions):
+                    result = self._digest_answer(db, doc_info, question, chain, config) if question else None
+                    if result:
+                        digested[i] = result
+        finally:
+            db.close()
+
+        if not doc_info:
+            yield {"index": None, "status": "error", "error": "Session not found in database."}
+            return
+        not_ready = self._not_ready(doc_info)
+        if not_ready:
+            yield {"index": None, **not_ready}
+            return
+
+        # Empty questions fail on their own; the rest share one retrieval
+        valid = [i for i, question in enumerate(questions) if question and question.strip()]
+        for i in sorted(set(range(len(questions))) - set(valid)):
+            yield {"index": i, "question": questions[i], "status": "error", "error": "Question cannot be empty"}
+        for i, result in digested.items():
+            yield {"index": i, "question": questions[i], **result}
+        valid = [i for i in valid if i not in digested]
+
+        if not valid:
+            return
+
+        print(f"STEP: Searching vector database for {len(valid)} questions...")
+        vector_db = get_vector_db(doc_info["collection_name"])
+        search_results = vector_db.search([questions[i] for i in valid], n_results=self._search_k(n_results))
+        if isinstance(search_results, dict):
+            # No chunk matched any question
+            search_results = [search_results] * len(valid)
+        if len(search_results) != len(valid):
+            for i in valid:
+                yield {"index": i, "question": questions[i], "status": "error", "error": "Search failed"}
+            return
+        search_results = [self._with_parents(results, n_results) for results in search_results]
+
+        def answer(i: int, results: dict) -> dict:
+            try:
+                result = self._generate(questions[i], results.get("documents", []), chain, config)
+            except Exception as e:
+                result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            return {"index": i, "question": questions[i], **result}
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="query-many") as pool:
+            futures = [pool.submit(answer, i, results) for i, results in zip(valid, search_results)]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                # The client went away: don't start LLM calls nobody will read
+                for future in futures:
+                    future.cancel()
+
+    @staticmethod
+    def _not_ready(doc_info: dict):
+        """Error result for a document whose ingestion has not completed, else None"""
+        status = doc_info.get("status")
+        if status in (None, COMPLETED):
+            return None
+        if status == FAILED:
+            error = (f"Processing this document failed ({doc_info.get('error') or 'unknown error'}). "
+                     "Upload it again to resume.")
+        else:
+            error = "This document is still being processed. Try again shortly."
+        return {"error": error, "status": "not_ready", "document_status": status}
+
+    @staticmethod
+    def _replayed_turn(turn: dict, session_id: str) -> dict:
+        """Response for a chat turn that was already answered (sources are not stored)"""
+        return {
+            "answer": turn["answer"],
+            "sources": [],
+            "status": "success",
+            "session_id": session_id,
+            "user_message_id": turn["user_message_id"],
+            "assistant_message_id": turn["assistant_message_id"],
+            "replayed": True,
+        }
+
+    def _answer(self, question: str, collection_name: str, n_results: int, chain, config=None,
+                where: dict = None) -> dict:
+        """
+        Retrieve context and generate an answer, without touching chat history.
+
+        Args:
+            question: User's question
+            collection_name: ChromaDB collection of the session's document
+            n_results: Number of relevant chunks to retrieve
+            chain: Chain to use when no per-request config is given
+            config: Optional AssistantConfig (enables provider failover)
+            where: Optional ChromaDB metadata filter (vectordb.build_where)
+
+        Returns:
+            Dict with answer, sources, status and provider (or error)
+        """
+        print(f"STEP: Processing query: {question}")
+        print(f"STEP: Using {n_results} results")
+        
+        # Get the (cached) vector database handle
+        vector_db = get_vector_db(collection_name)
+
+        # Retrieve relevant context chunks from vector database
+        print("STEP: Searching vector database...")
+        search_results = vector_db.search(question, n_results=self._search_k(n_results), where=where)
+        
+        print(f"STEP: Search results type: {type(search_results)}")
+        
+        # FIX: Better error handling for search results
+        if not search_results:
+            return {"error": "No search results returned", "status": "error"}
+        
+        if not isinstance(search_results, dict):
+            return {"error": "Invalid search results format", "status": "error"}
+        
+        search_results = self._with_parents(search_results, n_results)
+        return self._generate(question, search_results.get('documents', []), chain, config)
+
+    def _complete(self, inputs: dict, chain, config=None):
+        """
+        Run the RAG prompt once.
+
+        Args:
+            inputs: Prompt variables (context, question)
+            chain: Chain to use when no per-request config is given
+            config: Optional AssistantConfig (enables provider failover)
+
+        Returns:
+            (response text, provider that answered)
+        """
+        if config:
+            # Fail over (and optionally hedge) across the user's configured providers
+            return router.invoke([(c.name, self.chain_for(c)) for c in config.candidates()], inputs)
+        return chain.invoke(inputs), self.current_model
+
+    def _digest_answer(self, db: RAGDatabase, doc_info: dict, question: str, chain, config=None):
+        """
+        Answer an overview question from the document's stored digest.
+
+        A missing digest is scheduled for the background, and the question
+        is answered by retrieval as usual this time.
+
+        Args:
+            db: Open database
+            doc_info: Document of the session (get_document_by_session())
+            question: User's question
+            chain: Chain to use when no per-request config is given
+            config: Optional AssistantConfig resolved for this request
+
+        Returns:
+            Dict with answer, sources (section summaries), status, provider
+            and digest=True, or None if the question is not answered here
+        """
+        if not DOCUMENT_DIGESTS or not is_overview_question(question):
+            return None
+        model_name = self._digest_model(config)
+        stored = db.get_document_digest(doc_info["document_id"], model_name)
+        annotate("digest", stored is not None)
+        if stored is None:
+            self._schedule_digest(db, doc_info["document_id"], doc_info["collection_name"], config, chain)
+            return None
+        print("STEP: Answered overview question from the stored document digest")
+        return {
+            "answer": stored["digest"],
+            "sources": [section["summary"] for section in stored["outline"]],
+            "status": "success",
+            "provider": model_name,
+            "digest": True,
+        }
+
+    def _schedule_digest(self, db: RAGDatabase, document_id: str, collection_name: str,
+                         config=None, chain=None) -> bool:
+        """
+        Queue a background map-reduce summary of a document, once per document and LLM.
+
+        Args:
+            db: Open database
+            document_id: Completed document to summarize
+            collection_name: ChromaDB collection of the document
+            config: Optional AssistantConfig whose LLM writes the digest
+            chain: Chain to use when no config is given (default: self.chain)
+
+        Returns:
+            bool: True if a digest build was queued
+        """
+        if not DOCUMENT_DIGESTS:
+            return False
+        chain = self.chain_for(config) if config else (chain or self.chain)
+        if not chain:
+            return False
+        model_name = self._digest_model(config)
+        if db.get_document_digest(document_id, model_name):
+            return False
+        failure = db.get_digest_failure(document_id, model_name)
+        if failure and time.time() < failure["failed_at"] + retry_delay(failure["failures"]):
+            # A recent build failed: don't pay for another map-reduce yet
+            return False
+        return digest_jobs.submit(
+            (document_id, model_name),
+            lambda: self._build_digest(document_id, collection_name, model_name, chain, config),
+        )
+
+    def _flight_model(self, config=None) -> Tuple:
+        """
+        Who answers a coalesced question: the model, the API key (as a hash)
+        and the fallback chain, so callers with different keys or providers
+        never share an answer
+        """
+        if not config:
+            return (self.current_model,)
+        return (config.name, config.key_hash, tuple(c.name for c in config.fallbacks))
+
+    def _digest_model(self, config=None) -> str:
+        """Key of the LLM that digests are written by and looked up for"""
+        return config.name if config else (self.current_model or "default")
+
+    def _build_digest(self, document_id: str, collection_name: str, model_name: str, chain, config=None):
+        """Summarize a document from its stored chunks and save the digest (runs in the background)"""
+        db = RAGDatabase(self.db_path)
+        db.connect()
+        try:
+            try:
+                chunks = get_vector_db(collection_name).get_document_chunks(document_id)
+                print(f"STEP: Building digest of {document_id[:8]}... from {len(chunks)} chunks with {model_name}")
+                digest = summarize(
+                    chunks,
+                    lambda context, instruction: self._complete(
+                        {"context": context, "question": instruction}, chain, config
+                    )[0],
+                )
+            except Exception as e:
+                failures = db.record_digest_failure(document_id, model_name, f"{type(e).__name__}: {e}")
+                print(f"STEP: Digest of {document_id[:8]}... failed ({failures}x), "
+                      f"retry in {retry_delay(failures):.0f}s at the earliest")
+                raise
+            db.save_document_digest(document_id, model_name, digest["digest"], digest["outline"])
+        finally:
+            db.close()
+
+    @staticmethod
+    def _search_k(n_results: int) -> int:
+        """Chunks to retrieve for n_results context entries (children share parents)"""
+        return n_results * PARENT_FETCH_FACTOR if CHUNK_HIERARCHY else n_results
+
+    def _with_parents(self, search_results: dict, n_results: int) -> dict:
+        """
+        Replace retrieved child chunks with the parent spans they came from.
+
+        Children of the same parent collapse into one entry, ranked by its
+        best child. Chunks of a flat (non-hierarchical) index pass through.
+
+        Args:
+            search_results: One query's result from VectorDB.search()
+            n_results: Number of entries to keep
+
+        Returns:
+            dict: Same shape as search_results, at most n_results entries
+        """
+        metadatas = search_results.get("metadatas") or []
+        keys = [(m.get("source"), m["parent_index"]) for m in metadatas if m and "parent_index" in m]
+        if not keys:
+            return {key: values[:n_results] for key, values in search_results.items()}
+
+        db = RAGDatabase(self.db_path)
+        db.connect()
+        try:
+            with stage("parent_lookup"):
+                parents = db.get_document_parents(keys)
+        finally:
+            db.close()
+
+        expanded = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        seen = set()
+        for i, document in enumerate(search_results.get("documents", [])):
+            metadata = metadatas[i] if i < len(metadatas) else {}
+            key = (metadata.get("source"), metadata.get("parent_index")) if metadata else None
+            chunk_id = search_results["ids"][i]
+            if key in parents:
+                if key in seen:
+                    continue
+                seen.add(key)
+                document = parents[key]
+                chunk_id = f"{key[0]}_parent_{key[1]}"
+            expanded["ids"].append(chunk_id)
+            expanded["documents"].append(document)
+            expanded["metadatas"].append(metadata)
+            expanded["distances"].append(search_results["distances"][i])
+            if len(expanded["documents"]) >= n_results:
+                break
+
+        annotate("parents", {"children": len(keys), "parents": len(seen)})
+        return expanded
+
+    def _generate(self, question: str, documents: List[str], chain, config=None) -> dict:
+        """
+        Answer a question from already retrieved chunks.
+
+        Args:
+            question: User's question
+            documents: Retrieved chunk texts, most relevant first
+            chain: Chain to use when no per-request config is given
+            config: Optional AssistantConfig (enables provider failover)
+
+        Returns:
+            Dict with answer, sources, status and provider
+        """
+        if not documents:
+            return {
+                "answer": "I couldn't find any relevant information in the document to answer your question.",
+                "sources": [],
+                "status": "no_results"
+            }
+        
+        # Combine retrieved document chunks into a single context string
+        with stage("context_build"):
+            context = "\n\n".join(documents)
+        
+        if not context.strip():
+            return {
+                "answer": "The retrieved context was empty. Please try rephrasing your question.",
+                "sources": documents,
+                "status": "empty_context"
+            }
+        
+        print(f"STEP: Context length: {len(context)} characters")
+        print(f"STEP: Retrieved {len(documents)} documents")
+        
+        print("STEP: Generating response with LLM...")
+        # Use the chain to generate response with context and question
+        inputs = {
+            "context": context,
+            "question": question
+        }
+        with stage("llm_call"):
+            response, provider_used = self._complete(inputs, chain, config)
+        
+        print(f"STEP: Response generated successfully: {len(response)} characters")
+        
+        return {
+            "answer": response,
+            "sources": documents,
+            "status": "success",
+            "provider": provider_used
+        }
+
 
 def main():
     """Main function to demonstrate the RAG assistant."""
@@ -0,0 +1,121 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Batch single-query encodes from concurrent requests into one encode() call
+QUERY_BATCHING = os.getenv("QUERY_BATCHING", "true").lower() in ("1", "true", "yes")
+
+# Largest batch handed to the model at once
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+
+# How long the first request of a batch waits for others to join
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", "5"))
+
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batching of query embeddings
+
+    Callers submit one text each and block on a future. A worker thread
+    takes the first pending text, keeps collecting for up to max_wait_ms or
+    until max_batch texts are queued, runs a single encode() over the batch
+    and hands every caller back its own vector. Under light load a request
+    only pays the short wait; under bursty load many requests share one
+    forward pass, which is far cheaper per text on CPU.
+    """
+
+    def __init__(self, model, max_batch: int = QUERY_BATCH_MAX_SIZE,
+                 max_wait_ms: float = QUERY_BATCH_MAX_WAIT_MS):
+        """
+        Args:
+            model: Object with an encode(List[str]) method (e.g. SentenceTransformer)
+            max_batch: Maximum texts per encode() call
+            max_wait_ms: Maximum time to wait for a batch to fill
+        """
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+
+    def _ensure_worker(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def encode(self, text: str, timeout: Optional[float] = None) -> List[float]:
+        """
+        Embed one text, sharing the encode() call with concurrent callers
+
+        Args:
+            text: Text to embed
+            timeout: Seconds to wait for the result (None waits forever)
+
+        Returns:
+            List[float]: The text's embedding
+
+        Raises:
+            Whatever the model's encode() raised for the batch
+        """
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result(timeout=timeout)
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        """Block for the first request, then gather more until the batch is full or the wait expires"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # Still take whatever is already queued, just don't wait for more
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self.model.encode(texts)
+                try:
+                    vectors = embeddings.tolist()
+                except (AttributeError, TypeError):
+                    vectors = [list(vector) for vector in embeddings]
+            except Exception as e:
+                logger.error(f"Batched encode of {len(texts)} queries failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stats(self) -> Dict:
+        """Number of batches run, texts embedded and the mean batch size"""
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,77 @@
+import re
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question for coalescing: case, whitespace and trailing
+    punctuation do not change what is retrieved or answered
+
+    Args:
+        question: The user's question
+
+    Returns:
+        str: Lower-cased question with collapsed whitespace and no trailing ?!.
+    """
+    return _WHITESPACE.sub(" ", question).strip().lower().rstrip("?!. ")
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution
+
+    The first caller (the leader) runs the function; callers arriving with
+    the same key while it is running wait for and share its result (or its
+    exception). Nothing is cached: once the call finishes, the next caller
+    with that key starts a fresh execution.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn, or join an in-flight call with the same key
+
+        Args:
+            key: Identifies equivalent calls
+            fn: Zero-argument function to run
+
+        Returns:
+            tuple: (result, shared) where shared is True if another caller ran fn
+
+        Raises:
+            Whatever fn raised, in the leader and in every waiting caller
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+        return future.result(), False
+
+    def in_flight(self) -> int:
+        """Number of keys currently being executed"""
+        with self._lock:
+            return len(self._calls)
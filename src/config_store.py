@@ -0,0 +1,175 @@
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from database import RAGDatabase
+from llm_clients import DEFAULT_MODELS, hash_api_key, resolve_provider
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_ID = "default_user"
+
+# How long a worker trusts its cached copy of a user's settings.
+# Saves made through this worker are visible immediately; saves made
+# through other workers become visible after at most this long.
+CONFIG_CACHE_TTL_SECONDS = float(os.getenv("CONFIG_CACHE_TTL_SECONDS", "30"))
+
+# Also use provider keys from the environment (.env) as failover targets
+LLM_FAILOVER_ENV_KEYS = os.getenv("LLM_FAILOVER_ENV_KEYS", "false").lower() in ("1", "true", "yes")
+
+# Environment variables of each provider: (key variable, model variable)
+ENV_PROVIDER_KEYS = {
+    "google": ("GOOGLE_API_KEY", "GOOGLE_MODEL"),
+    "groq": ("GROQ_API_KEY", "GROQ_MODEL"),
+    "openai": ("OPENAI_API_KEY", "OPENAI_MODEL"),
+}
+
+
+@dataclass(frozen=True)
+class AssistantConfig:
+    """
+    Immutable LLM settings of one tenant
+
+    A request resolves its config once and keeps using that object, so a
+    concurrent /api-key call (which stores a new object) never changes a
+    query that is already in flight.
+    """
+    user_id: str
+    provider: str
+    model: str
+    api_key: str = field(repr=False)
+    # Other configured providers, tried in order on failure or when hedging
+    fallbacks: Tuple["AssistantConfig", ...] = ()
+
+    @property
+    def key_hash(self) -> str:
+        return hash_api_key(self.api_key)
+
+    @property
+    def name(self) -> str:
+        """Label used for routing stats, e.g. 'groq:llama-3.1-8b-instant'"""
+        return f"{self.provider}:{self.model}"
+
+    def candidates(self) -> Tuple["AssistantConfig", ...]:
+        """This config followed by its fallbacks"""
+        return (self,) + self.fallbacks
+
+
+class ConfigStore:
+    """
+    Read-through cache of the api_keys table, keyed by user_id
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float = CONFIG_CACHE_TTL_SECONDS):
+        """
+        Args:
+            db_path: Path to the SQLite database file
+            ttl_seconds: How long cached entries are trusted
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._cache: Dict[str, Tuple[Optional[AssistantConfig], float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str = DEFAULT_USER_ID) -> Optional[AssistantConfig]:
+        """
+        Get a user's config
+
+        Args:
+            user_id: Tenant identifier
+
+        Returns:
+            AssistantConfig, or None if the user has not stored an API key
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(user_id)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+        db = RAGDatabase(self.db_path)
+        db.connect()
+        try:
+            config = self._build_config(user_id, db.get_api_keys(user_id))
+        finally:
+            db.close()
+
+        with self._lock:
+            self._cache[user_id] = (config, now + self.ttl_seconds)
+        return config
+
+    def save(self, api_key: str, model: str, user_id: str = DEFAULT_USER_ID) -> AssistantConfig:
+        """
+        Store a user's API key and model and publish the new config
+
+        Args:
+            api_key: The API key to use
+            model: The model to use
+            user_id: Tenant identifier
+
+        Returns:
+            The new AssistantConfig
+        """
+        provider = resolve_provider(model)
+
+        db = RAGDatabase(self.db_path)
+        db.connect()
+        try:
+            db.save_api_key(api_key, model, provider, user_id=user_id)
+            config = self._build_config(user_id, db.get_api_keys(user_id))
+        finally:
+            db.close()
+
+        with self._lock:
+            self._cache[user_id] = (config, time.monotonic() + self.ttl_seconds)
+
+        logger.info(f"Saved {provider} config for user {user_id} (model {model})")
+        return config
+
+    def _build_config(self, user_id: str, keys: List[Dict]) -> Optional[AssistantConfig]:
+        """
+        Turn a user's stored keys (most recent first) into a config whose
+        fallbacks are the user's other providers, then optionally .env keys
+        """
+        if LLM_FAILOVER_ENV_KEYS:
+            stored = {key["provider"] for key in keys}
+            for provider, (key_var, model_var) in ENV_PROVIDER_KEYS.items():
+                if provider not in stored and os.getenv(key_var):
+                    keys = keys + [{
+                        "provider": provider,
+                        "model": os.getenv(model_var, DEFAULT_MODELS[provider]),
+                        "api_key": os.getenv(key_var),
+                    }]
+
+        if not keys:
+            return None
+
+        configs = [
+            AssistantConfig(
+                user_id=user_id,
+                provider=key["provider"],
+                model=key["model"],
+                api_key=key["api_key"],
+            )
+            for key in keys
+        ]
+        primary = configs[0]
+        return AssistantConfig(
+            user_id=user_id,
+            provider=primary.provider,
+            model=primary.model,
+            api_key=primary.api_key,
+            fallbacks=tuple(configs[1:]),
+        )
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Drop one user's cached config, or every cached config"""
+        with self._lock:
+            if user_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(user_id, None)
@@ -1,13 +1,25 @@
+import os
+import json
 import sqlite3
 import uuid 
 import hashlib
+import time
 import logging
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 # FIX: Use proper logging instead of print statements
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# An ingestion whose last checkpoint is older than this is assumed dead and may be taken over
+INGEST_STALE_SECONDS = int(os.getenv("INGEST_STALE_SECONDS", "600"))
+
+# Ingestion states of a document (documents.processing_status)
+PENDING = "pending"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+
 
 class RAGDatabase:
     """Handles all database operations for the RAG Engine"""
@@ -59,8 +71,11 @@ class RAGDatabase:
         - documents: Stores unique document metadata
         - session_documents: Many-to-many relationship between sessions and documents
         - messages: Stores chat history for each session
+        - file_aliases: Original filenames uploaded for each stored file hash
+        - ingestion_checkpoints: Embedding batches already committed to ChromaDB
         
-        Also creates indexes on foreign keys for query performance
+        Also creates indexes on foreign keys for query performance and adds
+        columns introduced after a database was first created
         
         Uses IF NOT EXISTS so it's safe to call multiple times
         """
@@ -124,12 +139,110 @@ class RAGDatabase:
             )
             """)
             
+            # Table 6: File aliases (many filenames -> one content-addressed blob)
+            self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS file_aliases(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_hash TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+                UNIQUE(file_hash, filename)
+            )
+            """)
+            
+            # Table 7: Ingestion checkpoints (one row per committed embedding batch)
+            self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ingestion_checkpoints(
+                document_id TEXT NOT NULL,
+                batch_index INTEGER NOT NULL,
+                first_chunk INTEGER NOT NULL,
+                chunk_count INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                committed_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+                PRIMARY KEY (document_id, batch_index),
+                FOREIGN KEY (document_id) REFERENCES documents(document_id) ON DELETE CASCADE
+            )
+            """)
+            
+            # Table 8: Parent spans of hierarchical chunks (children in ChromaDB
+            # carry parent_index; each span is stored once, keyed for direct lookup)
+            self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS document_parents(
+                document_id TEXT NOT NULL,
+                parent_index INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (document_id, parent_index),
+                FOREIGN KEY (document_id) REFERENCES documents(document_id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+            """)
+            
+            # Table 9: Document digests (map-reduce summary per document and LLM)
+            self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS document_digests(
+                document_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                outline TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+                PRIMARY KEY (document_id, model),
+                FOREIGN KEY (document_id) REFERENCES documents(document_id) ON DELETE CASCADE
+            )
+            """)
+            
+            # Table 10: Sections detected at ingestion (where each starts or
+            # continues in an embedding batch; the first row of a name is its start)
+            self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS document_sections(
+                document_id TEXT NOT NULL,
+                first_chunk INTEGER NOT NULL,
+                section TEXT NOT NULL,
+                page_start INTEGER,
+                PRIMARY KEY (document_id, first_chunk),
+                FOREIGN KEY (document_id) REFERENCES documents(document_id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+            """)
+            
+            # Table 11: Failed digest builds, so they are retried with backoff
+            # (failed_at is a Unix timestamp)
+            self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS digest_failures(
+                document_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                failures INTEGER NOT NULL,
+                failed_at REAL NOT NULL,
+                error TEXT,
+                PRIMARY KEY (document_id, model),
+                FOREIGN KEY (document_id) REFERENCES documents(document_id) ON DELETE CASCADE
+            )
+            """)
+            
+            # Migrations: columns added to existing tables
+            self._ensure_column("messages", "idempotency_key", "TEXT")
+            # Pinned documents (e.g. bulk-ingested corpora) survive garbage collection
+            self._ensure_column("documents", "pinned", "INTEGER DEFAULT 0")
+            # Heartbeat of the ingestion state machine, and why it last failed
+            self._ensure_column("documents", "status_updated_at", "TIMESTAMP")
+            self._ensure_column("documents", "processing_error", "TEXT")
+            
+            # Placeholder rows of older versions (chunk_count never set) were
+            # never finished: mark them failed so the next upload resumes them
+            self.cursor.execute("""
+            UPDATE documents SET processing_status = ?
+            WHERE chunk_count IS NULL AND COALESCE(processing_status, ?) = ?
+            """, (FAILED, COMPLETED, COMPLETED))
+            
             # Creates indexes for faster queries
             self.cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_messages_session
             ON messages(session_id)
             """)
 
+            # A retried append or chat turn finds the row it already wrote
+            self.cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_idempotency
+            ON messages(session_id, idempotency_key)
+            """)
+
             self.cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_files_session 
             ON session_documents(session_id)
@@ -140,6 +253,16 @@ class RAGDatabase:
             ON session_documents(document_id)
             """)
 
+            self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_active
+            ON sessions(last_active)
+            """)
+
+            self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_file_aliases_hash
+            ON file_aliases(file_hash)
+            """)
+
             # Commit all table creations
             self.conn.commit()
             logger.info("Database tables created/verified successfully")
@@ -148,6 +271,21 @@ class RAGDatabase:
             logger.error(f"Error creating tables: {e}")
             raise
 
+    def _ensure_column(self, table: str, column: str, definition: str):
+        """
+        Add a column to an existing table if it is missing (databases created
+        by older versions)
+        
+        Args:
+            table: Table name
+            column: Column name
+            definition: Column type and constraints, e.g. 'TEXT'
+        """
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        if column not in {row[1] for row in self.cursor.fetchall()}:
+            self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logger.info(f"Migrated {table}: added column {column}")
+
     def close(self):
         """Closes the database connection"""
         if self.conn:
@@ -194,15 +332,33 @@ class RAGDatabase:
             str: UUID5 hex string (deterministic based on content)
         """
         checksum = self.compute_checksum(file_byte)
+        return self.document_id_from_checksum(checksum)
+
+    def document_id_from_checksum(self, checksum: str) -> str:
+        """
+        Generate deterministic document ID from an already computed checksum
+        
+        Args:
+            checksum: SHA256 hex digest of the file content
+            
+        Returns:
+            str: UUID5 hex string (same value generate_document_id would return)
+        """
         doc_id = uuid.uuid5(uuid.NAMESPACE_URL, checksum).hex
         return doc_id
 
     def save_api_key(self, api_key: str, model: str, provider: str, user_id: str = "default_user"):
-        """Save or update API key in database"""
-    # Check if key exists for this user
+        """
+        Save or update API key in database
+        
+        One key is kept per (user, provider). The most recently saved one is
+        the user's primary model; keys for other providers stay available as
+        failover targets.
+        """
+    # Check if key exists for this user and provider
         self.cursor.execute(
-            "SELECT id FROM api_keys WHERE user_id = ?", 
-            (user_id,)
+            "SELECT id FROM api_keys WHERE user_id = ? AND provider = ?", 
+            (user_id, provider)
         )
         existing = self.cursor.fetchone()
         
@@ -210,37 +366,47 @@ class RAGDatabase:
             # Update existing
             self.cursor.execute("""
                 UPDATE api_keys 
-                SET api_key_encrypted = ?, model = ?, provider = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE user_id = ?
-            """, (api_key, model, provider, user_id))
+                SET api_key_encrypted = ?, model = ?,
+                    updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+                WHERE id = ?
+            """, (api_key, model, existing[0]))
         else:
             # Insert new
             self.cursor.execute("""
-                INSERT INTO api_keys (user_id, api_key_encrypted, model, provider)
-                VALUES (?, ?, ?, ?)
+                INSERT INTO api_keys (user_id, api_key_encrypted, model, provider, updated_at)
+                VALUES (?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'))
             """, (user_id, api_key, model, provider))
         
         self.conn.commit()
         return True
 
     def get_api_key(self, user_id: str = "default_user"):
-        """Retrieve API key and model from database"""
+        """Retrieve the primary (most recently saved) API key and model from database"""
+        keys = self.get_api_keys(user_id)
+        return keys[0] if keys else None
+
+    def get_api_keys(self, user_id: str = "default_user") -> List[Dict]:
+        """
+        Retrieve every stored API key of a user, most recently saved first
+        
+        Returns:
+            List of dicts with api_key, model and provider
+        """
         self.cursor.execute("""
             SELECT api_key_encrypted, model, provider 
             FROM api_keys 
             WHERE user_id = ? 
-            ORDER BY updated_at DESC 
-            LIMIT 1
+            ORDER BY updated_at DESC, id DESC
         """, (user_id,))
         
-        result = self.cursor.fetchone()
-        if result:
-            return {
-                "api_key": result[0],
-                "model": result[1],
-                "provider": result[2]
+        return [
+            {
+                "api_key": row[0],
+                "model": row[1],
+                "provider": row[2]
             }
-        return None
+            for row in self.cursor.fetchall()
+        ]
 
     def has_api_key(self, user_id: str = "default_user"):
         """Check if user has stored API key"""
@@ -348,24 +514,88 @@ class RAGDatabase:
                 logger.warning(f"Session {session_id[:8]}... not found for update")
         except sqlite3.Error as e:
             logger.error(f"Error updating last_active: {e}")
+
+    def expire_sessions(self, ttl_seconds: int) -> Dict:
+        """
+        Delete sessions that have been idle for longer than ttl_seconds
+        
+        Messages and session_documents links go with them (ON DELETE CASCADE).
+        Documents are left in place; collect_garbage() removes the ones no
+        session references anymore.
+        
+        Args:
+            ttl_seconds: Maximum idle time since last_active
+        
+        Returns:
+            dict: {
+                'sessions_expired': int,
+                'messages_deleted': int,
+                'collection_names': List[str]  # collections the expired sessions used
+            }
+        """
+        try:
+            # Fix the cutoff once so every statement below sees the same set of sessions
+            self.cursor.execute("SELECT datetime('now', 'localtime', ?)", (f"-{int(ttl_seconds)} seconds",))
+            cutoff = self.cursor.fetchone()[0]
+            expired = "SELECT session_id FROM sessions WHERE last_active < ?"
+
+            self.cursor.execute(f"SELECT COUNT(*) FROM ({expired})", (cutoff,))
+            sessions_expired = self.cursor.fetchone()[0]
+
+            if not sessions_expired:
+                return {'sessions_expired': 0, 'messages_deleted': 0, 'collection_names': []}
+
+            self.cursor.execute(f"""
+                SELECT COUNT(*) FROM messages WHERE session_id IN ({expired})
+                """, (cutoff,))
+            messages_deleted = self.cursor.fetchone()[0]
+
+            self.cursor.execute(f"""
+                SELECT DISTINCT d.chromadb_collection_name
+                FROM documents d
+                JOIN session_documents sd ON d.document_id = sd.document_id
+                WHERE sd.session_id IN ({expired})
+                """, (cutoff,))
+            collection_names = [row[0] for row in self.cursor.fetchall() if row[0]]
+
+            self.cursor.execute("DELETE FROM sessions WHERE last_active < ?", (cutoff,))
+            self.conn.commit()
+
+            logger.info(f"Expired {sessions_expired} idle sessions ({messages_deleted} messages)")
+
+            return {
+                'sessions_expired': sessions_expired,
+                'messages_deleted': messages_deleted,
+                'collection_names': collection_names
+            }
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error expiring sessions: {e}")
+            raise
          
 # ================================================================================
 # Document Operations
 
-    def process_file_upload(self, file_bytes: bytes, filename: str) -> Dict:
+    def process_file_upload(self, file_bytes: Optional[bytes], filename: str,
+                            file_hash: Optional[str] = None) -> Dict:
         """
         Process uploaded file with intelligent deduplication
         
         Args:
-            file_bytes: File content as bytes
+            file_bytes: File content as bytes (may be None when file_hash is given)
             filename: Original filename
+            file_hash: Precomputed SHA256 of the file content, e.g. hashed
+                       incrementally while streaming the upload to disk
         
         Returns:
             dict: {
                 'session_id': str,
                 'document_id': str,
                 'collection_name': str,
-                'was_processed': bool  # True if new, False if reused
+                'was_processed': bool,  # True if the caller must (re)ingest it now
+                'resume': bool,         # True if an unfinished ingestion is picked up
+                'status': str           # 'completed', or 'processing' (by the caller
+                                        # if was_processed, else by another worker)
             }
         """
         try:
@@ -374,12 +604,21 @@ class RAGDatabase:
             self.create_session(session_id)
 
             # Generate document_id and file hash for the content
-            document_id = self.generate_document_id(file_bytes)
-            file_hash = self.compute_checksum(file_bytes)
+            if file_hash is None:
+                if file_bytes is None:
+                    raise ValueError("Either file_bytes or file_hash is required")
+                file_hash = self.compute_checksum(file_bytes)
+            document_id = self.document_id_from_checksum(file_hash)
+
+            # Remember the name this content was uploaded under
+            self.cursor.execute("""
+            INSERT OR IGNORE INTO file_aliases(file_hash, filename)
+            VALUES(?, ?)
+            """, (file_hash, filename))
 
             # Check if the same document already exists or not
             self.cursor.execute("""
-            SELECT document_id, chromadb_collection_name, chunk_count
+            SELECT document_id, chromadb_collection_name, chunk_count, processing_status
             FROM documents
             WHERE document_id = ?
             """, (document_id,))
@@ -387,9 +626,6 @@ class RAGDatabase:
             existing_doc = self.cursor.fetchone()
 
             if existing_doc:
-                # Document exists, can reuse those chunks
-                logger.info(f"Document already exists (ID: {document_id[:8]}...)")
-
                 collection_name = existing_doc['chromadb_collection_name']
 
                 # Link this session to the existing document
@@ -398,13 +634,31 @@ class RAGDatabase:
                     VALUES(?, ?)
                 """, (session_id, document_id))
 
-                self.conn.commit()
+                if existing_doc['processing_status'] == COMPLETED:
+                    # Document exists, can reuse those chunks
+                    logger.info(f"Document already exists (ID: {document_id[:8]}...)")
+                    self.conn.commit()
+                    return {
+                        'session_id': session_id,
+                        'document_id': document_id,
+                        'collection_name': collection_name,
+                        'was_processed': False,
+                        'status': COMPLETED
+                    }
 
+                # Unfinished: resume it, unless another worker is still on it
+                previous_status = existing_doc['processing_status']
+                claimed = self._claim_document(document_id)
+                self.conn.commit()
+                if claimed:
+                    logger.info(f"Resuming {previous_status} ingestion (ID: {document_id[:8]}...)")
                 return {
                     'session_id': session_id,
                     'document_id': document_id,
                     'collection_name': collection_name,
-                    'was_processed': False
+                    'was_processed': claimed,
+                    'resume': claimed,
+                    'status': PROCESSING
                 }
             
             else:
@@ -413,14 +667,12 @@ class RAGDatabase:
 
                 collection_name = f"doc_{document_id[:16]}"
 
-                chunk_count = None
-                # This is a placeholder (None), will be updated after actual chunking
-
-                # Insert into documents table
+                # chunk_count stays NULL until the ingestion completes
                 self.cursor.execute("""
-                INSERT INTO documents(document_id, filename, file_hash, chunk_count, chromadb_collection_name)
-                VALUES(?, ?, ?, ?, ?)
-                """, (document_id, filename, file_hash, chunk_count, collection_name))
+                INSERT INTO documents(document_id, filename, file_hash, chunk_count,
+                                      chromadb_collection_name, processing_status)
+                VALUES(?, ?, ?, NULL, ?, ?)
+                """, (document_id, filename, file_hash, collection_name, PENDING))
 
                 # Link to session
                 self.cursor.execute("""
@@ -428,13 +680,16 @@ class RAGDatabase:
                 VALUES(?, ?)
                 """, (session_id, document_id))
 
+                self._claim_document(document_id)
                 self.conn.commit()
 
                 return {
                     'session_id': session_id,
                     'document_id': document_id,
                     'collection_name': collection_name,
-                    'was_processed': True
+                    'was_processed': True,
+                    'resume': False,
+                    'status': PROCESSING
                 }
         
         except sqlite3.Error as e:
@@ -444,6 +699,337 @@ class RAGDatabase:
             logger.error(f"Unexpected error in process_file_upload: {e}")
             raise
 
+    def _claim_document(self, document_id: str, stale_seconds: Optional[int] = None) -> bool:
+        """
+        Move a document into 'processing' if nobody is ingesting it (no commit)
+        
+        Pending and failed documents can always be claimed; a 'processing'
+        one only once its heartbeat is older than stale_seconds.
+        
+        Returns:
+            bool: True if the caller now owns the ingestion
+        """
+        if stale_seconds is None:
+            stale_seconds = INGEST_STALE_SECONDS
+        self.cursor.execute("""
+            UPDATE documents
+            SET processing_status = ?, status_updated_at = datetime('now', 'localtime'),
+                processing_error = NULL
+            WHERE document_id = ?
+            AND (processing_status IN (?, ?)
+                 OR (processing_status = ?
+                     AND COALESCE(status_updated_at, '') < datetime('now', 'localtime', ?)))
+            """, (PROCESSING, document_id, PENDING, FAILED, PROCESSING, f"-{int(stale_seconds)} seconds"))
+        return self.cursor.rowcount == 1
+
+    def get_ingestion_checkpoints(self, document_id: str) -> Dict[int, Dict]:
+        """
+        Get the embedding batches of a document already committed to ChromaDB
+        
+        Args:
+            document_id: Document identifier
+        
+        Returns:
+            dict: batch_index -> {'first_chunk', 'chunk_count', 'digest'}
+        """
+        try:
+            self.cursor.execute("""
+                SELECT batch_index, first_chunk, chunk_count, digest
+                FROM ingestion_checkpoints
+                WHERE document_id = ?
+                """, (document_id,))
+            return {
+                row['batch_index']: {
+                    'first_chunk': row['first_chunk'],
+                    'chunk_count': row['chunk_count'],
+                    'digest': row['digest']
+                }
+                for row in self.cursor.fetchall()
+            }
+        except sqlite3.Error as e:
+            logger.error(f"Error getting ingestion checkpoints: {e}")
+            return {}
+
+    def record_ingestion_checkpoint(self, document_id: str, batch_index: int, first_chunk: int,
+                                    chunk_count: int, digest: str) -> None:
+        """
+        Record that a batch is in ChromaDB and refresh the ingestion heartbeat
+        
+        Args:
+            document_id: Document identifier
+            batch_index: Position of the batch in the document
+            first_chunk: Index of the batch's first chunk
+            chunk_count: Chunks stored for the batch
+            digest: Fingerprint of the batch's input chunks
+        """
+        try:
+            with self.conn:
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO ingestion_checkpoints(
+                        document_id, batch_index, first_chunk, chunk_count, digest)
+                    VALUES(?, ?, ?, ?, ?)
+                    """, (document_id, batch_index, first_chunk, chunk_count, digest))
+                self.conn.execute("""
+                    UPDATE documents SET status_updated_at = datetime('now', 'localtime')
+                    WHERE document_id = ?
+                    """, (document_id,))
+        except sqlite3.Error as e:
+            # Losing a checkpoint only costs re-embedding that batch on resume
+            logger.error(f"Error recording ingestion checkpoint: {e}")
+
+    def save_document_parents(self, document_id: str, parents: Dict[int, str]) -> None:
+        """
+        Store the parent spans of a document's hierarchical chunks
+        
+        Args:
+            document_id: Document identifier
+            parents: parent_index -> span text
+        
+        Raises:
+            sqlite3.Error: If the spans could not be stored (children
+                           written without them could not be resolved)
+        """
+        try:
+            with self.conn:
+                self.conn.executemany("""
+                    INSERT OR REPLACE INTO document_parents(document_id, parent_index, content)
+                    VALUES(?, ?, ?)
+                    """, [(document_id, index, content) for index, content in parents.items()])
+        except sqlite3.Error as e:
+            logger.error(f"Error saving document parents: {e}")
+            raise
+
+    def get_document_parents(self, keys: List[Tuple[str, int]]) -> Dict[Tuple[str, int], str]:
+        """
+        Look up parent spans by (document_id, parent_index)
+        
+        Args:
+            keys: (document_id, parent_index) pairs
+        
+        Returns:
+            dict: (document_id, parent_index) -> span text, for the pairs found
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        try:
+            placeholders = ", ".join("(?, ?)" for _ in keys)
+            self.cursor.execute(f"""
+                SELECT document_id, parent_index, content
+                FROM document_parents
+                WHERE (document_id, parent_index) IN (VALUES {placeholders})
+                """, [value for key in keys for value in key])
+            return {
+                (row['document_id'], row['parent_index']): row['content']
+                for row in self.cursor.fetchall()
+            }
+        except sqlite3.Error as e:
+            logger.error(f"Error getting document parents: {e}")
+            return {}
+
+    def save_document_sections(self, document_id: str, sections: List[Dict]) -> None:
+        """
+        Store where sections start in a document's chunks
+        
+        Args:
+            document_id: Document identifier
+            sections: section, first_chunk and page_start (None for TXT) per entry
+        
+        Raises:
+            sqlite3.Error: If the sections could not be stored
+        """
+        try:
+            with self.conn:
+                self.conn.executemany("""
+                    INSERT OR REPLACE INTO document_sections(document_id, first_chunk, section, page_start)
+                    VALUES(?, ?, ?, ?)
+                    """, [(document_id, s['first_chunk'], s['section'], s.get('page_start')) for s in sections])
+        except sqlite3.Error as e:
+            logger.error(f"Error saving document sections: {e}")
+            raise
+
+    def get_document_sections(self, document_id: str) -> List[Dict]:
+        """
+        Get the sections detected in a document, in document order
+        
+        Args:
+            document_id: Document identifier
+        
+        Returns:
+            list: section, first_chunk and page_start (PDFs only) per distinct section
+        """
+        try:
+            self.cursor.execute("""
+                SELECT section, first_chunk, page_start
+                FROM document_sections
+                WHERE document_id = ?
+                ORDER BY first_chunk
+                """, (document_id,))
+            sections: Dict[str, Dict] = {}
+            for row in self.cursor.fetchall():
+                if row['section'] not in sections:
+                    entry = {'section': row['section'], 'first_chunk': row['first_chunk']}
+                    if row['page_start'] is not None:
+                        entry['page_start'] = row['page_start']
+                    sections[row['section']] = entry
+            return list(sections.values())
+        except sqlite3.Error as e:
+            logger.error(f"Error getting document sections: {e}")
+            return []
+
+    def save_document_digest(self, document_id: str, model: str, digest: str, outline: List[Dict]) -> None:
+        """
+        Store the summary of a document written by one LLM
+        
+        Args:
+            document_id: Document identifier
+            model: LLM that wrote the digest, e.g. 'groq:llama-3.1-8b-instant'
+            digest: Overview of the whole document
+            outline: Section summaries in document order
+        """
+        try:
+            with self.conn:
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO document_digests(document_id, model, digest, outline)
+                    VALUES(?, ?, ?, ?)
+                    """, (document_id, model, digest, json.dumps(outline)))
+                self.conn.execute(
+                    "DELETE FROM digest_failures WHERE document_id = ? AND model = ?",
+                    (document_id, model)
+                )
+            logger.info(f"Saved digest of document {document_id[:8]}... ({model})")
+        except sqlite3.Error as e:
+            logger.error(f"Error saving document digest: {e}")
+            raise
+
+    def get_document_digest(self, document_id: str, model: str) -> Optional[Dict]:
+        """
+        Get the summary of a document written by one LLM
+        
+        Args:
+            document_id: Document identifier
+            model: LLM that wrote the digest
+        
+        Returns:
+            Dictionary with digest, outline and created_at, or None if not built yet
+        """
+        try:
+            self.cursor.execute("""
+                SELECT digest, outline, created_at
+                FROM document_digests
+                WHERE document_id = ? AND model = ?
+                """, (document_id, model))
+            row = self.cursor.fetchone()
+            if not row:
+                return None
+            return {
+                'digest': row['digest'],
+                'outline': json.loads(row['outline']),
+                'created_at': row['created_at']
+            }
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Error getting document digest: {e}")
+            return None
+
+    def record_digest_failure(self, document_id: str, model: str, error: str) -> int:
+        """
+        Count a failed digest build of a document by one LLM
+        
+        Args:
+            document_id: Document identifier
+            model: LLM that tried to write the digest
+            error: Why the build failed
+        
+        Returns:
+            int: Consecutive failures so far (0 if it could not be recorded)
+        """
+        try:
+            with self.conn:
+                self.conn.execute("""
+                    INSERT INTO digest_failures(document_id, model, failures, failed_at, error)
+                    VALUES(?, ?, 1, ?, ?)
+                    ON CONFLICT(document_id, model) DO UPDATE SET
+                        failures = failures + 1, failed_at = excluded.failed_at, error = excluded.error
+                    """, (document_id, model, time.time(), error))
+                row = self.conn.execute(
+                    "SELECT failures FROM digest_failures WHERE document_id = ? AND model = ?",
+                    (document_id, model)
+                ).fetchone()
+            return row[0] if row else 0
+        except sqlite3.Error as e:
+            logger.error(f"Error recording digest failure: {e}")
+            return 0
+
+    def get_digest_failure(self, document_id: str, model: str) -> Optional[Dict]:
+        """
+        Get the failed digest builds of a document by one LLM
+        
+        Args:
+            document_id: Document identifier
+            model: LLM that tried to write the digest
+        
+        Returns:
+            Dictionary with failures, failed_at (Unix time) and error, or None
+        """
+        try:
+            self.cursor.execute("""
+                SELECT failures, failed_at, error
+                FROM digest_failures
+                WHERE document_id = ? AND model = ?
+                """, (document_id, model))
+            row = self.cursor.fetchone()
+            return dict(row) if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Error getting digest failure: {e}")
+            return None
+
+    def complete_document(self, document_id: str, chunk_count: int) -> None:
+        """
+        Mark a document's ingestion as completed and drop its checkpoints
+        
+        Args:
+            document_id: Document identifier
+            chunk_count: Number of chunks indexed
+        """
+        try:
+            with self.conn:
+                self.conn.execute("""
+                    UPDATE documents
+                    SET chunk_count = ?, processing_status = ?,
+                        status_updated_at = datetime('now', 'localtime'), processing_error = NULL
+                    WHERE document_id = ?
+                    """, (chunk_count, COMPLETED, document_id))
+                self.conn.execute("""
+                    DELETE FROM ingestion_checkpoints WHERE document_id = ?
+                    """, (document_id,))
+                # A resumed run may end earlier than the one it replaced
+                self.conn.execute("""
+                    DELETE FROM document_sections WHERE document_id = ? AND first_chunk >= ?
+                    """, (document_id, chunk_count))
+            logger.info(f"Ingestion of document {document_id[:8]}... completed ({chunk_count} chunks)")
+        except sqlite3.Error as e:
+            logger.error(f"Error completing document: {e}")
+            raise
+
+    def fail_document(self, document_id: str, error: str) -> None:
+        """
+        Mark a document's ingestion as failed; its checkpoints are kept for a retry
+        
+        Args:
+            document_id: Document identifier
+            error: Reason shown to the next caller
+        """
+        try:
+            self.cursor.execute("""
+                UPDATE documents
+                SET processing_status = ?, processing_error = ?,
+                    status_updated_at = datetime('now', 'localtime')
+                WHERE document_id = ?
+                """, (FAILED, error, document_id))
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error marking document failed: {e}")
+
     def get_document_by_session(self, session_id: str) -> Optional[Dict]:
         """
         Get the document associated with a session
@@ -459,7 +1045,8 @@ class RAGDatabase:
                 'filename': str,
                 'chunk_count': int,
                 'collection_name': str,
-                'status': str,
+                'status': str,  # pending, processing, completed or failed
+                'error': str,   # why the last ingestion failed, if it did
                 'uploaded_at': str
             }
         
@@ -476,6 +1063,7 @@ class RAGDatabase:
                     d.chunk_count,
                     d.chromadb_collection_name,
                     d.processing_status,
+                    d.processing_error,
                     sd.uploaded_at
                 FROM documents d
                 JOIN session_documents sd ON d.document_id = sd.document_id
@@ -495,12 +1083,67 @@ class RAGDatabase:
                 'chunk_count': row['chunk_count'],
                 'collection_name': row['chromadb_collection_name'],
                 'status': row['processing_status'],
+                'error': row['processing_error'],
                 'uploaded_at': row['uploaded_at']
             }
         except sqlite3.Error as e:
             logger.error(f"Error getting document by session: {e}")
             return None
 
+    def get_document(self, document_id: str) -> Optional[Dict]:
+        """
+        Get a document by its ID
+        
+        Args:
+            document_id: Document identifier
+        
+        Returns:
+            Dictionary with document_id, file_hash, filename, chunk_count,
+            collection_name, status and pinned, or None if not found
+        """
+        try:
+            self.cursor.execute("""
+                SELECT document_id, file_hash, filename, chunk_count,
+                       chromadb_collection_name, processing_status, pinned
+                FROM documents
+                WHERE document_id = ?
+                """, (document_id,))
+            row = self.cursor.fetchone()
+            if not row:
+                return None
+            return {
+                'document_id': row['document_id'],
+                'file_hash': row['file_hash'],
+                'filename': row['filename'],
+                'chunk_count': row['chunk_count'],
+                'collection_name': row['chromadb_collection_name'],
+                'status': row['processing_status'],
+                'pinned': bool(row['pinned'])
+            }
+        except sqlite3.Error as e:
+            logger.error(f"Error getting document: {e}")
+            return None
+
+    def set_document_pinned(self, document_id: str, pinned: bool = True) -> None:
+        """
+        Pin or unpin a document
+        
+        Pinned documents are kept by garbage collection even when no session
+        references them, so preloaded corpora outlive session expiry.
+        
+        Args:
+            document_id: Document identifier
+            pinned: New pinned state
+        """
+        try:
+            self.cursor.execute("""
+                UPDATE documents SET pinned = ? WHERE document_id = ?
+            """, (1 if pinned else 0, document_id))
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error pinning document: {e}")
+            raise
+
     def update_chunk_count(self, document_id: str, chunk_count: int) -> None:
         """
         Update the chunk count for a document
@@ -550,6 +1193,103 @@ class RAGDatabase:
             logger.error(f"Error checking document existence: {e}")
             return False
 
+    def file_hash_exists(self, file_hash: str) -> bool:
+        """
+        Check if any document row still uses a stored file
+        
+        Args:
+            file_hash: SHA256 hex digest of the file content
+        
+        Returns:
+            bool: True if a document references the hash
+        """
+        try:
+            self.cursor.execute("""
+                SELECT 1 FROM documents WHERE file_hash = ? LIMIT 1
+                """, (file_hash,))
+            return self.cursor.fetchone() is not None
+        except sqlite3.Error as e:
+            logger.error(f"Error checking file hash: {e}")
+            # Err on the side of keeping the file
+            return True
+
+    def get_file_aliases(self, file_hash: str) -> List[str]:
+        """
+        Get every filename a stored file was uploaded under
+        
+        Args:
+            file_hash: SHA256 hex digest of the file content
+        
+        Returns:
+            List of filenames, oldest first
+        """
+        try:
+            self.cursor.execute("""
+                SELECT filename FROM file_aliases
+                WHERE file_hash = ?
+                ORDER BY created_at ASC, id ASC
+                """, (file_hash,))
+            return [row['filename'] for row in self.cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Error getting file aliases: {e}")
+            return []
+
+    def get_unreferenced_documents(self) -> List[Dict]:
+        """
+        Get documents that no session references anymore (pinned ones excluded)
+        
+        Returns:
+            List of dicts with document_id, file_hash and collection_name
+        
+        Use case:
+            - Garbage collection of blobs and ChromaDB collections
+        """
+        try:
+            self.cursor.execute("""
+                SELECT d.document_id, d.file_hash, d.chromadb_collection_name
+                FROM documents d
+                WHERE COALESCE(d.pinned, 0) = 0
+                AND NOT EXISTS (
+                    SELECT 1 FROM session_documents sd
+                    WHERE sd.document_id = d.document_id
+                )
+                """)
+            return [
+                {
+                    'document_id': row['document_id'],
+                    'file_hash': row['file_hash'],
+                    'collection_name': row['chromadb_collection_name']
+                }
+                for row in self.cursor.fetchall()
+            ]
+        except sqlite3.Error as e:
+            logger.error(f"Error getting unreferenced documents: {e}")
+            return []
+
+    def delete_document(self, document_id: str) -> None:
+        """
+        Delete a document row and the filename aliases of its file
+        
+        Session links are removed by ON DELETE CASCADE.
+        
+        Args:
+            document_id: Document identifier
+        """
+        try:
+            self.cursor.execute("""
+                DELETE FROM file_aliases
+                WHERE file_hash = (SELECT file_hash FROM documents WHERE document_id = ?)
+                """, (document_id,))
+            self.cursor.execute("""
+                DELETE FROM documents WHERE document_id = ?
+                """, (document_id,))
+            self.conn.commit()
+            logger.info(f"Deleted document {document_id[:8]}...")
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error deleting document: {e}")
+            raise
+
 # =================================================================================
 # Message Operations (CRUD)
 
@@ -591,6 +1331,116 @@ class RAGDatabase:
             logger.error(f"Error adding message: {e}")
             return None
     
+    def append_message(self, session_id: str, role: str, content: str,
+                       idempotency_key: Optional[str] = None) -> Optional[Dict]:
+        """
+        Append a message, at most once per idempotency key
+        
+        Args:
+            session_id: Session identifier
+            role: 'user' or 'assistant'
+            content: Message text
+            idempotency_key: Client-chosen key; a retry with the same key
+                             returns the stored message instead of a new row
+        
+        Returns:
+            dict: message_id, role, content and duplicate (True for a retry),
+                  or None on error
+        
+        Raises:
+            ValueError: If role is not 'user' or 'assistant'
+        """
+        if role not in ['user', 'assistant']:
+            raise ValueError(f"Invalid Role: {role}. MUST be 'user' or 'assistant'")
+        
+        try:
+            self.cursor.execute("""
+            INSERT OR IGNORE INTO messages(session_id, role, content, timestamp, idempotency_key)
+            VALUES(?, ?, ?, datetime('now', 'localtime'), ?)
+            """, (session_id, role, content, idempotency_key))
+            inserted = self.cursor.rowcount == 1
+            message_id = self.cursor.lastrowid
+            self.conn.commit()
+            
+            if inserted:
+                return {"message_id": message_id, "role": role, "content": content, "duplicate": False}
+            
+            # Same key seen before: hand back the original row
+            self.cursor.execute("""
+            SELECT message_id, role, content FROM messages
+            WHERE session_id = ? AND idempotency_key = ?
+            """, (session_id, idempotency_key))
+            row = self.cursor.fetchone()
+            if row is None:
+                return None
+            return {"message_id": row["message_id"], "role": row["role"],
+                    "content": row["content"], "duplicate": True}
+        except sqlite3.Error as e:
+            logger.error(f"Error appending message: {e}")
+            return None
+
+    def add_turn(self, session_id: str, question: str, answer: str,
+                 idempotency_key: Optional[str] = None) -> Optional[Dict]:
+        """
+        Store a user question and the assistant's answer in one transaction
+        
+        Either both messages are stored or neither is. With an idempotency
+        key, the user row gets the key and the assistant row '<key>:answer',
+        so get_turn() can replay the turn.
+        
+        Args:
+            session_id: Session identifier
+            question: User message text
+            answer: Assistant message text
+            idempotency_key: Optional client-chosen key for the turn
+        
+        Returns:
+            dict: user_message_id and assistant_message_id, or None on error
+                  (including a concurrent turn with the same key)
+        """
+        answer_key = f"{idempotency_key}:answer" if idempotency_key else None
+        try:
+            with self.conn:
+                self.cursor.execute("""
+                INSERT INTO messages(session_id, role, content, timestamp, idempotency_key)
+                VALUES(?, 'user', ?, datetime('now', 'localtime'), ?)
+                """, (session_id, question, idempotency_key))
+                user_message_id = self.cursor.lastrowid
+                self.cursor.execute("""
+                INSERT INTO messages(session_id, role, content, timestamp, idempotency_key)
+                VALUES(?, 'assistant', ?, datetime('now', 'localtime'), ?)
+                """, (session_id, answer, answer_key))
+                assistant_message_id = self.cursor.lastrowid
+            
+            logger.info(f"Turn added (messages {user_message_id}, {assistant_message_id})")
+            return {"user_message_id": user_message_id, "assistant_message_id": assistant_message_id}
+        except sqlite3.Error as e:
+            logger.error(f"Error adding turn: {e}")
+            return None
+
+    def get_turn(self, session_id: str, idempotency_key: str) -> Optional[Dict]:
+        """
+        Look up a chat turn stored by add_turn() with this idempotency key
+        
+        Returns:
+            dict: user_message_id, assistant_message_id and answer, or None
+        """
+        try:
+            self.cursor.execute("""
+            SELECT u.message_id AS user_message_id,
+                   a.message_id AS assistant_message_id,
+                   a.content AS answer
+            FROM messages u
+            JOIN messages a
+              ON a.session_id = u.session_id AND a.idempotency_key = u.idempotency_key || ':answer'
+            WHERE u.session_id = ? AND u.idempotency_key = ? AND u.role = 'user'
+            """, (session_id, idempotency_key))
+            row = self.cursor.fetchone()
+            return dict(row) if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Error getting turn: {e}")
+            return None
+
     def get_messages(self, session_id: str, limit: Optional[int] = None) -> List[Dict]:
         """
         Retrieve all messages for a session
@@ -613,7 +1463,7 @@ class RAGDatabase:
             SELECT message_id, session_id, role, content, timestamp
             FROM messages
             WHERE session_id = ?
-            ORDER BY timestamp ASC
+            ORDER BY timestamp ASC, message_id ASC
             """
             if limit:
                 query += f" LIMIT {int(limit)}"  # FIX: Ensure limit is integer
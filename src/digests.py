@@ -0,0 +1,190 @@
+import os
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from coalesce import normalize_question
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Summarize each document once in the background and answer overview
+# questions ("summarize this document") from the stored digest
+DOCUMENT_DIGESTS = os.getenv("DOCUMENT_DIGESTS", "false").lower() in ("1", "true", "yes")
+
+# Characters of document text summarized per map call
+DIGEST_SECTION_CHARS = int(os.getenv("DIGEST_SECTION_CHARS", "8000"))
+
+# Upper bound on map calls per document; longer documents get longer sections,
+# of which only the first DIGEST_SECTION_CHARS are read
+DIGEST_MAX_SECTIONS = int(os.getenv("DIGEST_MAX_SECTIONS", "24"))
+
+# Map calls of one digest in flight at once, and digests built at once
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "4"))
+DIGEST_WORKERS = int(os.getenv("DIGEST_WORKERS", "1"))
+
+# Seconds before a failed digest is built again, doubled after every further
+# failure up to the maximum (each build costs up to DIGEST_MAX_SECTIONS + 1 LLM calls)
+DIGEST_RETRY_DELAY = float(os.getenv("DIGEST_RETRY_DELAY", "300"))
+DIGEST_RETRY_MAX_DELAY = float(os.getenv("DIGEST_RETRY_MAX_DELAY", "86400"))
+
+MAP_INSTRUCTION = (
+    "Summarize this part of the document in 3-5 sentences. "
+    "Start with a short title for the part, then a colon."
+)
+REDUCE_INSTRUCTION = (
+    "The context holds summaries of consecutive parts of one document. "
+    "Write an overview of the whole document: what it is, its main points "
+    "and how it is organized."
+)
+
+_DOCUMENT = r"(?:this|the|that|my|uploaded)\s+(?:document|doc|file|pdf|paper|text|report|article|book)"
+_OVERVIEW_PATTERNS = [
+    re.compile(p) for p in (
+        rf"^(?:please\s+)?(?:can|could|would)?\s*(?:you\s+)?(?:give\s+me|provide|write|show\s+me)?\s*"
+        rf"(?:an?\s+)?(?:short\s+|brief\s+|quick\s+|high[- ]level\s+)?"
+        rf"(?:summary|overview|tl;?dr|gist|synopsis)(?:\s+(?:of|for)\s+(?:{_DOCUMENT}|it))?(?:\s+please)?$",
+        rf"^(?:please\s+)?(?:can|could|would)?\s*(?:you\s+)?(?:briefly\s+)?(?:summari[sz]e|outline)"
+        rf"(?:\s+(?:{_DOCUMENT}|it))?(?:\s+(?:for\s+me|briefly))?(?:\s+please)?$",
+        rf"^what(?:\s+is|'s)\s+{_DOCUMENT}\s+about$",
+        rf"^what\s+are\s+the\s+(?:main|key)\s+(?:points|ideas|takeaways|topics)(?:\s+of\s+{_DOCUMENT})?$",
+    )
+]
+
+
+def is_overview_question(question: str) -> bool:
+    """
+    Whether a question asks about the document as a whole
+
+    Only short requests for a summary or overview of the whole document
+    match; 'summarize the pricing section' does not.
+
+    Args:
+        question: The user's question
+
+    Returns:
+        bool: True for overview intents
+    """
+    normalized = normalize_question(question or "")
+    return any(pattern.match(normalized) for pattern in _OVERVIEW_PATTERNS)
+
+
+def retry_delay(failures: int) -> float:
+    """
+    Seconds to wait after a digest build failed this many times in a row
+
+    Args:
+        failures: Consecutive failed builds (at least 1)
+
+    Returns:
+        float: DIGEST_RETRY_DELAY, doubled per further failure, capped at
+               DIGEST_RETRY_MAX_DELAY
+    """
+    return min(DIGEST_RETRY_MAX_DELAY, DIGEST_RETRY_DELAY * 2 ** min(max(0, failures - 1), 32))
+
+
+def plan_sections(chunks: List[str]) -> List[Tuple[int, int, str]]:
+    """
+    Group consecutive chunks into the sections summarized by the map step
+
+    Args:
+        chunks: Chunk texts in document order
+
+    Returns:
+        list: (first chunk, last chunk, text) per section, text capped at
+              DIGEST_SECTION_CHARS
+    """
+    if not chunks:
+        return []
+    total = sum(len(chunk) for chunk in chunks)
+    count = min(max(1, DIGEST_MAX_SECTIONS), len(chunks), max(1, -(-total // DIGEST_SECTION_CHARS)))
+    sections = []
+    for i in range(count):
+        first = i * len(chunks) // count
+        last = (i + 1) * len(chunks) // count - 1
+        text = "\n".join(chunks[first:last + 1])[:DIGEST_SECTION_CHARS]
+        sections.append((first, last, text))
+    return sections
+
+
+def summarize(chunks: List[str], complete: Callable[[str, str], str],
+              concurrency: int = DIGEST_CONCURRENCY) -> Dict:
+    """
+    Map-reduce summary of a document
+
+    Args:
+        chunks: Chunk texts in document order
+        complete: Called with (context, instruction), returns the LLM's answer
+        concurrency: Map calls in flight at once
+
+    Returns:
+        dict: digest (overview text) and outline (first_chunk, last_chunk and
+              summary of every section, in document order)
+    """
+    sections = plan_sections(chunks)
+    if not sections:
+        raise ValueError("Document has no text to summarize")
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="digest-map") as pool:
+        summaries = list(pool.map(lambda section: complete(section[2], MAP_INSTRUCTION), sections))
+
+    outline = [
+        {"first_chunk": first, "last_chunk": last, "summary": summary.strip()}
+        for (first, last, _), summary in zip(sections, summaries)
+    ]
+    if len(outline) == 1:
+        digest = outline[0]["summary"]
+    else:
+        context = "\n\n".join(f"Part {i + 1}. {entry['summary']}" for i, entry in enumerate(outline))
+        digest = complete(context, REDUCE_INSTRUCTION).strip()
+    return {"digest": digest, "outline": outline}
+
+
+class DigestJobs:
+    """
+    Background queue of digest builds, at most one per key
+
+    A key (document_id, model) that is queued or running is not queued
+    again, so concurrent uploads and overview questions on one document pay
+    for one digest.
+    """
+
+    def __init__(self, workers: int = DIGEST_WORKERS):
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._workers = max(1, workers)
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, key: Tuple[str, str], job: Callable[[], None]) -> bool:
+        """
+        Queue a job unless one with the same key is queued or running
+
+        Returns:
+            bool: True if the job was queued
+        """
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="digest")
+        self._pool.submit(self._run, key, job)
+        return True
+
+    def _run(self, key: Tuple[str, str], job: Callable[[], None]):
+        try:
+            job()
+        except Exception as e:
+            logger.error(f"Digest of {key[0][:8]}... with {key[1]} failed: {type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+jobs = DigestJobs()
@@ -0,0 +1,592 @@
+import os
+import json
+import time
+import logging
+import threading
+import weakref
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 'torch' (sentence-transformers) or 'onnx' (ONNX Runtime on CPU)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+
+# Where exported ONNX models are kept, one directory per embedding model
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "./onnx_models")
+
+# Use the dynamically int8-quantized export (needs the 'onnx' package to create it)
+EMBEDDING_ONNX_QUANTIZE = os.getenv("EMBEDDING_ONNX_QUANTIZE", "false").lower() in ("1", "true", "yes")
+
+# ONNX Runtime intra-op threads (0 = one per physical core)
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))
+
+# An export is only used if every verification vector is at least this close to torch's
+EMBEDDING_ONNX_MIN_COSINE = float(os.getenv("EMBEDDING_ONNX_MIN_COSINE", "0.99"))
+
+# Chunks of similar token length embedded together in one forward pass during ingestion
+EMBED_BUCKET_SIZE = int(os.getenv("EMBED_BUCKET_SIZE", "32"))
+
+MANIFEST_FILE = "manifest.json"
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+# Texts embedded by both backends when an export is verified
+VERIFY_TEXTS = [
+    "What are the main findings of this report?",
+    "Summarize the methodology section.",
+    "The retrieval pipeline splits documents into overlapping chunks and embeds each one.",
+    "Latency was measured at the 50th, 95th and 99th percentile under sustained load.",
+    "Invoice 2024-117: 3 x replacement filters, net 30 days, total EUR 412.50",
+    "Kapitel 4 beschreibt die Ergebnisse der Evaluation.",
+    "def search(query, n_results=5): return collection.query(query_embeddings=[embed(query)])",
+    "a",
+    " ".join(["The committee reviewed the quarterly budget and approved the revised schedule."] * 40),
+]
+
+# Modules of a sentence-transformers pipeline that the ONNX backend reproduces
+_SUPPORTED_MODULES = {"Transformer", "Pooling", "Normalize"}
+
+_export_lock = threading.Lock()
+
+# Counting tokenizers of loaded torch models (see _counting_tokenizer())
+_counters: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_counters_lock = threading.Lock()
+
+
+def _model_dir(model_name: str) -> str:
+    return os.path.join(EMBEDDING_ONNX_DIR, model_name.replace("/", "__"))
+
+
+def _cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Cosine similarity of each row of a with the same row of b"""
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return np.sum(a * b, axis=1)
+
+
+def drift(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """
+    How far candidate vectors are from reference vectors of the same texts
+
+    Args:
+        reference: Embeddings from the reference backend (rows = texts)
+        candidate: Embeddings of the same texts from another backend
+
+    Returns:
+        dict: min_cosine and mean_cosine over all rows
+    """
+    cosines = _cosine_rows(np.asarray(reference, dtype=np.float32), np.asarray(candidate, dtype=np.float32))
+    return {"min_cosine": round(float(cosines.min()), 6), "mean_cosine": round(float(cosines.mean()), 6)}
+
+
+class OnnxEmbeddingModel:
+    """
+    Sentence embeddings from an ONNX export of a sentence-transformers model
+
+    Tokenization uses the exported fast tokenizer, the transformer runs in
+    ONNX Runtime, and pooling / normalization are done in numpy the way the
+    original pipeline does them. torch is not imported, so loading is quick
+    and the encode() interface matches SentenceTransformer.encode() for the
+    calls this project makes.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = False, threads: int = EMBEDDING_ONNX_THREADS):
+        """
+        Args:
+            model_dir: Directory written by export_onnx()
+            quantized: Load the int8 model instead of the float32 one
+            threads: ONNX Runtime intra-op threads (0 = runtime default)
+
+        Raises:
+            FileNotFoundError: If the export is incomplete
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+        self.model_dir = model_dir
+        self.quantized = quantized
+        self.variant = "int8" if quantized else "fp32"
+        model_path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(model_path)
+
+        self.max_seq_length = self.manifest["max_seq_length"]
+        self.pooling = self.manifest["pooling"]
+        self.normalize = self.manifest["normalize"]
+        self.input_names = self.manifest["input_names"]
+
+        self.pad_token_id = self.manifest["pad_token_id"]
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding(pad_id=self.pad_token_id, pad_token=self.manifest["pad_token"])
+        # Untruncated, unpadded copy for token counts (see tokenize()). Exports
+        # made before the tokenizer's state was reset saved batch padding.
+        self._counter = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self._counter.no_padding()
+        self._counter.no_truncation()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # One request runs one graph; parallelism comes from intra-op threads
+        options.inter_op_num_threads = 1
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.manifest["dimension"]
+
+    def tokenize(self, texts: List[str]) -> List[List[int]]:
+        """Token ids of texts with special tokens, without truncation or padding"""
+        return [encoding.ids for encoding in self._counter.encode_batch(texts)]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        return self.embed(np.array([e.ids for e in encodings], dtype=np.int64),
+                          np.array([e.attention_mask for e in encodings], dtype=np.int64))
+
+    def embed(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """
+        Embed an already tokenized, padded batch of single texts
+
+        Args:
+            input_ids: (batch, sequence) token ids
+            attention_mask: (batch, sequence) 1 for real tokens, 0 for padding
+
+        Returns:
+            np.ndarray: (batch, dim) sentence embeddings
+        """
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+
+        if self.pooling == "cls":
+            pooled = token_embeddings[:, 0]
+        elif self.pooling == "max":
+            masked = np.where(attention_mask[..., None] > 0, token_embeddings, -1e9)
+            pooled = masked.max(axis=1)
+        else:
+            mask = attention_mask[..., None].astype(token_embeddings.dtype)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+        if self.normalize:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """
+        Embed one text or a list of texts
+
+        Texts are sorted by length before batching, like sentence-transformers
+        does, so a batch pads to similar lengths; results come back in input order.
+
+        Args:
+            sentences: Text or list of texts
+            batch_size: Texts per ONNX Runtime call
+
+        Returns:
+            np.ndarray: One vector for a string, else a (len(sentences), dim) array
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        embeddings = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            embeddings[batch] = self._encode_batch([texts[i] for i in batch])
+
+        return embeddings[0] if single else embeddings
+
+
+def _counting_tokenizer(model: Union["SentenceTransformer", OnnxEmbeddingModel]):
+    """
+    Untruncated, unpadded tokenizer for token counts, private to this module
+
+    The HF tokenizer of a SentenceTransformer is shared with query encoding,
+    and calling it with truncation=False changes its backend's truncation and
+    padding state under concurrent encodes. A copy of the backend is made
+    once per model instead.
+
+    Returns:
+        tokenizers.Tokenizer, or None for slow (pure-Python) tokenizers
+    """
+    if isinstance(model, OnnxEmbeddingModel):
+        return model._counter
+    if not getattr(model.tokenizer, "is_fast", False):
+        return None
+    with _counters_lock:
+        counter = _counters.get(model)
+        if counter is None:
+            from tokenizers import Tokenizer
+
+            counter = Tokenizer.from_str(model.tokenizer.backend_tokenizer.to_str())
+            counter.no_padding()
+            counter.no_truncation()
+            _counters[model] = counter
+    return counter
+
+
+def tokenize(model: Union["SentenceTransformer", OnnxEmbeddingModel], texts: List[str]) -> List[List[int]]:
+    """
+    Token ids of texts as the embedding model sees them, before truncation
+
+    Args:
+        model: SentenceTransformer or OnnxEmbeddingModel
+        texts: Texts to tokenize
+
+    Returns:
+        List of token id lists, special tokens included
+    """
+    counter = _counting_tokenizer(model)
+    if counter is None:
+        return model.tokenizer(texts, add_special_tokens=True, truncation=False, verbose=False)["input_ids"]
+    return [encoding.ids for encoding in counter.encode_batch(texts)]
+
+
+def tokenize_with_offsets(
+    model: Union["SentenceTransformer", OnnxEmbeddingModel], texts: List[str]
+) -> Tuple[List[List[int]], Optional[List[List[Tuple[int, int]]]]]:
+    """
+    tokenize(), also returning where each token lies in its text
+
+    Args:
+        model: SentenceTransformer or OnnxEmbeddingModel
+        texts: Texts to tokenize
+
+    Returns:
+        (token id lists, (start, end) character span of every token; special
+        tokens span (0, 0)). The spans are None for tokenizers without offset
+        mapping (slow, pure-Python tokenizers).
+    """
+    counter = _counting_tokenizer(model)
+    if counter is None:
+        return tokenize(model, texts), None
+    encodings = counter.encode_batch(texts)
+    return [encoding.ids for encoding in encodings], [list(encoding.offsets) for encoding in encodings]
+
+
+def special_token_layout(model: Union["SentenceTransformer", OnnxEmbeddingModel]) -> Tuple[int, int]:
+    """
+    Number of special tokens the tokenizer adds before and after a text
+
+    Returns:
+        (leading, trailing), e.g. (1, 1) for BERT's [CLS] ... [SEP]
+    """
+    empty, text = tokenize(model, ["", "a"])
+    leading = 0
+    while leading < len(empty) and leading < len(text) and empty[leading] == text[leading]:
+        leading += 1
+    return leading, len(empty) - leading
+
+
+def truncate_ids(ids: List[int], limit: int, trailing: int) -> List[int]:
+    """Cut token ids to limit, keeping the trailing special tokens (as the tokenizer's truncation does)"""
+    if len(ids) <= limit:
+        return ids
+    return ids[:limit - trailing] + ids[len(ids) - trailing:]
+
+
+def encode_token_ids(model: Union["SentenceTransformer", OnnxEmbeddingModel], token_ids: List[List[int]],
+                     bucket_size: int = EMBED_BUCKET_SIZE) -> Tuple[np.ndarray, int]:
+    """
+    Embed pre-tokenized texts, batching texts of similar token length together
+
+    Texts are sorted by token count and embedded bucket_size at a time, so
+    each forward pass pads to nearly the same length and the tokenizer runs
+    once per text. Ids longer than the model's max_seq_length are truncated.
+
+    Args:
+        model: SentenceTransformer or OnnxEmbeddingModel
+        token_ids: Output of tokenize()
+        bucket_size: Texts per forward pass
+
+    Returns:
+        (embeddings in input order, number of padding slots computed)
+    """
+    limit = model.max_seq_length
+    _, trailing = special_token_layout(model)
+    if isinstance(model, OnnxEmbeddingModel):
+        pad_id = model.pad_token_id
+    else:
+        pad_id = model.tokenizer.pad_token_id or 0
+
+    embeddings = np.empty((len(token_ids), model.get_sentence_embedding_dimension()), dtype=np.float32)
+    order = sorted(range(len(token_ids)), key=lambda i: len(token_ids[i]))
+    padding = 0
+    for start in range(0, len(order), bucket_size):
+        bucket = order[start:start + bucket_size]
+        rows = [truncate_ids(token_ids[i], limit, trailing) for i in bucket]
+        width = max(len(row) for row in rows)
+        input_ids = np.full((len(rows), width), pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(rows), width), dtype=np.int64)
+        for j, row in enumerate(rows):
+            input_ids[j, :len(row)] = row
+            attention_mask[j, :len(row)] = 1
+        padding += int(attention_mask.size - attention_mask.sum())
+        embeddings[bucket] = _forward(model, input_ids, attention_mask)
+    return embeddings, padding
+
+
+def _forward(model: Union["SentenceTransformer", OnnxEmbeddingModel], input_ids: np.ndarray,
+             attention_mask: np.ndarray) -> np.ndarray:
+    if isinstance(model, OnnxEmbeddingModel):
+        return model.embed(input_ids, attention_mask)
+
+    import torch
+
+    features = {"input_ids": torch.from_numpy(input_ids), "attention_mask": torch.from_numpy(attention_mask)}
+    if "token_type_ids" in model.tokenizer.model_input_names:
+        features["token_type_ids"] = torch.zeros_like(features["input_ids"])
+    features = {name: tensor.to(model.device) for name, tensor in features.items()}
+    with torch.inference_mode():
+        return model(features)["sentence_embedding"].float().cpu().numpy()
+
+
+def _pipeline_settings(model: "SentenceTransformer") -> Dict:
+    """Pooling, normalization and tokenizer settings of a loaded sentence-transformers model"""
+    names = [type(module).__name__ for module in model]
+    unsupported = [name for name in names if name not in _SUPPORTED_MODULES]
+    if unsupported or names[0] != "Transformer":
+        raise ValueError(f"Cannot export pipeline {names} to ONNX (unsupported: {unsupported})")
+
+    pooling = "mean"
+    pooling_module = next((module for module in model if type(module).__name__ == "Pooling"), None)
+    if pooling_module is not None:
+        if pooling_module.pooling_mode_cls_token:
+            pooling = "cls"
+        elif pooling_module.pooling_mode_max_tokens:
+            pooling = "max"
+        elif not pooling_module.pooling_mode_mean_tokens:
+            raise ValueError("Only mean, cls and max pooling can be exported to ONNX")
+
+    tokenizer = model[0].tokenizer
+    if not getattr(tokenizer, "is_fast", False):
+        raise ValueError("The ONNX backend needs a fast (Rust) tokenizer")
+
+    return {
+        "pooling": pooling,
+        "normalize": "Normalize" in names,
+        "max_seq_length": model.max_seq_length,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "input_names": [name for name in ("input_ids", "attention_mask", "token_type_ids")
+                        if name in tokenizer.model_input_names],
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+    }
+
+
+def export_onnx(model_name: str, quantize: bool = EMBEDDING_ONNX_QUANTIZE) -> str:
+    """
+    Export a sentence-transformers model to ONNX and verify it against torch
+
+    Writes the float32 graph, optionally a dynamically int8-quantized copy,
+    the tokenizer and a manifest with the pooling settings and the measured
+    drift of each variant on VERIFY_TEXTS.
+
+    Args:
+        model_name: HuggingFace model name
+        quantize: Also write the int8 model
+
+    Returns:
+        str: Export directory
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = _model_dir(model_name)
+    os.makedirs(model_dir, exist_ok=True)
+    logger.info(f"Exporting embedding model {model_name} to ONNX in {model_dir}")
+
+    model = SentenceTransformer(model_name, device="cpu")
+    settings = _pipeline_settings(model)
+    transformer = model[0].auto_model.eval()
+    tokenizer = model[0].tokenizer
+    input_names = settings["input_names"]
+
+    class _TokenEmbeddings(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(input_names, inputs))).last_hidden_state
+
+    sample = tokenizer(["export sample text", "a"], padding=True, return_tensors="pt")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["token_embeddings"]}
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings(),
+            tuple(sample[name] for name in input_names),
+            os.path.join(model_dir, FP32_FILE),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            do_constant_folding=True,
+            dynamo=False,
+        )
+    # Calling the tokenizer above left padding (and possibly truncation)
+    # enabled on its backend, which would otherwise be saved with it
+    tokenizer.backend_tokenizer.no_padding()
+    tokenizer.backend_tokenizer.no_truncation()
+    tokenizer.backend_tokenizer.save(os.path.join(model_dir, TOKENIZER_FILE))
+
+    if quantize:
+        # Needs the 'onnx' package, which onnxruntime does not pull in
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(os.path.join(model_dir, FP32_FILE), os.path.join(model_dir, INT8_FILE),
+                         weight_type=QuantType.QInt8)
+
+    manifest = {"model_name": model_name, **settings, "verification": {}}
+    with open(os.path.join(model_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    reference = model.encode(VERIFY_TEXTS)
+    for quantized in ((False, True) if quantize else (False,)):
+        candidate = OnnxEmbeddingModel(model_dir, quantized=quantized)
+        result = drift(reference, candidate.encode(VERIFY_TEXTS))
+        # Ingestion embeds pre-tokenized ids, which must give the same vectors
+        ingested, _ = encode_token_ids(candidate, tokenize(candidate, VERIFY_TEXTS))
+        pretokenized = drift(reference, ingested)
+        result = {name: min(result[name], pretokenized[name]) for name in result}
+        manifest["verification"][candidate.variant] = result
+        logger.info(f"ONNX {candidate.variant} export of {model_name}: {result}")
+
+    with open(os.path.join(model_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return model_dir
+
+
+def load_onnx_model(model_name: str, quantize: bool = EMBEDDING_ONNX_QUANTIZE,
+                    min_cosine: float = EMBEDDING_ONNX_MIN_COSINE) -> OnnxEmbeddingModel:
+    """
+    Load the ONNX export of a model, exporting it first if needed
+
+    Args:
+        model_name: HuggingFace model name
+        quantize: Use the int8 model
+        min_cosine: Smallest cosine to torch a verified export may have
+
+    Returns:
+        OnnxEmbeddingModel
+
+    Raises:
+        ValueError: If the export drifts further from torch than min_cosine
+    """
+    model_dir = _model_dir(model_name)
+    variant = "int8" if quantize else "fp32"
+    with _export_lock:
+        manifest_path = os.path.join(model_dir, MANIFEST_FILE)
+        manifest = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        if manifest is None or variant not in manifest.get("verification", {}):
+            export_onnx(model_name, quantize=quantize)
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+
+    verification = manifest["verification"][variant]
+    if verification["min_cosine"] < min_cosine:
+        raise ValueError(
+            f"ONNX {variant} export of {model_name} drifts from torch "
+            f"(min cosine {verification['min_cosine']} < {min_cosine})"
+        )
+    model = OnnxEmbeddingModel(model_dir, quantized=quantize)
+    logger.info(f"Loaded ONNX {variant} embedding model for {model_name} (min cosine {verification['min_cosine']})")
+    return model
+
+
+def load_embedding_model(model_name: str, backend: str = EMBEDDING_BACKEND
+                         ) -> Union["SentenceTransformer", OnnxEmbeddingModel]:
+    """
+    Load an embedding model with the configured backend
+
+    Vectors from either backend land in the same collections, so an ONNX
+    export that cannot be built or fails verification falls back to torch.
+
+    Args:
+        model_name: HuggingFace model name
+        backend: 'torch' or 'onnx'
+
+    Returns:
+        SentenceTransformer or OnnxEmbeddingModel
+    """
+    if backend == "onnx":
+        try:
+            return load_onnx_model(model_name)
+        except Exception as e:
+            logger.warning(f"ONNX embedding backend unavailable for {model_name}, using torch: {e}")
+    elif backend != "torch":
+        logger.warning(f"Unknown EMBEDDING_BACKEND {backend!r}, using torch")
+
+    # Pulls in torch, which takes seconds; deferred until the model is needed
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
+def compare_backends(model_name: str, texts: List[str], batch_size: int = 32, repeat: int = 3,
+                     variants: Optional[List[str]] = None) -> Dict:
+    """
+    Encode the same texts with torch and the ONNX exports and compare them
+
+    Args:
+        model_name: HuggingFace model name
+        texts: Texts to embed (e.g. document chunks or questions)
+        batch_size: Texts per encode batch
+        repeat: Timed passes over texts per backend (the best one counts)
+        variants: Any of 'torch', 'onnx', 'onnx-int8' (default: all three)
+
+    Returns:
+        dict: Per backend seconds, texts_per_second, speedup over torch and
+              drift (min/mean cosine to torch)
+    """
+    from sentence_transformers import SentenceTransformer
+
+    variants = variants or ["torch", "onnx", "onnx-int8"]
+    models = {"torch": SentenceTransformer(model_name, device="cpu")}
+    if "onnx" in variants:
+        models["onnx"] = load_onnx_model(model_name, quantize=False, min_cosine=-1.0)
+    if "onnx-int8" in variants:
+        models["onnx-int8"] = load_onnx_model(model_name, quantize=True, min_cosine=-1.0)
+
+    reference = None
+    report = {"model_name": model_name, "texts": len(texts), "batch_size": batch_size, "backends": {}}
+    for name in ["torch"] + [v for v in variants if v != "torch"]:
+        model = models[name]
+        embeddings = model.encode(texts[:batch_size], batch_size=batch_size)
+        best = float("inf")
+        for _ in range(max(1, repeat)):
+            start_time = time.perf_counter()
+            embeddings = model.encode(texts, batch_size=batch_size)
+            best = min(best, time.perf_counter() - start_time)
+        if reference is None:
+            reference = embeddings
+
+        entry = {
+            "seconds": round(best, 4),
+            "texts_per_second": round(len(texts) / best, 1) if best else None,
+            **drift(reference, embeddings),
+        }
+        torch_seconds = report["backends"].get("torch", entry)["seconds"]
+        entry["speedup"] = round(torch_seconds / best, 2) if best else None
+        report["backends"][name] = entry
+    return report
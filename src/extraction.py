@@ -0,0 +1,179 @@
+import os
+import time
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of extraction processes (0 = one per CPU core)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Pages handed to a worker at once; small ranges keep results flowing in page order
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
+# Below this many pages the process pool costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+
+# The pool is created on first use and reused for every document.
+# "spawn" keeps workers free of the parent's threads, model weights and sockets.
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class PageText(NamedTuple):
+    """Text of one PDF page and how long it took to extract"""
+    page_number: int  # 1-based
+    text: str
+    seconds: float
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=PDF_EXTRACT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"Started PDF extraction pool with {PDF_EXTRACT_WORKERS} workers")
+    return _pool
+
+
+def _extract_page_range(filepath: str, start: int, end: int) -> List[Tuple[int, str, float]]:
+    """
+    Extract pages [start, end) of a PDF (runs inside a worker process)
+
+    Returns:
+        List of (page_number, text, seconds) tuples
+    """
+    import fitz  # PyMuPDF, imported where used to keep startup fast
+
+    pages = []
+    with fitz.open(filepath) as doc:
+        for index in range(start, end):
+            page_start = time.perf_counter()
+            text = doc.load_page(index).get_text()
+            pages.append((index + 1, text, time.perf_counter() - page_start))
+    return pages
+
+
+def get_pdf_page_count(filepath: str) -> int:
+    """
+    Open a PDF just far enough to count its pages
+
+    Raises:
+        Exception: If the PDF is password-protected
+    """
+    import fitz  # PyMuPDF
+
+    with fitz.open(filepath) as doc:
+        if doc.needs_pass:
+            raise Exception("PDF is password-protected (encrypted)")
+        return doc.page_count
+
+
+def iter_pdf_pages(filepath: str, max_workers: Optional[int] = None,
+                   pages_per_task: Optional[int] = None) -> Iterator[PageText]:
+    """
+    Extract PDF text page by page, spreading page ranges over a process pool
+
+    Pages are yielded in page order as soon as every earlier range has
+    finished, so the caller can chunk page 1 while later pages are still
+    being extracted. Only 2 * max_workers ranges are extracted ahead of the
+    caller, so memory does not grow with the page count.
+
+    Args:
+        filepath: Path to the PDF file
+        max_workers: Use the pool only if this is > 1 (default: PDF_EXTRACT_WORKERS)
+        pages_per_task: Pages per worker task (default: PDF_PAGES_PER_TASK)
+
+    Yields:
+        PageText for every page
+    """
+    page_count = get_pdf_page_count(filepath)
+    workers = PDF_EXTRACT_WORKERS if max_workers is None else max_workers
+    step = max(1, pages_per_task or PDF_PAGES_PER_TASK)
+
+    if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        for page in _extract_page_range(filepath, 0, page_count):
+            yield PageText(*page)
+        return
+
+    pool = _get_pool()
+    starts = iter(range(0, page_count, step))
+    # Ranges in flight, in page order; at most two per worker, so extracted
+    # text waiting for a slow consumer stays bounded however long the PDF is
+    window = 2 * workers
+    pending: Deque[Future] = deque()
+
+    def submit_next() -> bool:
+        start = next(starts, None)
+        if start is None:
+            return False
+        pending.append(pool.submit(_extract_page_range, filepath, start, min(start + step, page_count)))
+        return True
+
+    try:
+        while len(pending) < window and submit_next():
+            pass
+        while pending:
+            pages = pending.popleft().result()
+            submit_next()
+            for page in pages:
+                yield PageText(*page)
+    finally:
+        # Consumer stopped early or a range failed: don't leave work queued
+        for future in pending:
+            future.cancel()
+
+
+def summarize_page_timings(pages: List[PageText]) -> Dict:
+    """
+    Summarize per-page extraction timings
+
+    Returns:
+        dict: page_count, total/mean/p95/max seconds and the slowest page
+    """
+    if not pages:
+        return {"page_count": 0}
+
+    timings = sorted(page.seconds for page in pages)
+    slowest = max(pages, key=lambda page: page.seconds)
+    return {
+        "page_count": len(pages),
+        "total_seconds": round(sum(timings), 4),
+        "mean_seconds": round(sum(timings) / len(timings), 4),
+        "p95_seconds": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        "max_seconds": round(slowest.seconds, 4),
+        "slowest_page": slowest.page_number,
+    }
+
+
+class PageTimingRecorder:
+    """
+    Wraps a PageText iterator, passing the text through while recording timings
+
+    Only page numbers and timings are kept, never the text, so wrapping a
+    stream does not buffer the document.
+    """
+
+    def __init__(self, pages: Iterator[PageText]):
+        self._pages = pages
+        self.timings: List[PageText] = []
+        self.wall_seconds = 0.0
+
+    def __iter__(self) -> Iterator[str]:
+        start_time = time.perf_counter()
+        try:
+            for page in self._pages:
+                self.timings.append(PageText(page.page_number, "", page.seconds))
+                yield page.text
+        finally:
+            self.wall_seconds = time.perf_counter() - start_time
+
+    def summary(self) -> Dict:
+        summary = summarize_page_timings(self.timings)
+        summary["wall_seconds"] = round(self.wall_seconds, 4)
+        return summary
@@ -8,6 +8,7 @@ from langchain_core.output_parsers import StrOutputParser
 sys.path.append(str(Path(__file__).parent))
 
 from app import RAGAssistant
+from storage import ContentStore
 
 # 1. Page Configuration
 st.set_page_config(
@@ -93,17 +94,13 @@ def get_rag_assistant():
 
 # 4. Helper Functions
 def save_uploaded_file(uploaded_file):
-    """Save uploaded file to data directory and return filepath"""
+    """Save uploaded file to the content-addressed store and return (filepath, file_hash)"""
     try:
-        data_dir = Path("data")
-        data_dir.mkdir(exist_ok=True)
-        file_path = data_dir / uploaded_file.name
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        return str(file_path)
+        uploaded_file.seek(0)
+        return ContentStore("data").put_fileobj(uploaded_file)
     except Exception as e:
         st.error(f"Error saving file: {e}")
-        return None
+        return None, None
 
 def stream_text(text):
     """Generator to simulate typing effect for responses"""
@@ -295,13 +292,15 @@ with st.sidebar:
                     with st.status("📄 Processing Document...", expanded=True) as status:
                         try:
                             st.write("💾 Saving file...")
-                            file_path = save_uploaded_file(uploaded_file)
+                            file_path, file_hash = save_uploaded_file(uploaded_file)
                             
                             if not file_path:
                                 raise Exception("Failed to save uploaded file")
                             
                             st.write("🧠 Generating embeddings...")
-                            result = assistant.upload_document(file_path)
+                            result = assistant.upload_document(
+                                file_path, file_hash=file_hash, filename=uploaded_file.name
+                            )
                             
                             if not result:
                                 raise Exception("Upload returned None")
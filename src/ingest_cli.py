@@ -0,0 +1,333 @@
+"""
+Bulk ingestion of a directory tree, without going through HTTP.
+
+Files are fingerprinted (SHA256) and skipped if their content is already
+indexed. New files are copied into the content store and ingested by a
+pool of workers (extraction, embedding and indexing run concurrently).
+Every finished file is appended to a JSONL checkpoint, so a killed run
+picks up where it stopped. Ingested documents are pinned, so garbage
+collection keeps them after their sessions expire.
+
+Usage (from src/, where the server keeps rag_engine.db, chroma_db/ and data/):
+    python ingest_cli.py /path/to/corpus --workers 4
+    python ingest_cli.py /path/to/corpus --workers 4     # again after a crash: resumes
+    python ingest_cli.py /path/to/corpus --retry-failed  # also retry files that failed before
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from app import RAGAssistant
+from database import RAGDatabase, COMPLETED
+from storage import ContentStore
+from utils import compute_file_checksum
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt")
+
+# Checkpoint statuses that mean "nothing left to do for this file"
+FINISHED = ("done", "skipped", "duplicate")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest every PDF/TXT file under a directory")
+    parser.add_argument("root", help="Directory to walk")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Files ingested concurrently")
+    parser.add_argument("--db", default="rag_engine.db", help="SQLite database of the server")
+    parser.add_argument("--store", default="data", help="Content store directory of the server")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Progress file (default: .ingest/<hash of root>.jsonl)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry files that failed in an earlier run")
+    parser.add_argument("--no-pin", action="store_true", help="Let garbage collection remove the documents")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after this many files (0 = all)")
+    parser.add_argument("--verbose", action="store_true", help="Show per-file pipeline logs and STEP output")
+    return parser.parse_args()
+
+
+def find_files(root: str) -> List[str]:
+    """Every supported file under root, in a stable order"""
+    paths = []
+    for directory, subdirs, filenames in os.walk(root):
+        subdirs.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(SUPPORTED_EXTENSIONS) and not filename.startswith("."):
+                paths.append(os.path.join(directory, filename))
+    return paths
+
+
+class Checkpoint:
+    """
+    Append-only JSONL record of finished files
+
+    A file counts as finished if its last record has a finished status and
+    its size and mtime have not changed since, so resuming does not re-hash
+    files that were already handled.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut off by a kill
+                        continue
+                    self.records[record["path"]] = record
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def is_finished(self, path: str, stat: os.stat_result, retry_failed: bool) -> bool:
+        record = self.records.get(path)
+        if not record or record.get("size") != stat.st_size or record.get("mtime") != stat.st_mtime:
+            return False
+        return record["status"] in FINISHED or (record["status"] == "failed" and not retry_failed)
+
+    def write(self, record: Dict):
+        with self._lock:
+            self.records[record["path"]] = record
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class Progress:
+    """Throughput and ETA over the bytes and files of one run"""
+
+    def __init__(self, total_files: int, total_bytes: int):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files = 0
+        self.bytes = 0
+        self.chunks = 0
+        self.counts: Dict[str, int] = {}
+        self.started = time.perf_counter()
+
+    def add(self, record: Dict):
+        self.files += 1
+        self.bytes += record["size"]
+        self.chunks += record.get("chunks") or 0
+        self.counts[record["status"]] = self.counts.get(record["status"], 0) + 1
+
+    def line(self, record: Dict) -> str:
+        elapsed = max(1e-9, time.perf_counter() - self.started)
+        mb_per_second = self.bytes / elapsed / (1024 * 1024)
+        remaining = self.total_bytes - self.bytes
+        eta = remaining / (self.bytes / elapsed) if self.bytes else 0
+        detail = record.get("error") or f"{record.get('chunks') or 0} chunks"
+        return (
+            f"[{self.files}/{self.total_files}] {self.files / self.total_files:6.1%} "
+            f"{self.files / elapsed:6.2f} files/s {mb_per_second:6.2f} MB/s "
+            f"{self.chunks / elapsed:7.1f} chunks/s ETA {format_seconds(eta)} | "
+            f"{record['status']}: {os.path.basename(record['path'])} ({detail})"
+        )
+
+
+def format_seconds(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class Ingestor:
+    """Fingerprints and ingests single files; safe to call from several threads"""
+
+    def __init__(self, db_path: str, store: ContentStore, pin: bool):
+        self.db_path = db_path
+        self.store = store
+        self.pin = pin
+        self.assistant = RAGAssistant(require_api_key=False)
+        self.assistant.db_path = db_path
+        db = RAGDatabase(db_path)
+        db.connect()
+        db.create_tables()
+        db.close()
+        # Hashes claimed by a worker in this run, so identical files are ingested
+        # once: hash -> path, event set when it finished, and its status
+        self._claimed: Dict[str, Dict] = {}
+        self._claimed_lock = threading.Lock()
+
+    def _existing(self, document_id: str) -> Optional[Dict]:
+        """The stored document if its ingestion completed (unfinished ones are resumed by upload_document)"""
+        db = RAGDatabase(self.db_path)
+        db.connect()
+        try:
+            doc = db.get_document(document_id)
+            if doc and doc["status"] != COMPLETED:
+                return None
+            if doc and self.pin and not doc["pinned"]:
+                db.set_document_pinned(document_id)
+            return doc
+        finally:
+            db.close()
+
+    def ingest(self, path: str, stat: os.stat_result) -> Dict:
+        """
+        Ingest one file unless its content is already indexed
+
+        Returns:
+            dict: Checkpoint record (path, size, mtime, status, seconds, ...)
+        """
+        record = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime}
+        start_time = time.perf_counter()
+        result = self._ingest(path, record)
+        result["seconds"] = round(time.perf_counter() - start_time, 3)
+        return result
+
+    def _ingest(self, path: str, record: Dict) -> Dict:
+        try:
+            file_hash = compute_file_checksum(path)
+            document_id = RAGDatabase(self.db_path).document_id_from_checksum(file_hash)
+            record.update(file_hash=file_hash, document_id=document_id)
+
+            with self._claimed_lock:
+                claim = self._claimed.get(file_hash)
+                duplicate = claim is not None
+                if not duplicate:
+                    claim = self._claimed[file_hash] = {"path": path, "finished": threading.Event(), "status": None}
+            if duplicate:
+                # A duplicate is only finished once the copy that was ingested is;
+                # otherwise it is failed too, so --retry-failed picks it up
+                claim["finished"].wait()
+                if claim["status"] in FINISHED:
+                    return {**record, "status": "duplicate", "duplicate_of": claim["path"]}
+                return {**record, "status": "failed", "duplicate_of": claim["path"],
+                        "error": f"Duplicate of {claim['path']}, which failed"}
+
+            result = {**record, "status": "failed"}
+            try:
+                result = self._ingest_claimed(path, record, file_hash, document_id)
+                return result
+            finally:
+                claim["status"] = result["status"]
+                claim["finished"].set()
+        except Exception as e:
+            return {**record, "status": "failed", "error": f"{type(e).__name__}: {e}"}
+
+    def _ingest_claimed(self, path: str, record: Dict, file_hash: str, document_id: str) -> Dict:
+        """Ingest a file whose hash this worker claimed"""
+        try:
+            existing = self._existing(document_id)
+            if existing:
+                return {**record, "status": "skipped", "chunks": existing["chunk_count"]}
+
+            with open(path, "rb") as f:
+                stored_path, _ = self.store.put_fileobj(f)
+
+            result = self.assistant.upload_document(stored_path, file_hash=file_hash,
+                                                    filename=os.path.basename(path))
+            if result.get("status") != "success":
+                db = RAGDatabase(self.db_path)
+                db.connect()
+                try:
+                    if not db.file_hash_exists(file_hash):
+                        self.store.remove(file_hash)
+                finally:
+                    db.close()
+                return {**record, "status": "failed", "error": result.get("error")}
+
+            if self.pin:
+                db = RAGDatabase(self.db_path)
+                db.connect()
+                try:
+                    db.set_document_pinned(document_id)
+                finally:
+                    db.close()
+
+            return {**record, "status": "done", "session_id": result.get("session_id"),
+                    "chunks": result.get("chunk_count")}
+        except Exception as e:
+            return {**record, "status": "failed", "error": f"{type(e).__name__}: {e}"}
+
+
+def run(args, out=sys.stdout) -> Tuple[Progress, int]:
+    root = os.path.abspath(args.root)
+    checkpoint_path = args.checkpoint or os.path.join(
+        ".ingest", hashlib.sha1(root.encode("utf-8")).hexdigest()[:12] + ".jsonl"
+    )
+    checkpoint = Checkpoint(checkpoint_path)
+
+    pending: List[Tuple[str, os.stat_result]] = []
+    resumed = 0
+    for path in find_files(root):
+        stat = os.stat(path)
+        if checkpoint.is_finished(path, stat, args.retry_failed):
+            resumed += 1
+            continue
+        pending.append((path, stat))
+    if args.limit:
+        pending = pending[:args.limit]
+
+    total_bytes = sum(stat.st_size for _, stat in pending)
+    print(f"{len(pending)} files to ingest ({total_bytes / (1024 * 1024):.1f} MB), "
+          f"{resumed} already finished according to {checkpoint_path}", file=out)
+
+    progress = Progress(len(pending), total_bytes)
+    if not pending:
+        checkpoint.close()
+        return progress, resumed
+
+    ingestor = Ingestor(args.db, ContentStore(args.store), pin=not args.no_pin)
+    pool = ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="ingest")
+    futures = [pool.submit(ingestor.ingest, path, stat) for path, stat in pending]
+    try:
+        for future in as_completed(futures):
+            record = future.result()
+            checkpoint.write(record)
+            progress.add(record)
+            print(progress.line(record), file=out, flush=True)
+    except KeyboardInterrupt:
+        print("\nInterrupted: finishing the files in progress, run again to resume", file=out)
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        pool.shutdown(wait=True)
+        checkpoint.close()
+    return progress, resumed
+
+
+def main():
+    args = parse_args()
+    if not os.path.isdir(args.root):
+        print(f"Not a directory: {args.root}")
+        return 2
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    out = sys.stdout
+    try:
+        with contextlib.ExitStack() as stack:
+            # The pipeline prints STEP lines for every file; without --verbose
+            # they are discarded and only the progress lines reach the terminal
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            progress, resumed = run(args, out)
+    except KeyboardInterrupt:
+        return 130
+
+    elapsed = time.perf_counter() - progress.started
+    print(
+        f"\nFinished in {format_seconds(elapsed)}: "
+        + ", ".join(f"{count} {status}" for status, count in sorted(progress.counts.items()))
+        + f" ({resumed} finished in earlier runs), {progress.chunks} chunks indexed"
+    )
+    return 1 if progress.counts.get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Connection pool and timeout settings shared by all provider HTTP clients
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# HTTP/2 multiplexes concurrent requests over one connection; needs the optional h2 package
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
+
+# Maximum number of (provider, model, key) clients kept alive
+LLM_CLIENT_CACHE_SIZE = int(os.getenv("LLM_CLIENT_CACHE_SIZE", "64"))
+
+# Accept 'stub' models: a local fake provider with tunable latency, for load tests only
+LLM_STUB_ENABLED = os.getenv("LLM_STUB_ENABLED", "false").lower() in ("1", "true", "yes")
+
+DEFAULT_MODELS = {
+    "google": "gemini-2.0-flash-exp",
+    "groq": "llama-3.1-8b-instant",
+    "openai": "gpt-4o-mini",
+    "stub": "stub",
+}
+
+
+def resolve_provider(model: Optional[str] = None, api_key: Optional[str] = None) -> str:
+    """
+    Work out which provider serves a model (or, without a model, an API key).
+
+    Args:
+        model: Model name, e.g. 'gemini-2.0-flash-exp' or 'llama-3.1-8b-instant'
+        api_key: API key, used for its prefix when no model is given
+
+    Returns:
+        str: 'google', 'groq' or 'openai' (OpenAI is the default), or
+             'stub' for stub models when LLM_STUB_ENABLED is set
+    """
+    if model:
+        name = model.lower()
+        if LLM_STUB_ENABLED and name.startswith("stub"):
+            return "stub"
+        if "gemini" in name:
+            return "google"
+        if "llama" in name or "groq" in name:
+            return "groq"
+        return "openai"
+
+    if api_key:
+        if api_key.startswith("gsk_"):
+            return "groq"
+        if api_key.startswith("AIz"):
+            return "google"
+    return "openai"
+
+
+def hash_api_key(api_key: str) -> str:
+    """Short, non-reversible fingerprint of an API key for cache keys and logs"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _http2_available() -> bool:
+    if not LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class LLMClientRegistry:
+    """
+    Process-wide cache of LLM clients and their HTTP connection pools.
+
+    Chat models are cached per (provider, model, key hash), so switching
+    back and forth between models never rebuilds a client. OpenAI and Groq
+    clients share one tuned httpx client pair per provider, which keeps TLS
+    connections to the provider alive across clients, keys and requests.
+    The Gemini client manages its own transport; caching the instance keeps
+    that transport alive too.
+    """
+
+    def __init__(self, max_clients: int = LLM_CLIENT_CACHE_SIZE):
+        self.max_clients = max_clients
+        self._clients: "OrderedDict[Tuple[str, str, str, float], object]" = OrderedDict()
+        self._http_clients: Dict[str, Tuple[httpx.Client, httpx.AsyncClient]] = {}
+        self._lock = threading.Lock()
+
+    def _get_http_clients(self, provider: str) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        """Shared sync/async httpx clients for a provider (call with the lock held)"""
+        clients = self._http_clients.get(provider)
+        if clients is None:
+            limits = httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            )
+            timeout = httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+            http2 = _http2_available()
+            clients = (
+                httpx.Client(limits=limits, timeout=timeout, http2=http2),
+                httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2),
+            )
+            self._http_clients[provider] = clients
+            logger.info(f"Created HTTP connection pool for {provider} (http2={http2})")
+        return clients
+
+    def _build(self, provider: str, model: str, api_key: str, temperature: float):
+        """Construct a new chat model (call with the lock held)"""
+        if provider == "stub":
+            # Imported here so production workers never load the stub
+            from stub_llm import build_stub_model
+            return build_stub_model(model)
+
+        # Provider SDKs are imported on first use, so a worker only loads the
+        # providers its users actually configured
+        if provider == "google":
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            return ChatGoogleGenerativeAI(
+                google_api_key=api_key,
+                model=model,
+                temperature=temperature,
+                timeout=LLM_READ_TIMEOUT,
+                max_retries=LLM_MAX_RETRIES,
+            )
+
+        http_client, http_async_client = self._get_http_clients(provider)
+
+        if provider == "groq":
+            from langchain_groq import ChatGroq
+            return ChatGroq(
+                api_key=api_key,
+                model=model,
+                temperature=temperature,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=http_client,
+                http_async_client=http_async_client,
+            )
+
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            api_key=api_key,
+            model=model,
+            temperature=temperature,
+            max_retries=LLM_MAX_RETRIES,
+            http_client=http_client,
+            http_async_client=http_async_client,
+        )
+
+    def get(self, provider: str, model: Optional[str], api_key: str, temperature: float = 0.1):
+        """
+        Get a cached chat model, building it on first use.
+
+        Args:
+            provider: 'google', 'groq', 'openai' or 'stub'
+            model: Model name (provider default if None)
+            api_key: API key for the provider
+            temperature: Sampling temperature
+
+        Returns:
+            A LangChain chat model
+        """
+        model = model or DEFAULT_MODELS.get(provider, DEFAULT_MODELS["openai"])
+        key = (provider, model, hash_api_key(api_key), temperature)
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+
+            client = self._build(provider, model, api_key, temperature)
+            self._clients[key] = client
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+
+        logger.info(f"Created {provider} client for {model} (key {key[2][:8]}...)")
+        return client
+
+    def close(self, loop: Optional[asyncio.AbstractEventLoop] = None, timeout: float = 5.0):
+        """
+        Close all pooled HTTP connections
+
+        Args:
+            loop: Event loop the async clients are used on (the LLM router's).
+                  They are closed there, since httpx connections belong to the
+                  loop that opened them; without a running loop none were opened.
+            timeout: Seconds to wait for each async client to close
+        """
+        with self._lock:
+            http_clients = list(self._http_clients.items())
+            self._http_clients.clear()
+            self._clients.clear()
+
+        for provider, (http_client, http_async_client) in http_clients:
+            http_client.close()
+            if loop is None or not loop.is_running():
+                continue
+            try:
+                asyncio.run_coroutine_threadsafe(http_async_client.aclose(), loop).result(timeout)
+            except Exception as e:
+                logger.warning(f"Could not close async HTTP client of {provider}: {type(e).__name__}: {e}")
+
+
+# Shared registry used by every RAGAssistant in the process
+registry = LLMClientRegistry()
+
+
+def get_llm_client(provider: str, model: Optional[str], api_key: str, temperature: float = 0.1):
+    """Shortcut for registry.get()"""
+    return registry.get(provider, model, api_key, temperature)
@@ -0,0 +1,267 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Send a second request to the next healthy provider when the first one is slow
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() in ("1", "true", "yes")
+
+# Hedge deadline = p95 latency of the primary * multiplier, clamped to [min, max].
+# Until enough samples exist the default deadline is used.
+LLM_HEDGE_MULTIPLIER = float(os.getenv("LLM_HEDGE_MULTIPLIER", "1.0"))
+LLM_HEDGE_MIN_DEADLINE = float(os.getenv("LLM_HEDGE_MIN_DEADLINE", "1.0"))
+LLM_HEDGE_MAX_DEADLINE = float(os.getenv("LLM_HEDGE_MAX_DEADLINE", "30"))
+LLM_HEDGE_DEFAULT_DEADLINE = float(os.getenv("LLM_HEDGE_DEFAULT_DEADLINE", "8"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Circuit breaker: open after this many consecutive failures, retry after the cooldown
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# Number of recent latencies kept per provider
+LATENCY_WINDOW = 200
+
+
+class ProviderHealth:
+    """
+    Rolling latency window and circuit breaker of one provider/model
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.successes = 0
+        self.failures = 0
+        # A call is probing a half-open circuit
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def p95(self) -> Optional[float]:
+        """95th percentile of recent successful call latencies (None if too few samples)"""
+        with self._lock:
+            if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def available(self) -> bool:
+        """Closed, or open but past its cooldown (half-open: one trial is allowed)"""
+        with self._lock:
+            if not self.open_until:
+                return True
+            return time.monotonic() >= self.open_until and not self.trial_running
+
+    def start_call(self):
+        """Mark a call that starts on a half-open circuit as its trial"""
+        with self._lock:
+            if self.open_until and time.monotonic() >= self.open_until:
+                self.trial_running = True
+
+    def cancel_call(self):
+        """A call ended without an outcome (it lost a hedge race)"""
+        with self._lock:
+            self.trial_running = False
+
+    def record_success(self, seconds: float):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+            self.trial_running = False
+            self.successes += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.trial_running = False
+            self.consecutive_failures += 1
+            self.failures += 1
+            if self.consecutive_failures >= LLM_BREAKER_FAILURES:
+                self.open_until = time.monotonic() + LLM_BREAKER_COOLDOWN
+                logger.warning(
+                    f"Circuit opened for {self.name} after {self.consecutive_failures} failures "
+                    f"(retry in {LLM_BREAKER_COOLDOWN:.0f}s)"
+                )
+
+    def snapshot(self) -> Dict:
+        p95 = self.p95()
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "circuit_open": not self.available(),
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class ProviderRouter:
+    """
+    Routes one LLM call across several configured providers
+
+    Candidates are tried in order, skipping providers whose circuit is
+    open. A failed call fails over to the next candidate. With hedging on,
+    a call that outlives the primary's p95-based deadline gets a duplicate
+    request to the next candidate; whichever answers first wins and the
+    other is cancelled.
+
+    Calls run on a private event loop thread, so synchronous callers
+    (FastAPI's threadpool, Streamlit) get real task cancellation, and the
+    pooled async HTTP clients are always used from the same loop.
+    Candidates are any runnables with ainvoke(), so local fake chat
+    models work in place of real providers.
+    """
+
+    def __init__(self, hedging: bool = LLM_HEDGING):
+        self.hedging = hedging
+        self._health: Dict[str, ProviderHealth] = {}
+        self._health_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    def health(self, name: str) -> ProviderHealth:
+        with self._health_lock:
+            health = self._health.get(name)
+            if health is None:
+                health = self._health[name] = ProviderHealth(name)
+            return health
+
+    def stats(self) -> Dict[str, Dict]:
+        """Health snapshot of every provider seen so far"""
+        with self._health_lock:
+            names = list(self._health)
+        return {name: self.health(name).snapshot() for name in names}
+
+    def deadline_for(self, name: str) -> float:
+        """How long to wait for a provider before hedging"""
+        p95 = self.health(name).p95()
+        if p95 is None:
+            return LLM_HEDGE_DEFAULT_DEADLINE
+        return min(LLM_HEDGE_MAX_DEADLINE, max(LLM_HEDGE_MIN_DEADLINE, p95 * LLM_HEDGE_MULTIPLIER))
+
+    @property
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        """The private event loop, or None if no call has started it yet"""
+        return self._loop
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-router", daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def invoke(self, candidates: Sequence[Tuple[str, Any]], inputs: Dict) -> Tuple[Any, str]:
+        """
+        Run the call from synchronous code
+
+        Args:
+            candidates: (name, runnable) pairs, primary first
+            inputs: Inputs passed to runnable.ainvoke()
+
+        Returns:
+            tuple: (result, name of the provider that answered)
+        """
+        future = asyncio.run_coroutine_threadsafe(self.ainvoke(candidates, inputs), self._get_loop())
+        return future.result()
+
+    async def _timed_call(self, name: str, runnable, inputs: Dict):
+        health = self.health(name)
+        health.start_call()
+        start_time = time.perf_counter()
+        try:
+            result = await runnable.ainvoke(inputs)
+        except asyncio.CancelledError:
+            # Lost a hedge race: neither a success nor a failure
+            health.cancel_call()
+            raise
+        except Exception as e:
+            health.record_failure()
+            logger.warning(f"LLM call to {name} failed: {type(e).__name__}: {e}")
+            raise
+        health.record_success(time.perf_counter() - start_time)
+        return result
+
+    async def ainvoke(self, candidates: Sequence[Tuple[str, Any]], inputs: Dict) -> Tuple[Any, str]:
+        """
+        Run the call with failover and optional hedging
+
+        Args:
+            candidates: (name, runnable) pairs, primary first
+            inputs: Inputs passed to runnable.ainvoke()
+
+        Returns:
+            tuple: (result, name of the provider that answered)
+
+        Raises:
+            The last provider error if every candidate failed
+        """
+        if not candidates:
+            raise ValueError("No LLM provider configured")
+
+        # Healthy providers keep their configured order; open circuits are only
+        # tried when nothing else is left
+        queue: List[Tuple[str, Any]] = (
+            [c for c in candidates if self.health(c[0]).available()]
+            or list(candidates)
+        )
+
+        loop = asyncio.get_running_loop()
+        pending: Dict[asyncio.Task, str] = {}
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            name, runnable = queue.pop(0)
+            pending[loop.create_task(self._timed_call(name, runnable, inputs))] = name
+            return name
+
+        primary = launch()
+        hedge_at = loop.time() + self.deadline_for(primary) if self.hedging else None
+
+        try:
+            while pending:
+                timeout = None
+                if hedge_at is not None and queue:
+                    timeout = max(0.0, hedge_at - loop.time())
+
+                done, _ = await asyncio.wait(
+                    list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    # The primary is slower than its deadline: race it against the next provider
+                    hedge = launch()
+                    hedge_at = None
+                    logger.info(f"Hedging slow call to {primary} with {hedge}")
+                    continue
+
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result(), name
+                    last_error = task.exception()
+
+                # Everything that finished failed: fail over if nothing is still running
+                if not pending and queue:
+                    logger.info(f"Failing over to {queue[0][0]}")
+                    # The failover is hedged on its own deadline, not the failed primary's
+                    primary = launch()
+                    hedge_at = loop.time() + self.deadline_for(primary) if self.hedging else None
+        finally:
+            # Cancel the loser(s) of a hedge race
+            for task in pending:
+                task.cancel()
+
+        raise last_error or RuntimeError("All LLM providers failed")
+
+
+# Shared router used by every RAGAssistant in the process
+router = ProviderRouter()
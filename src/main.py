@@ -1,21 +1,47 @@
 import os
-import shutil
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Union
 from dotenv import load_dotenv, set_key
 import time
+import json
+import asyncio
+import itertools
+from contextlib import asynccontextmanager, nullcontext
 from pathlib import Path
 
-from app import RAGAssistant
+from app import RAGAssistant, QUERY_MANY_CONCURRENCY
 from database import RAGDatabase
+from utils import stream_upload_to_disk, MAX_UPLOAD_SIZE_MB
+from extraction import get_pdf_page_count
+from llm_clients import registry as llm_registry
+from llm_router import router as llm_router
+from config_store import ConfigStore, AssistantConfig, DEFAULT_USER_ID
+from storage import ContentStore, collect_garbage
+from maintenance import MaintenanceTask
+from metrics import collect_timings, render_metrics
+from profiling import profile_for, profile_request, PROFILE_INTERVAL_MS
 
 # -------------------------------------------------
 # App setup
 # -------------------------------------------------
 
-app = FastAPI(title="RAG Backend API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cheap: tables and the prompt template. Heavy models load in the background.
+    initialize_assistant()
+    warmup_task = asyncio.create_task(warm_up())
+    # Session expiry, cold-collection eviction and garbage collection
+    maintenance.start()
+    yield
+    warmup_task.cancel()
+    await maintenance.stop()
+    # Async HTTP clients are closed on the router's loop, where they were used
+    await asyncio.to_thread(llm_registry.close, llm_router.loop)
+
+app = FastAPI(title="RAG Backend API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,7 +54,7 @@ app.add_middleware(
 # Load environment variables
 load_dotenv()
 
-# Global variable to store the assistant instance
+# One shared, stateless assistant. LLM settings are resolved per request.
 assistant = None
 db = RAGDatabase("rag_engine.db")
 db.connect()
@@ -37,8 +63,26 @@ db.create_tables()
 UPLOAD_DIR = "data"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Global variable to track the current model
-current_model = None
+# Uploads are stored by content hash under data/<hash-prefix>/<hash>
+store = ContentStore(UPLOAD_DIR)
+
+# Background maintenance (session TTL and interval come from the environment)
+maintenance = MaintenanceTask(db.db_path, store)
+
+# Admin endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Per-user API key / model configs, cached in memory
+config_store = ConfigStore(db.db_path)
+
+# Load the embedding model, ChromaDB and the default user's LLM client in the
+# background after startup. /health answers at once; /ready only after this.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# Failed warm-ups are retried with doubling delays; after the last attempt the
+# worker reports ready anyway and components load on first use
+WARMUP_ATTEMPTS = int(os.getenv("WARMUP_ATTEMPTS", "4"))
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", "5"))
+readiness = {"ready": False, "steps": {}, "error": None}
 
 # -------------------------------------------------
 # Helper functions
@@ -47,40 +91,109 @@ current_model = None
 def get_assistant():
     global assistant
     if assistant is None:
-        raise HTTPException(status_code=400, detail="API key is required. Please upload an API key first.")
+        raise HTTPException(status_code=503, detail="Assistant is not initialized yet.")
     return assistant
 
+def get_user_id(x_user_id: Optional[str] = Header(default=None)) -> str:
+    """Tenant of the request (X-User-Id header, single-user default otherwise)"""
+    return x_user_id or DEFAULT_USER_ID
+
+def get_assistant_config(user_id: str = Depends(get_user_id)) -> AssistantConfig:
+    """Resolve the caller's immutable LLM config for this request"""
+    config = config_store.get(user_id)
+    if config is None:
+        raise HTTPException(status_code=400, detail="API key is required. Please upload an API key first.")
+    return config
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """Allow a request only if it carries the configured admin token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled. Set ADMIN_TOKEN to enable them.")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def get_profile_options(
+    x_profile: Optional[str] = Header(default=None),
+    x_profile_allocations: Optional[str] = Header(default=None),
+    x_admin_token: Optional[str] = Header(default=None),
+) -> Optional[dict]:
+    """
+    Per-request profiling options (admin only)
+
+    X-Profile: 'sample' (stack sampling) or 'cprofile'
+    X-Profile-Allocations: 'true' to also record tracemalloc hot spots
+    """
+    if not x_profile:
+        return None
+    require_admin(x_admin_token)
+    mode = x_profile.strip().lower()
+    if mode not in ("sample", "cprofile", "1", "true"):
+        raise HTTPException(status_code=400, detail="X-Profile must be 'sample' or 'cprofile'")
+    allocations = (x_profile_allocations or "").strip().lower() in ("1", "true", "yes")
+    return {"mode": "cprofile" if mode == "cprofile" else "sample", "allocations": allocations}
+
 def initialize_assistant():
-    """Initialize assistant from database on startup"""
-    global assistant, current_model
+    """Create the shared assistant (cheap; models and clients load in warm_up)"""
+    global assistant
     
     if assistant is None:
-        # Always create assistant first (without API key)
+        # The assistant itself holds no API key; configs are resolved per request
         assistant = RAGAssistant(require_api_key=False, model=None)
-
-        # Load from DATABASE instead of .env
-        key_data = db.get_api_key()
-        
-        if key_data:
-            current_model = key_data["model"]
-            api_key = key_data["api_key"]
-            
-        # Set the API key after initialization
-            assistant.set_api_key(api_key, current_model)
-            print(f"✅ Assistant initialized from database with model: {current_model}")
-        else:
-            print("⚠️ No API key found in database - assistant ready but LLM not configured")
     
     return assistant
 
+def warm_up_components() -> dict:
+    """Load heavy components ahead of the first request (runs in a worker thread)"""
+    # Imported here: this is where chromadb and torch get loaded
+    from vectordb import warm_up as warm_up_vector_db
+
+    steps = warm_up_vector_db()
+
+    # Load from DATABASE instead of .env
+    start_time = time.perf_counter()
+    config = config_store.get(DEFAULT_USER_ID)
+    if config:
+        # Imports only this provider's SDK and opens its connection pool
+        assistant.chain_for(config)
+        steps["llm_client"] = round(time.perf_counter() - start_time, 3)
+        print(f"✅ Assistant initialized from database with model: {config.model}")
+    else:
+        print("⚠️ No API key found in database - assistant ready but LLM not configured")
+    return steps
+
+async def warm_up():
+    """Background warm-up; marks the worker ready when done"""
+    if not WARMUP_ON_STARTUP:
+        readiness["ready"] = True
+        return
+    start_time = time.perf_counter()
+    attempts = max(1, WARMUP_ATTEMPTS)
+    for attempt in range(1, attempts + 1):
+        try:
+            readiness["steps"] = await asyncio.to_thread(warm_up_components)
+            readiness["steps"]["total"] = round(time.perf_counter() - start_time, 3)
+            readiness["error"] = None
+            break
+        except Exception as e:
+            readiness["error"] = f"{type(e).__name__}: {e}"
+            if attempt == attempts:
+                # Requests still work (components load on first use), so a
+                # transient failure must not keep the worker out of rotation
+                print(f"Warm-up failed {attempts} times, reporting ready anyway: {readiness['error']}")
+                break
+            delay = WARMUP_RETRY_DELAY * 2 ** (attempt - 1)
+            print(f"Warm-up attempt {attempt} failed, retrying in {delay:.0f}s: {readiness['error']}")
+            await asyncio.sleep(delay)
+    readiness["ready"] = True
+
 # Helper to get file info
-def get_file_info(filepath):
-    """Extract metadata from a file"""
+def get_file_info(filepath, file_ext=None):
+    """Extract metadata from a file (pass file_ext for extensionless blobs)"""
     file_stats = os.stat(filepath)
     file_size = file_stats.st_size
     
     # Determine file type
-    file_ext = Path(filepath).suffix.lower()
+    file_ext = (file_ext or Path(filepath).suffix).lower()
     
     metadata = {
         "file_size": file_size,
@@ -88,21 +201,18 @@ def get_file_info(filepath):
         "file_extension": file_ext,
     }
     
-    # For PDF files, try to get page count
+    # For PDF files, try to get page count (PyMuPDF only reads the page tree)
     if file_ext == ".pdf":
         try:
-            import pypdf
-            with open(filepath, 'rb') as f:
-                pdf = pypdf.PdfReader(f)
-                metadata["page_count"] = len(pdf.pages)
+            metadata["page_count"] = get_pdf_page_count(filepath)
         except Exception as e:
             print(f"Could not read PDF page count: {e}")
             metadata["page_count"] = 0
     else:
-        # For text files, count lines as "pages"
+        # For text files, count lines as "pages" (in binary blocks, any encoding, any size)
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                lines = sum(1 for _ in f)
+            with open(filepath, 'rb') as f:
+                lines = sum(block.count(b"\n") for block in iter(lambda: f.read(1024 * 1024), b""))
                 metadata["page_count"] = max(1, lines // 50)  # Estimate ~50 lines per page
         except Exception as e:
             print(f"Could not count text lines: {e}")
@@ -110,9 +220,6 @@ def get_file_info(filepath):
     
     return metadata
 
-# Initialize assistant on startup if API keys are available
-initialize_assistant()
-
 # -------------------------------------------------
 # Schemas
 # -------------------------------------------------
@@ -120,11 +227,43 @@ initialize_assistant()
 class MessageRequest(BaseModel):
     session_id: str
     content: str
+    role: str = "user"
+    # Retries with the same key never add a second row (also accepted as Idempotency-Key header)
+    idempotency_key: Optional[str] = None
+
+class ChatRequest(BaseModel):
+    session_id: str
+    question: str
+    n_results: int = 3
+    # Retries with the same key replay the stored answer (also accepted as Idempotency-Key header)
+    idempotency_key: Optional[str] = None
+    debug: bool = False
+
+class QueryFilters(BaseModel):
+    # Pages a chunk overlaps (PDFs, 1-based, inclusive)
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    # Detected heading, or several (see "sections" of GET /document/{session_id})
+    section: Optional[Union[str, List[str]]] = None
+    # chunk_index window (inclusive)
+    chunk_from: Optional[int] = None
+    chunk_to: Optional[int] = None
 
 class QueryRequest(BaseModel):
     session_id: str
     question: str
     n_results: int = 3
+    # Search only the matching chunks
+    filters: Optional[QueryFilters] = None
+    # Include per-stage timings in the response
+    debug: bool = False
+
+class BatchQueryRequest(BaseModel):
+    session_id: str
+    questions: List[str]
+    n_results: int = 3
+    # Concurrent LLM calls for this batch (capped at QUERY_MANY_CONCURRENCY)
+    max_concurrency: Optional[int] = None
 
 class ApiKeyRequest(BaseModel):
     api_key: str
@@ -136,51 +275,74 @@ class ApiKeyRequest(BaseModel):
 
 @app.get("/health")
 def health():
+    """Liveness: the process is up and serving HTTP"""
     return {"status": "ok"}
 
+@app.get("/ready")
+def ready():
+    """
+    Readiness: models and clients are loaded, so requests won't pay for cold starts
+    """
+    if readiness["ready"]:
+        return {"status": "ready", "warmup_seconds": readiness["steps"], "warmup_error": readiness["error"]}
+    return JSONResponse(
+        status_code=503,
+        content={"status": "retrying" if readiness["error"] else "starting", "error": readiness["error"]},
+    )
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus metrics: per-stage and end-to-end latency histograms
+    """
+    rendered = render_metrics()
+    if rendered is None:
+        raise HTTPException(status_code=503, detail="prometheus_client is not installed")
+    body, content_type = rendered
+    return Response(content=body, media_type=content_type)
+
 # ---------- Upload document ----------
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(
+    file: UploadFile = File(...),
+    user_id: str = Depends(get_user_id),
+    profile: Optional[dict] = Depends(get_profile_options),
+):
     # 1. Check file extension
     if not file.filename.lower().endswith((".pdf", ".txt")):
         raise HTTPException(status_code=400, detail="Only PDF or TXT files allowed")
 
     # 2. Check API key FIRST (before saving anything)
-    try:
-        assistant_instance = get_assistant()
-    except HTTPException:
+    if config_store.get(user_id) is None:
         raise HTTPException(status_code=400, detail="API key is required before uploading a document.")
+    assistant_instance = get_assistant()
 
-    # 3. Check file size
-    MAX_FILE_SIZE = 25 * 1024 * 1024  # 25MB
-    file_content = await file.read()
-    file_size = len(file_content)
-    
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"File size ({file_size / (1024*1024):.2f}MB) exceeds maximum allowed size (25MB)"  # ✅ Fixed
-        )
-    
-    # 4. Reset file pointer
-    await file.seek(0)
+    # 3. Stream the upload to a temp file, enforcing the size limit and hashing as we go
+    temp_path, file_size, file_hash = await stream_upload_to_disk(
+        file, UPLOAD_DIR, max_size_mb=MAX_UPLOAD_SIZE_MB
+    )
 
-    # 5. NOW save file (only if all checks pass)
-    filepath = os.path.join(UPLOAD_DIR, file.filename)
-    with open(filepath, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    # 4. Atomically move the complete file into the content-addressed store
+    filepath = store.put(temp_path, file_hash)
 
-    # 6. Process document (utils.py validation happens here)
+    # 5. Process document (utils.py validation happens here)
     start_time = time.time()
-    file_metadata = get_file_info(filepath)
-    result = assistant_instance.upload_document(filepath)
+    file_metadata = get_file_info(filepath, Path(file.filename).suffix)
+    # Profiled uploads always record allocation hot spots: ingestion is where memory goes
+    profiling = profile_request(profile["mode"], allocations=True) if profile else nullcontext()
+    with profiling as profiled, collect_timings("upload") as timings:
+        result = assistant_instance.upload_document(filepath, file_hash=file_hash, filename=file.filename,
+                                                    config=config_store.get(user_id))
+        timings.status = result.get("status")
     processing_time = time.time() - start_time
 
-    # 7. Handle errors and cleanup
+    # 6. Handle errors and cleanup (the blob may be shared with an existing document)
+    if result.get("status") == "processing":
+        raise HTTPException(status_code=409, detail=result.get("error"))
     if result.get("status") == "error":
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        if not db.file_hash_exists(file_hash):
+            store.remove(file_hash)
         raise HTTPException(status_code=500, detail=result.get("error"))
     
     # Enhanced response with comprehensive metadata
@@ -203,20 +365,25 @@ async def upload_file(file: UploadFile = File(...)):
         "chunks": result.get("chunk_count", result.get("chunks", 0)),
         # Performance metrics
         "processing_time": round(processing_time, 2),
+        "timings": timings.as_dict(),
         # Timestamp
         "uploaded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
     }
     
+    if profiled:
+        response["profile"] = profiled.report
+    
     return response
 
 # API key endpoint with including the model
 @app.post("/api-key")
-async def save_api_key(request: ApiKeyRequest):
+async def save_api_key(request: ApiKeyRequest, user_id: str = Depends(get_user_id)):
     """
     Save API key to DATABASE (not .env file!)
-    """
-    global assistant, current_model
     
+    Publishes a new immutable config for the user; requests already in
+    flight keep the config they started with.
+    """
     try:
         api_key = request.api_key
         model = request.model
@@ -227,47 +394,32 @@ async def save_api_key(request: ApiKeyRequest):
         if not model:
             raise HTTPException(status_code=400, detail="Model selection is required")
         
-        # Determine provider based on model
-        if "gemini" in model.lower():
-            provider = "google"
-        elif "llama" in model.lower() or "groq" in model.lower():
-            provider = "groq"
-        elif "gpt" in model.lower():
-            provider = "openai"
-        else:
-            provider = "unknown"
-        
-        # Save to DATABASE instead of .env
-        db.save_api_key(api_key, model, provider)
+        # Save to DATABASE instead of .env (provider is derived from the model)
+        config = config_store.save(api_key, model, user_id=user_id)
         
-        # Store the current model globally
-        current_model = model
-        
-        # Initialize or update the assistant
-        if assistant is None:
-            assistant = RAGAssistant(require_api_key=False, model=model)
-            assistant.set_api_key(api_key, model)
-        else:
-            assistant.set_api_key(api_key, model)
+        # Build (or reuse) the client now so the first query doesn't pay for it
+        get_assistant().chain_for(config)
         
         return {"status": "success", "message": f"API key saved for {model}"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save API key: {str(e)}")
     
 # API key status endpoint - returns the model
 @app.get("/api-key-status")
-async def check_api_key_status():
+async def check_api_key_status(user_id: str = Depends(get_user_id)):
     """
     Check if an API key is stored in DATABASE
     """
     try:
-        # ✅ Check DATABASE instead of environment
-        key_data = db.get_api_key()
+        # ✅ Check DATABASE instead of environment (through the config cache)
+        config = config_store.get(user_id)
         
-        if key_data:
+        if config:
             return {
                 "has_api_key": True,
-                "model": key_data["model"],
+                "model": config.model,
                 "success": True
             }
         else:
@@ -279,26 +431,74 @@ async def check_api_key_status():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to check API key status: {str(e)}")
     
+# ---------- Chat turn ----------
+
+@app.post("/chat")
+def chat_turn(
+    body: ChatRequest,
+    assistant_instance: RAGAssistant = Depends(get_assistant),
+    config: AssistantConfig = Depends(get_assistant_config),
+    idempotency_key: Optional[str] = Header(default=None),
+):
+    """
+    Answer a question and store the question and answer together
+
+    One retrieval and one LLM call per turn. Clients should send a fresh
+    idempotency key per question and reuse it when retrying.
+    """
+    if not body.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    with collect_timings("query") as timings:
+        result = assistant_instance.chat_turn(
+            question=body.question,
+            session_id=body.session_id,
+            n_results=body.n_results,
+            config=config,
+            idempotency_key=body.idempotency_key or idempotency_key,
+        )
+        timings.status = result.get("status")
+
+    if result.get("status") == "not_ready":
+        raise HTTPException(status_code=409, detail=result.get("error"))
+    if result.get("status") == "error":
+        raise HTTPException(status_code=500, detail=result.get("error"))
+
+    if body.debug:
+        result["debug"] = {"timings": timings.as_dict()}
+
+    return result
+
 # ---------- Send message ----------
 
 @app.post("/messages")
-def send_message(body: MessageRequest, assistant_instance: RAGAssistant = Depends(get_assistant)):
+def send_message(body: MessageRequest, idempotency_key: Optional[str] = Header(default=None)):
+    """
+    Append a message to a session's history (no retrieval, no LLM call)
+
+    Use /chat to ask a question; this endpoint only records messages.
+    """
     if not body.content.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
+    if body.role not in ("user", "assistant"):
+        raise HTTPException(status_code=400, detail="Role must be 'user' or 'assistant'")
 
-    result = assistant_instance.query(
-        question=body.content,
-        session_id=body.session_id,
-        n_results=3
-    )
+    message_db = RAGDatabase(db.db_path)
+    message_db.connect()
+    try:
+        if not message_db.get_session_info(body.session_id):
+            raise HTTPException(status_code=404, detail="Session not found")
+        message = message_db.append_message(
+            body.session_id, body.role, body.content,
+            idempotency_key=body.idempotency_key or idempotency_key,
+        )
+    finally:
+        message_db.close()
 
-    if result.get("status") != "success":
-        raise HTTPException(status_code=500, detail=result.get("error"))
+    if message is None:
+        raise HTTPException(status_code=500, detail="Could not save message")
 
-    return {
-        "message_id": None,
-        "content": result["answer"]
-    }
+    return message
 
 # ---------- Get messages ----------
 
@@ -330,10 +530,10 @@ def get_document(session_id: str):
         raise HTTPException(status_code=404, detail="No document found")
     
     # Enhance document info with file metadata if available
-    filepath = os.path.join(UPLOAD_DIR, doc.get("filename", ""))
+    filepath = store.path_for(doc["file_hash"])
     
     if os.path.exists(filepath):
-        file_metadata = get_file_info(filepath)
+        file_metadata = get_file_info(filepath, Path(doc.get("filename", "")).suffix)
         doc.update(file_metadata)
     
     # Ensure consistent key names for frontend
@@ -341,19 +541,154 @@ def get_document(session_id: str):
     doc["chunk_count"] = doc.get("chunk_count", doc.get("chunks", 0))
     doc["from_cache"] = doc.get("from_cache", doc.get("was_processed", False))
     
+    # Headings detected at ingestion, usable as /query section filters
+    doc["sections"] = db.get_document_sections(doc["document_id"])
+    
     return doc
 
 # ---------- Query endpoint ----------
 
 @app.post("/query")
-def query_document(body: QueryRequest, assistant_instance: RAGAssistant = Depends(get_assistant)):
-    result = assistant_instance.query(
-        question=body.question,
-        session_id=body.session_id,
-        n_results=body.n_results
-    )
-
-    if result.get("status") != "success":
+def query_document(
+    body: QueryRequest,
+    assistant_instance: RAGAssistant = Depends(get_assistant),
+    config: AssistantConfig = Depends(get_assistant_config),
+    profile: Optional[dict] = Depends(get_profile_options),
+):
+    profiling = profile_request(**profile) if profile else nullcontext()
+    with profiling as profiled, collect_timings("query") as timings:
+        result = assistant_instance.query(
+            question=body.question,
+            session_id=body.session_id,
+            n_results=body.n_results,
+            config=config,
+            filters=body.filters.model_dump() if body.filters else None,
+        )
+        timings.status = result.get("status")
+
+    if result.get("status") == "invalid_filters":
+        raise HTTPException(status_code=400, detail=result.get("error"))
+    if result.get("status") == "not_ready":
+        raise HTTPException(status_code=409, detail=result.get("error"))
+    # Nothing close enough to the question is an answer, not a server error
+    if result.get("status") not in ("success", "no_results"):
         raise HTTPException(status_code=500, detail=result.get("error"))
 
+    if body.debug:
+        result["debug"] = {"timings": timings.as_dict()}
+    
+    if profiled:
+        result["profile"] = profiled.report
+
     return result
+
+
+# ---------- Batch query endpoint ----------
+
+@app.post("/query/batch")
+def query_batch(
+    body: BatchQueryRequest,
+    assistant_instance: RAGAssistant = Depends(get_assistant),
+    config: AssistantConfig = Depends(get_assistant_config),
+):
+    """
+    Answer many questions about one document, streaming NDJSON results
+
+    Each line is one question's result (with its index in the request) in
+    completion order; a failed question has status 'error' and does not
+    stop the batch. The last line is a summary.
+    """
+    concurrency = min(body.max_concurrency or QUERY_MANY_CONCURRENCY, QUERY_MANY_CONCURRENCY)
+    start_time = time.perf_counter()
+    items = assistant_instance.query_many(
+        body.questions, body.session_id, n_results=body.n_results,
+        config=config, max_concurrency=concurrency,
+    )
+
+    # Retrieval runs before the first item, so setup errors still get a status code
+    first = next(items, None)
+    if first is not None and first.get("index") is None:
+        status_code = 409 if first.get("status") == "not_ready" else 400
+        raise HTTPException(status_code=status_code, detail=first.get("error"))
+
+    def lines():
+        counts = {"success": 0, "error": 0}
+        for item in itertools.chain([first] if first else [], items):
+            counts["error" if item.get("status") == "error" else "success"] += 1
+            yield json.dumps(item) + "\n"
+        yield json.dumps({"summary": {
+            "questions": len(body.questions),
+            "answered": counts["success"],
+            "failed": counts["error"],
+            "total_ms": round((time.perf_counter() - start_time) * 1000, 1),
+        }}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# ---------- Storage garbage collection ----------
+
+@app.post("/admin/gc", dependencies=[Depends(require_admin)])
+def run_garbage_collection():
+    """
+    Remove files, ChromaDB collections and rows of documents no session references
+    """
+    gc_db = RAGDatabase(db.db_path)
+    gc_db.connect()
+    try:
+        return {"status": "success", "stats": collect_garbage(gc_db, store)}
+    finally:
+        gc_db.close()
+
+
+# ---------- Session expiry / maintenance ----------
+
+@app.get("/admin/maintenance", dependencies=[Depends(require_admin)])
+def get_maintenance_stats():
+    """
+    Stats of the last background maintenance run
+    """
+    return {"status": "success", "stats": maintenance.last_stats}
+
+@app.post("/admin/maintenance", dependencies=[Depends(require_admin)])
+async def run_maintenance_now():
+    """
+    Expire idle sessions, evict their collections and collect garbage right away
+    """
+    return {"status": "success", "stats": await maintenance.run_once()}
+
+
+# ---------- LLM provider health ----------
+
+@app.get("/admin/providers", dependencies=[Depends(require_admin)])
+def get_provider_stats():
+    """
+    Latency, failure counts and circuit-breaker state of every LLM provider
+    """
+    return {"status": "success", "hedging": llm_router.hedging, "providers": llm_router.stats()}
+
+
+# ---------- Profiling ----------
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def run_profiler(seconds: float = 10, interval_ms: float = PROFILE_INTERVAL_MS, format: str = "json"):
+    """
+    Sample the stacks of every thread for a number of seconds
+
+    format=json returns top functions plus collapsed stacks; format=collapsed
+    returns a flamegraph-ready file (flamegraph.pl, speedscope, inferno).
+    """
+    if format not in ("json", "collapsed"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'collapsed'")
+    try:
+        report = await asyncio.to_thread(profile_for, seconds, interval_ms)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    if format == "collapsed":
+        filename = time.strftime("profile-%Y%m%dT%H%M%SZ.collapsed", time.gmtime())
+        return PlainTextResponse(
+            report["collapsed"],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+    return {"status": "success", "profile": report}
@@ -0,0 +1,134 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from database import RAGDatabase
+from storage import ContentStore, collect_garbage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Sessions idle for longer than this are deleted (default: 7 days)
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# How often the background task runs (0 disables it)
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "3600"))
+
+
+def _dir_size(path: str) -> int:
+    """Total size in bytes of all files below path"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                continue
+    return total
+
+
+def run_maintenance(db_path: str, store: ContentStore, ttl_seconds: Optional[int] = None) -> Dict:
+    """
+    Expire idle sessions, evict their cached collections and collect garbage
+
+    Args:
+        db_path: Path to the SQLite database file
+        store: ContentStore holding the uploaded files
+        ttl_seconds: Idle time after which a session expires
+
+    Returns:
+        dict: Stats on what was expired and how much space was reclaimed
+    """
+    # Imported here so maintenance never pulls ChromaDB into modules that only import this one
+    from vectordb import CHROMA_PATH, evict_vector_db
+
+    if ttl_seconds is None:
+        ttl_seconds = SESSION_TTL_SECONDS
+
+    start_time = time.time()
+    chroma_bytes_before = _dir_size(CHROMA_PATH)
+
+    db = RAGDatabase(db_path)
+    db.connect()
+    try:
+        expired = db.expire_sessions(ttl_seconds)
+
+        # Cold collections: their sessions are gone, so drop the in-memory handles.
+        # Documents still used by other sessions are reopened on their next query.
+        evicted = sum(1 for name in expired["collection_names"] if evict_vector_db(name))
+
+        gc_stats = collect_garbage(db, store)
+    finally:
+        db.close()
+
+    stats = {
+        "sessions_expired": expired["sessions_expired"],
+        "messages_deleted": expired["messages_deleted"],
+        "collections_evicted": evicted,
+        **gc_stats,
+        "chroma_bytes_freed": max(0, chroma_bytes_before - _dir_size(CHROMA_PATH)),
+        "duration": round(time.time() - start_time, 3),
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+    logger.info(f"Maintenance finished: {stats}")
+    return stats
+
+
+class MaintenanceTask:
+    """
+    Runs run_maintenance() periodically on the event loop's default executor
+    and keeps the stats of the last run
+    """
+
+    def __init__(self, db_path: str, store: ContentStore,
+                 interval_seconds: int = MAINTENANCE_INTERVAL_SECONDS,
+                 ttl_seconds: int = SESSION_TTL_SECONDS):
+        self.db_path = db_path
+        self.store = store
+        self.interval_seconds = interval_seconds
+        self.ttl_seconds = ttl_seconds
+        self.last_stats: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def run_once(self) -> Dict:
+        """Run one maintenance pass without blocking the event loop"""
+        async with self._lock:
+            self.last_stats = await asyncio.to_thread(
+                run_maintenance, self.db_path, self.store, self.ttl_seconds
+            )
+            return self.last_stats
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run_once()
+            except Exception as e:
+                # Keep the loop alive, the next pass will retry
+                logger.error(f"Maintenance run failed: {e}")
+
+    def start(self):
+        """Start the periodic task (no-op if the interval is 0)"""
+        if self.interval_seconds <= 0:
+            logger.info("Background maintenance disabled")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+            logger.info(
+                f"Background maintenance every {self.interval_seconds}s "
+                f"(session TTL {self.ttl_seconds}s)"
+            )
+
+    async def stop(self):
+        """Cancel the periodic task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,213 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Also emit every stage as an OpenTelemetry span (needs opentelemetry-api and a configured SDK)
+METRICS_OTEL_SPANS = os.getenv("METRICS_OTEL_SPANS", "false").lower() in ("1", "true", "yes")
+
+# Histogram buckets in seconds, from cache hits to slow LLM calls and large ingests
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Stage names used by the query and ingestion pipelines
+QUERY_STAGES = (
+    "model_load", "client_open", "query_encode", "vector_search",
+    "context_build", "llm_call", "db_write",
+)
+INGEST_STAGES = ("extract", "chunk", "embed", "index")
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+
+    STAGE_SECONDS = Histogram(
+        "rag_stage_seconds",
+        "Time spent in one pipeline stage",
+        ["stage"],
+        buckets=STAGE_BUCKETS,
+    )
+    OPERATION_SECONDS = Histogram(
+        "rag_operation_seconds",
+        "End-to-end time of a query or upload",
+        ["operation", "status"],
+        buckets=STAGE_BUCKETS,
+    )
+except ImportError:
+    logger.warning("prometheus_client is not installed; /metrics is disabled")
+    CONTENT_TYPE_LATEST = None
+    STAGE_SECONDS = OPERATION_SECONDS = None
+
+_tracer = None
+if METRICS_OTEL_SPANS:
+    try:
+        from opentelemetry import trace
+
+        _tracer = trace.get_tracer("rag-engine")
+    except ImportError:
+        logger.warning("METRICS_OTEL_SPANS is set but opentelemetry-api is not installed")
+
+# Timings of the operation running in the current context (None outside collect_timings)
+_current: ContextVar[Optional["StageTimings"]] = ContextVar("rag_stage_timings", default=None)
+
+# Per-thread stack of running timed iterators, used to subtract nested time
+_iter_stack = threading.local()
+
+
+class StageTimings:
+    """
+    Stage durations of one query or upload
+
+    A stage that runs several times (e.g. embed, once per batch) is summed.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.total = 0.0
+        # Outcome label for rag_operation_seconds (set by the caller, e.g. 'success')
+        self.status: Optional[str] = None
+        # Extra facts about the operation, e.g. whether its answer was shared
+        self.notes: Dict[str, object] = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def as_dict(self) -> Dict:
+        """Stage timings in milliseconds, plus the end-to-end total"""
+        return {
+            "operation": self.operation,
+            "total_ms": round(self.total * 1000, 2),
+            "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()},
+            "stage_counts": dict(self.counts),
+            **self.notes,
+        }
+
+
+def record(stage: str, seconds: float):
+    """Record a stage duration in the histogram and the current operation's timings"""
+    if STAGE_SECONDS is not None:
+        STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+def annotate(key: str, value):
+    """Attach a fact to the current operation's timings (no-op outside collect_timings)"""
+    timings = _current.get()
+    if timings is not None:
+        timings.notes[key] = value
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a block of code as one pipeline stage
+
+    Args:
+        name: Stage name, e.g. 'vector_search'
+    """
+    span = _tracer.start_as_current_span(name) if _tracer is not None else None
+    if span is not None:
+        span.__enter__()
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start_time)
+        if span is not None:
+            span.__exit__(None, None, None)
+
+
+def timed_iter(iterable: Iterable, name: str) -> Iterator:
+    """
+    Time the work done inside an iterator as one stage
+
+    Only time spent producing items counts, not time the consumer spends
+    between items. Time spent in a timed iterator nested inside this one
+    (e.g. page extraction feeding the chunker) is subtracted, so 'chunk'
+    and 'extract' never double count.
+
+    Args:
+        iterable: Iterable to wrap
+        name: Stage name, e.g. 'extract'
+
+    Yields:
+        The items of iterable
+    """
+    iterator = iter(iterable)
+    stack: List[List[float]] = _iter_stack.__dict__.setdefault("stack", [])
+    self_time = 0.0
+    wall_start = time.time_ns()
+
+    try:
+        while True:
+            frame = [0.0]  # time used by nested timed iterators during this next()
+            stack.append(frame)
+            start_time = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed = time.perf_counter() - start_time
+                stack.pop()
+                self_time += elapsed - frame[0]
+                if stack:
+                    stack[-1][0] += elapsed
+            yield item
+    finally:
+        record(name, self_time)
+        if _tracer is not None:
+            span = _tracer.start_span(name, start_time=wall_start)
+            span.set_attribute("self_seconds", self_time)
+            span.end()
+
+
+@contextmanager
+def collect_timings(operation: str):
+    """
+    Collect the stage timings of one query or upload
+
+    Stages recorded in this thread while the block runs are added to the
+    yielded StageTimings; the total is observed in rag_operation_seconds.
+
+    Args:
+        operation: 'query' or 'upload'
+
+    Yields:
+        StageTimings
+    """
+    timings = StageTimings(operation)
+    token = _current.set(timings)
+    start_time = time.perf_counter()
+    status = "error"
+    try:
+        yield timings
+        status = "ok"
+    finally:
+        timings.total = time.perf_counter() - start_time
+        _current.reset(token)
+        if OPERATION_SECONDS is not None:
+            OPERATION_SECONDS.labels(
+                operation=operation, status=timings.status or status
+            ).observe(timings.total)
+
+
+def render_metrics() -> Optional[Tuple[bytes, str]]:
+    """
+    Prometheus text exposition of all metrics
+
+    Returns:
+        tuple: (body, content type), or None if prometheus_client is missing
+    """
+    if STAGE_SECONDS is None:
+        return None
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,269 @@
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Default time between stack samples
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+# Upper bound for on-demand profiling sessions
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+# Frames kept per tracemalloc traceback and number of allocation sites reported
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "10"))
+TRACEMALLOC_TOP = int(os.getenv("TRACEMALLOC_TOP", "25"))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}:{code.co_name}"
+
+
+def _collapse(frame, root: Optional[str] = None) -> str:
+    """Stack of a frame in collapsed form, outermost first: 'root;mod:fn;mod:fn'"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    if root:
+        labels.append(root)
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that samples Python stacks from a background thread
+
+    Every interval it reads sys._current_frames() and counts each sampled
+    thread's stack. Nothing is traced between samples, so the profiled code
+    runs at full speed; the cost is one stack walk per thread per interval,
+    and zero when no profiler is running. Output is in collapsed-stack
+    format ('frame;frame;frame count'), which flamegraph.pl, speedscope
+    and inferno read directly.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, thread_id: Optional[int] = None):
+        """
+        Args:
+            interval_ms: Time between samples
+            thread_id: Sample only this thread (default: every thread but the sampler)
+        """
+        self.interval = max(0.0005, interval_ms / 1000.0)
+        self.thread_id = thread_id
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if self.thread_id is not None and thread_id != self.thread_id:
+                    continue
+                root = None if self.thread_id is not None else names.get(thread_id, str(thread_id))
+                self.stacks[_collapse(frame, root)] += 1
+            self.samples += 1
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, most frequent first"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 20) -> List[Dict]:
+        """Innermost frames by share of samples (where the time is actually spent)"""
+        own: Counter = Counter()
+        for stack, count in self.stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        total = sum(own.values()) or 1
+        return [
+            {"function": name, "samples": count, "share": round(count / total, 4)}
+            for name, count in own.most_common(limit)
+        ]
+
+    def report(self) -> Dict:
+        return {
+            "mode": "sample",
+            "interval_ms": round(self.interval * 1000, 3),
+            "duration_s": round(self.duration, 3),
+            "samples": self.samples,
+            "top_functions": self.top_functions(),
+            "collapsed": self.collapsed(),
+        }
+
+
+# One process-wide profiling session at a time
+_session_lock = threading.Lock()
+
+
+def profile_for(seconds: float, interval_ms: float = PROFILE_INTERVAL_MS) -> Dict:
+    """
+    Sample every thread of the process for a number of seconds (blocks)
+
+    Args:
+        seconds: Session length (capped at PROFILE_MAX_SECONDS)
+        interval_ms: Time between samples
+
+    Returns:
+        dict: SamplingProfiler.report()
+
+    Raises:
+        RuntimeError: If another session is already running
+    """
+    if not _session_lock.acquire(blocking=False):
+        raise RuntimeError("A profiling session is already running")
+    try:
+        seconds = min(max(0.1, seconds), PROFILE_MAX_SECONDS)
+        logger.info(f"Profiling all threads for {seconds:.1f}s every {interval_ms}ms")
+        profiler = SamplingProfiler(interval_ms).start()
+        time.sleep(seconds)
+        return profiler.stop().report()
+    finally:
+        _session_lock.release()
+
+
+class RequestProfile:
+    """Result holder filled in when a profile_request() block exits"""
+
+    def __init__(self):
+        self.report: Optional[Dict] = None
+
+
+@contextmanager
+def profile_request(mode: str = "sample", interval_ms: float = PROFILE_INTERVAL_MS,
+                    allocations: bool = False) -> Iterator[RequestProfile]:
+    """
+    Profile the code run inside the block
+
+    'sample' mode samples every thread for the duration of the block, with
+    each stack rooted at its thread's name, so the request's work on worker
+    threads (embedding batches, LLM calls, digest maps) is included along
+    with whatever other requests ran at the same time. 'cprofile' mode only
+    sees the calling thread. Neither covers PDF extraction in the spawned
+    process pool.
+
+    Args:
+        mode: 'sample' (stack sampling of all threads) or 'cprofile'
+              (deterministic, higher overhead, exact call counts, calling
+              thread only)
+        interval_ms: Time between samples in 'sample' mode
+        allocations: Also record allocation hot spots with tracemalloc
+
+    Yields:
+        RequestProfile whose report is set after the block
+    """
+    result = RequestProfile()
+    profiler = None
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = SamplingProfiler(interval_ms).start()
+
+    with (track_allocations() if allocations else _no_allocations()) as memory:
+        try:
+            yield result
+        finally:
+            if mode == "cprofile":
+                profiler.disable()
+                report = _cprofile_report(profiler)
+            else:
+                report = profiler.stop().report()
+            result.report = report
+
+    if allocations:
+        result.report["allocations"] = memory.report
+
+
+def _cprofile_report(profiler: cProfile.Profile, limit: int = 40) -> Dict:
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return {"mode": "cprofile", "stats": stream.getvalue()}
+
+
+class AllocationReport:
+    """Result holder filled in when a track_allocations() block exits"""
+
+    def __init__(self):
+        self.report: Optional[Dict] = None
+
+
+@contextmanager
+def _no_allocations() -> Iterator[AllocationReport]:
+    yield AllocationReport()
+
+
+@contextmanager
+def track_allocations(top: int = TRACEMALLOC_TOP, frames: int = TRACEMALLOC_FRAMES) -> Iterator[AllocationReport]:
+    """
+    Record where memory is allocated inside the block (e.g. an ingestion)
+
+    tracemalloc slows allocation-heavy code noticeably, so it only runs
+    while a block asks for it. If tracing was already on, it is left on.
+
+    Args:
+        top: Number of allocation sites to report
+        frames: Frames kept per traceback
+
+    Yields:
+        AllocationReport whose report is set after the block
+    """
+    result = AllocationReport()
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(frames)
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    try:
+        yield result
+    finally:
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if started_here:
+            tracemalloc.stop()
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "traceback")
+        result.report = {
+            "peak_mb": round(peak / (1024 * 1024), 2),
+            "net_mb": round(sum(stat.size_diff for stat in diff) / (1024 * 1024), 2),
+            "top": [
+                {
+                    "location": f"{stat.traceback[-1].filename}:{stat.traceback[-1].lineno}",
+                    "size_kb": round(stat.size_diff / 1024, 1),
+                    "count": stat.count_diff,
+                    "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                }
+                for stat in diff[:top]
+            ],
+        }
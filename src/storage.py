@@ -0,0 +1,222 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+from utils import UPLOAD_CHUNK_SIZE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Files younger than this are never swept, so uploads that are still being
+# written or not yet registered in the database are left alone
+GC_GRACE_SECONDS = int(os.getenv("STORAGE_GC_GRACE_SECONDS", "3600"))
+
+TEMP_PREFIX = ".upload-"
+
+
+class ContentStore:
+    """
+    Content-addressed file storage for uploaded documents.
+
+    Every file is stored once under <root>/<hash[:2]>/<hash>, so identical
+    uploads share a single blob no matter what they were called and two
+    different files with the same name never overwrite each other.
+    The original filenames live in the file_aliases table.
+    """
+
+    def __init__(self, root: str = "data"):
+        """
+        Args:
+            root: Directory that holds the blobs (created if missing)
+        """
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path_for(self, file_hash: str) -> str:
+        """
+        Get the storage path of a blob
+
+        Args:
+            file_hash: SHA256 hex digest of the file content
+
+        Returns:
+            str: <root>/<hash-prefix>/<hash>
+        """
+        return os.path.join(self.root, file_hash[:2], file_hash)
+
+    def exists(self, file_hash: str) -> bool:
+        """Check whether a blob is stored"""
+        return os.path.exists(self.path_for(file_hash))
+
+    def put(self, temp_path: str, file_hash: str) -> str:
+        """
+        Atomically move a fully written temp file into the store
+
+        If the same content is already stored the temp file is discarded.
+
+        Args:
+            temp_path: Temp file created inside the store root
+            file_hash: SHA256 hex digest of the temp file content
+
+        Returns:
+            str: Storage path of the blob
+        """
+        path = self.path_for(file_hash)
+
+        if os.path.exists(path):
+            os.remove(temp_path)
+            logger.info(f"Blob {file_hash[:8]}... already stored, discarded duplicate upload")
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        logger.info(f"Stored blob {file_hash[:8]}...")
+        return path
+
+    def put_fileobj(self, fileobj: BinaryIO, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Tuple[str, str]:
+        """
+        Stream a file object into the store (for Streamlit and scripts)
+
+        Args:
+            fileobj: Readable binary file object
+            chunk_size: Number of bytes copied per block
+
+        Returns:
+            tuple: (storage_path, sha256_checksum)
+        """
+        sha256 = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=TEMP_PREFIX, suffix=".part")
+
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for block in iter(lambda: fileobj.read(chunk_size), b""):
+                    sha256.update(block)
+                    out.write(block)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        file_hash = sha256.hexdigest()
+        return self.put(temp_path, file_hash), file_hash
+
+    def remove(self, file_hash: str) -> int:
+        """
+        Delete a blob
+
+        Args:
+            file_hash: SHA256 hex digest of the file content
+
+        Returns:
+            int: Number of bytes freed (0 if the blob did not exist)
+        """
+        path = self.path_for(file_hash)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+
+        # Drop the prefix directory once it is empty
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+
+        logger.info(f"Removed blob {file_hash[:8]}... ({size} bytes)")
+        return size
+
+    def iter_blobs(self) -> Iterator[Tuple[str, str, os.stat_result]]:
+        """
+        Walk every stored blob
+
+        Yields:
+            tuple: (file_hash, path, stat_result)
+        """
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                if name.startswith(prefix) and os.path.isfile(path):
+                    yield name, path, os.stat(path)
+
+    def iter_temp_files(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """
+        Walk leftover temp files from interrupted uploads
+
+        Yields:
+            tuple: (path, stat_result)
+        """
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(TEMP_PREFIX) and os.path.isfile(path):
+                yield path, os.stat(path)
+
+
+def collect_garbage(db, store: ContentStore, grace_seconds: Optional[int] = None) -> Dict:
+    """
+    Reference-counted garbage collection of documents
+
+    A document is garbage once no session references it. Its blob, its
+    ChromaDB collection and its database rows are removed. Blobs and temp
+    files that no document row knows about are swept after a grace period.
+
+    Args:
+        db: Connected RAGDatabase
+        store: ContentStore holding the blobs
+        grace_seconds: Minimum age of unknown files before they are swept
+
+    Returns:
+        dict: Stats on what was reclaimed
+    """
+    # Imported here so the storage layer does not load ChromaDB unless GC runs
+    from vectordb import delete_collection_by_name
+
+    if grace_seconds is None:
+        grace_seconds = GC_GRACE_SECONDS
+
+    stats = {
+        "documents_removed": 0,
+        "collections_removed": 0,
+        "blobs_removed": 0,
+        "orphan_files_removed": 0,
+        "bytes_freed": 0,
+    }
+
+    for doc in db.get_unreferenced_documents():
+        if doc["collection_name"] and delete_collection_by_name(doc["collection_name"]):
+            stats["collections_removed"] += 1
+
+        db.delete_document(doc["document_id"])
+        stats["documents_removed"] += 1
+
+        # Blobs are shared by content, only drop it once no document row needs it
+        if not db.file_hash_exists(doc["file_hash"]):
+            freed = store.remove(doc["file_hash"])
+            if freed:
+                stats["blobs_removed"] += 1
+                stats["bytes_freed"] += freed
+
+    cutoff = time.time() - grace_seconds
+
+    for file_hash, path, stat in store.iter_blobs():
+        if stat.st_mtime < cutoff and not db.file_hash_exists(file_hash):
+            stats["bytes_freed"] += store.remove(file_hash)
+            stats["orphan_files_removed"] += 1
+
+    for path, stat in store.iter_temp_files():
+        if stat.st_mtime < cutoff:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            stats["bytes_freed"] += stat.st_size
+            stats["orphan_files_removed"] += 1
+
+    logger.info(f"Garbage collection finished: {stats}")
+    return stats
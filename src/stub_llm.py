@@ -0,0 +1,122 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Defaults for the stub provider (load tests only; see LLM_STUB_ENABLED in llm_clients)
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "300"))
+LLM_STUB_TOKENS_PER_SECOND = float(os.getenv("LLM_STUB_TOKENS_PER_SECOND", "50"))
+LLM_STUB_OUTPUT_TOKENS = int(os.getenv("LLM_STUB_OUTPUT_TOKENS", "120"))
+LLM_STUB_JITTER = float(os.getenv("LLM_STUB_JITTER", "0.1"))
+LLM_STUB_ERROR_RATE = float(os.getenv("LLM_STUB_ERROR_RATE", "0"))
+
+_WORDS = (
+    "based on the provided context the document explains how the system "
+    "retrieves relevant passages and answers questions about them"
+).split()
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Chat model that behaves like a remote provider without calling one
+
+    A response takes latency_ms (time to first token) plus output_tokens /
+    tokens_per_second, each scaled by a random jitter, and fails with
+    probability error_rate. Async calls sleep without blocking the event
+    loop, like a real HTTP client, so concurrency behaves realistically.
+    """
+
+    latency_ms: float = LLM_STUB_LATENCY_MS
+    tokens_per_second: float = LLM_STUB_TOKENS_PER_SECOND
+    output_tokens: int = LLM_STUB_OUTPUT_TOKENS
+    jitter: float = LLM_STUB_JITTER
+    error_rate: float = LLM_STUB_ERROR_RATE
+    model_name: str = "stub"
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _scale(self) -> float:
+        return max(0.0, 1.0 + random.uniform(-self.jitter, self.jitter))
+
+    def _first_token_delay(self) -> float:
+        return self.latency_ms / 1000.0 * self._scale()
+
+    def _token_delay(self) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return self._scale() / self.tokens_per_second
+
+    def _maybe_fail(self):
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError("Stub provider error (LLM_STUB_ERROR_RATE)")
+
+    def _tokens(self) -> List[str]:
+        return [_WORDS[i % len(_WORDS)] + " " for i in range(self.output_tokens)]
+
+    def _result(self) -> ChatResult:
+        text = "".join(self._tokens()).strip()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        self._maybe_fail()
+        time.sleep(self._first_token_delay() + self.output_tokens * self._token_delay())
+        return self._result()
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                         **kwargs: Any) -> ChatResult:
+        self._maybe_fail()
+        await asyncio.sleep(self._first_token_delay() + self.output_tokens * self._token_delay())
+        return self._result()
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self._maybe_fail()
+        time.sleep(self._first_token_delay())
+        for token in self._tokens():
+            time.sleep(self._token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def build_stub_model(model: str) -> StubChatModel:
+    """
+    Build a stub model, optionally tuned through the model name
+
+    'stub' uses the LLM_STUB_* defaults; 'stub-<latency_ms>-<tokens_per_second>'
+    (e.g. 'stub-800-30') overrides them, so one server can mimic a fast
+    and a slow provider side by side.
+
+    Args:
+        model: Model name starting with 'stub'
+
+    Returns:
+        StubChatModel
+    """
+    settings = {"model_name": model}
+    parts = model.split("-")[1:]
+    try:
+        if len(parts) >= 1:
+            settings["latency_ms"] = float(parts[0])
+        if len(parts) >= 2:
+            settings["tokens_per_second"] = float(parts[1])
+    except ValueError:
+        logger.warning(f"Could not parse stub model settings from {model!r}, using defaults")
+        settings = {"model_name": model}
+    return StubChatModel(**settings)
@@ -1,10 +1,38 @@
-from pypdf import PdfReader
 from fastapi import HTTPException, UploadFile
-from langchain_community.document_loaders import PyMuPDFLoader
+from typing import Iterable, Iterator, Tuple
+import codecs
+import hashlib
+import logging
 import os
+import tempfile
+
+from extraction import get_pdf_page_count, iter_pdf_pages, PageTimingRecorder
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 MAX_PAGES = 100
 MAX_TXT_SIZE_MB = 10
+MAX_UPLOAD_SIZE_MB = 25
+
+# Large-document mode: text is streamed from extraction through chunking,
+# embedding and indexing in bounded batches, so memory no longer grows with
+# document size and the limits can be raised for manuals and log files.
+LARGE_DOCUMENT_MODE = os.getenv("LARGE_DOCUMENT_MODE", "false").lower() in ("1", "true", "yes")
+
+if LARGE_DOCUMENT_MODE:
+    MAX_PAGES = int(os.getenv("LARGE_MAX_PAGES", "5000"))
+    MAX_TXT_SIZE_MB = int(os.getenv("LARGE_MAX_TXT_SIZE_MB", "500"))
+    MAX_UPLOAD_SIZE_MB = int(os.getenv("LARGE_MAX_UPLOAD_SIZE_MB", "512"))
+
+# TXT encoding is detected from this many leading bytes
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+# TXT files are streamed in blocks of this many characters
+TXT_BLOCK_CHARS = 64 * 1024
+
+# Uploads are copied in blocks of this size, so a request never holds more than one block in memory
+UPLOAD_CHUNK_SIZE = 64 * 1024
 
 
 def validate_txt_or_pdf(filename: str, filepath: str) -> str:
@@ -32,21 +60,10 @@ def validate_txt_or_pdf(filename: str, filepath: str) -> str:
     
     if file_lower.endswith(".pdf"):
         try:
-            loader = PyMuPDFLoader(filepath, mode="single")
-            docs = loader.load()
-            
-            if not docs:
-                raise Exception("PDF file is empty or couldn't be loaded")
-            
-            page_count = docs[0].metadata.get("total_pages", 0)
-            
-            if page_count > MAX_PAGES:
-                raise Exception(
-                    f"Document too large: {page_count} pages. "
-                    f"Maximum allowed limit is {MAX_PAGES} pages."
-                )
-            
-            raw_text = docs[0].page_content
+            validate_pdf(filepath)
+            pages = PageTimingRecorder(iter_pdf_pages(filepath))
+            raw_text = "\n".join(pages)
+            logger.info(f"Extracted PDF {filename}: {pages.summary()}")
             
             if not raw_text or not raw_text.strip():
                 raise Exception(
@@ -58,37 +75,15 @@ def validate_txt_or_pdf(filename: str, filepath: str) -> str:
             return raw_text
             
         except Exception as e:
-            error_msg = str(e).lower()
-            
-            # Check for specific error types and provide user-friendly messages
-            if "no extractable text" in error_msg or "scanned document" in error_msg:
-                raise Exception(
-                    "PDF contains no extractable text. "
-                    "Please use a text-based PDF, not a scanned image."
-                )
-            elif "document too large" in error_msg or "maximum allowed" in error_msg:
-                raise  # Re-raise our custom size error as-is
-            elif "empty" in error_msg or "couldn't be loaded" in error_msg:
-                raise Exception("PDF file is empty or corrupted. Please check the file.")
-            elif "password" in error_msg or "encrypted" in error_msg:
-                raise Exception("PDF is password-protected. Please upload an unencrypted PDF.")
-            elif "pdf" in error_msg and ("invalid" in error_msg or "corrupt" in error_msg):
-                raise Exception("PDF file appears to be corrupted or invalid.")
-            else:
-                # Generic error for any other PyMuPDF failures
-                raise Exception(f"Unable to process PDF: {str(e)}")
+            raise friendly_pdf_error(e)
     
     elif file_lower.endswith(".txt"):
         try:
             # Check file size first
-            file_size_mb = get_file_size_mb(filepath)
-            if file_size_mb > MAX_TXT_SIZE_MB:
-                raise Exception(
-                    f"TXT file too large: {file_size_mb}MB. "
-                    f"Maximum allowed is {MAX_TXT_SIZE_MB}MB."
-                )
+            validate_txt(filepath)
             
-            with open(filepath, 'r', encoding='utf-8') as txt_file:
+            encoding = detect_text_encoding(filepath)
+            with open(filepath, 'r', encoding=encoding, errors='replace') as txt_file:
                 raw_text = txt_file.read()
             
             if not raw_text or not raw_text.strip():
@@ -96,14 +91,6 @@ def validate_txt_or_pdf(filename: str, filepath: str) -> str:
             
             return raw_text
             
-        except UnicodeDecodeError:
-            # Try with different encoding if UTF-8 fails
-            try:
-                with open(filepath, 'r', encoding='latin-1') as txt_file:
-                    raw_text = txt_file.read()
-                return raw_text
-            except Exception as e:
-                raise Exception(f"Error reading TXT file with alternative encoding: {str(e)}")
         except Exception as e:
             # Check if it's our size limit exception
             if "too large" in str(e).lower() or "maximum allowed" in str(e).lower():
@@ -116,6 +103,220 @@ def validate_txt_or_pdf(filename: str, filepath: str) -> str:
             "Only .pdf and .txt files are supported."
         )
 
+def validate_pdf(filepath: str) -> int:
+    """
+    Check a PDF's page count without extracting any text.
+    
+    Args:
+        filepath: Full path to the PDF file
+    
+    Returns:
+        int: Number of pages
+    
+    Raises:
+        Exception: If the PDF is empty, encrypted or has too many pages
+    """
+    page_count = get_pdf_page_count(filepath)
+    
+    if page_count == 0:
+        raise Exception("PDF file is empty or couldn't be loaded")
+    
+    if page_count > MAX_PAGES:
+        raise Exception(
+            f"Document too large: {page_count} pages. "
+            f"Maximum allowed limit is {MAX_PAGES} pages."
+        )
+    
+    return page_count
+
+
+def friendly_pdf_error(e: Exception) -> Exception:
+    """
+    Map a PDF extraction error to a user-friendly exception.
+    
+    Args:
+        e: Exception raised while opening or extracting the PDF
+    
+    Returns:
+        Exception: The exception to raise instead
+    """
+    error_msg = str(e).lower()
+    
+    # Check for specific error types and provide user-friendly messages
+    if "no extractable text" in error_msg or "scanned document" in error_msg:
+        return Exception(
+            "PDF contains no extractable text. "
+            "Please use a text-based PDF, not a scanned image."
+        )
+    elif "document too large" in error_msg or "maximum allowed" in error_msg:
+        return e  # Re-raise our custom size error as-is
+    elif "empty" in error_msg or "couldn't be loaded" in error_msg:
+        return Exception("PDF file is empty or corrupted. Please check the file.")
+    elif "password" in error_msg or "encrypted" in error_msg:
+        return Exception("PDF is password-protected. Please upload an unencrypted PDF.")
+    elif "pdf" in error_msg and ("invalid" in error_msg or "corrupt" in error_msg):
+        return Exception("PDF file appears to be corrupted or invalid.")
+    else:
+        # Generic error for any other PyMuPDF failures
+        return Exception(f"Unable to process PDF: {str(e)}")
+
+
+def _iter_pdf_pages_friendly(filepath: str):
+    """iter_pdf_pages() with errors mapped by friendly_pdf_error()"""
+    try:
+        yield from iter_pdf_pages(filepath)
+    except Exception as e:
+        raise friendly_pdf_error(e)
+
+
+def iter_document_text(filename: str, filepath: str) -> Iterable[str]:
+    """
+    Validate a PDF or TXT file and return its text as a stream of pieces.
+    
+    PDF pages are extracted in parallel and handed over in page order as
+    they finish, so chunking starts before the whole document is extracted.
+    
+    Args:
+        filename: Name of the file with extension
+        filepath: Full path to the file
+    
+    Returns:
+        Iterable[str]: Text pieces in document order. For PDFs this is a
+        PageTimingRecorder, whose summary() reports per-page timings once
+        it has been consumed.
+    
+    Raises:
+        FileNotFoundError: If file doesn't exist
+        TypeError: If file is not PDF or TXT
+        Exception: If the file is too large or can't be opened
+    """
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"File not found: {filepath}")
+    
+    if filename.lower().endswith(".pdf"):
+        try:
+            validate_pdf(filepath)
+        except Exception as e:
+            raise friendly_pdf_error(e)
+        return PageTimingRecorder(_iter_pdf_pages_friendly(filepath))
+    
+    if filename.lower().endswith(".txt"):
+        validate_txt(filepath)
+        return iter_txt_text(filepath)
+    
+    raise TypeError(
+        f"Unsupported file type: {filename}. "
+        "Only .pdf and .txt files are supported."
+    )
+
+
+def validate_txt(filepath: str) -> float:
+    """
+    Check a TXT file's size without reading it.
+    
+    Args:
+        filepath: Full path to the TXT file
+    
+    Returns:
+        float: File size in MB
+    
+    Raises:
+        Exception: If the file is larger than MAX_TXT_SIZE_MB
+    """
+    file_size_mb = get_file_size_mb(filepath)
+    if file_size_mb > MAX_TXT_SIZE_MB:
+        raise Exception(
+            f"TXT file too large: {file_size_mb}MB. "
+            f"Maximum allowed is {MAX_TXT_SIZE_MB}MB."
+        )
+    return file_size_mb
+
+
+def detect_text_encoding(filepath: str, sample_size: int = ENCODING_SAMPLE_SIZE) -> str:
+    """
+    Detect a text file's encoding from a prefix sample instead of a full read.
+    
+    Checks for a BOM first, then whether the sample is valid UTF-8, then asks
+    charset_normalizer (if installed), and finally falls back to latin-1,
+    which decodes any byte sequence.
+    
+    Args:
+        filepath: Path to the text file
+        sample_size: Number of leading bytes to inspect
+    
+    Returns:
+        str: Codec name usable with open()
+    """
+    with open(filepath, 'rb') as f:
+        sample = f.read(sample_size)
+    
+    for bom, encoding in (
+        (codecs.BOM_UTF32_LE, "utf-32"),
+        (codecs.BOM_UTF32_BE, "utf-32"),
+        (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"),
+        (codecs.BOM_UTF16_BE, "utf-16"),
+    ):
+        if sample.startswith(bom):
+            return encoding
+    
+    # Incremental decode tolerates a multi-byte character cut off at the end of the sample
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(sample).best()
+        if best is not None:
+            return best.encoding
+    except ImportError:
+        pass
+    
+    return "latin-1"
+
+
+def iter_txt_text(filepath: str, block_chars: int = TXT_BLOCK_CHARS) -> Iterator[str]:
+    """
+    Stream a text file in line-aligned blocks using the encoding detected from its prefix.
+    
+    Each block ends at a line break, which is left out: the chunker joins
+    pieces with a newline, so the joined blocks equal the file and no word
+    is cut at a block boundary. The partial last line of a read is carried
+    into the next block (lines longer than 16 blocks are cut anyway).
+    Undecodable bytes later in the file are replaced instead of failing the
+    whole document.
+    
+    Args:
+        filepath: Path to the text file
+        block_chars: Number of characters read at a time
+    
+    Yields:
+        str: Blocks of whole lines in file order
+    """
+    encoding = detect_text_encoding(filepath)
+    logger.info(f"Streaming {os.path.basename(filepath)} as {encoding}")
+    
+    carry = ""
+    with open(filepath, 'r', encoding=encoding, errors='replace') as txt_file:
+        for block in iter(lambda: txt_file.read(block_chars), ""):
+            block = carry + block
+            cut = block.rfind("\n")
+            if cut < 0:
+                if len(block) < 16 * block_chars:
+                    carry = block
+                    continue
+                carry = ""
+                yield block
+                continue
+            carry = block[cut + 1:]
+            yield block[:cut]
+    if carry:
+        yield carry
+
+
 def validate_pdf_upload(file: UploadFile) -> int:
     """
     Validate an uploaded PDF file (for FastAPI).
@@ -129,6 +330,9 @@ def validate_pdf_upload(file: UploadFile) -> int:
     Raises:
         HTTPException: If PDF is invalid or too large
     """
+    # Imported here: only this legacy helper needs pypdf
+    from pypdf import PdfReader
+
     try:
         # Read the file content
         reader = PdfReader(file.file)
@@ -181,4 +385,80 @@ def is_valid_file_type(filename: str) -> bool:
     Returns:
         bool: True if file type is supported
     """
-    return filename.lower().endswith(('.pdf', '.txt'))
\ No newline at end of file
+    return filename.lower().endswith(('.pdf', '.txt'))
+
+
+def compute_file_checksum(filepath: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """
+    Compute the SHA256 checksum of a file without loading it into memory.
+    
+    Args:
+        filepath: Path to the file
+        chunk_size: Number of bytes read per block
+    
+    Returns:
+        str: Hexadecimal checksum
+    """
+    sha256 = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+async def stream_upload_to_disk(
+    file: UploadFile,
+    dest_dir: str,
+    max_size_mb: float = MAX_UPLOAD_SIZE_MB,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> Tuple[str, int, str]:
+    """
+    Stream an uploaded file (for FastAPI) into a temp file inside dest_dir.
+    
+    The size limit is enforced while copying, and the SHA256 checksum is
+    computed on the same pass, so the upload is never buffered in memory.
+    The temp file lives in dest_dir so the caller can os.replace() it into
+    place atomically.
+    
+    Args:
+        file: UploadFile object from FastAPI
+        dest_dir: Directory for the temp file
+        max_size_mb: Maximum allowed upload size in MB
+        chunk_size: Number of bytes copied per block
+    
+    Returns:
+        tuple: (temp_path, file_size_in_bytes, sha256_checksum)
+    
+    Raises:
+        HTTPException: If the upload exceeds max_size_mb
+    """
+    max_bytes = int(max_size_mb * 1024 * 1024)
+    sha256 = hashlib.sha256()
+    file_size = 0
+
+    os.makedirs(dest_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=dest_dir, prefix=".upload-", suffix=".part")
+
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await file.read(chunk_size)
+                if not block:
+                    break
+
+                file_size += len(block)
+                if file_size > max_bytes:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File size exceeds maximum allowed size ({max_size_mb:g}MB)"
+                    )
+
+                sha256.update(block)
+                out.write(block)
+    except BaseException:
+        # Never leave partial uploads behind
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return temp_path, file_size, sha256.hexdigest()
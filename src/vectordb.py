@@ -1,14 +1,465 @@
 import os
-import chromadb
+import re
+import json
+import time
+import hashlib
 import logging
-from typing import List, Dict, Any, Union
-from sentence_transformers import SentenceTransformer
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from batching import EmbeddingBatcher, QUERY_BATCHING
+from embeddings import encode_token_ids, load_embedding_model, special_token_layout, tokenize, tokenize_with_offsets
+from metrics import annotate, stage, timed_iter
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+    from embeddings import OnnxEmbeddingModel
+
 # FIX: Use proper logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CHROMA_PATH = "./chroma_db"
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Chunks embedded and written to ChromaDB per batch during ingestion
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+
+# Chunks longer than the embedding model's max_seq_length: 'split' them into
+# pieces that fit, or 'warn' and embed only the leading max_seq_length tokens
+EMBED_OVERLONG_CHUNKS = os.getenv("EMBED_OVERLONG_CHUNKS", "split").lower()
+
+# Two-level index: small child chunks are embedded for precise matching, and
+# answers are built from the larger parent span each child came from (parents
+# are stored once, in SQLite, and are not embedded)
+CHUNK_HIERARCHY = os.getenv("CHUNK_HIERARCHY", "false").lower() in ("1", "true", "yes")
+PARENT_CHUNK_SIZE = int(os.getenv("PARENT_CHUNK_SIZE", "2000"))
+CHILD_CHUNK_SIZE = int(os.getenv("CHILD_CHUNK_SIZE", "400"))
+CHILD_CHUNK_OVERLAP = int(os.getenv("CHILD_CHUNK_OVERLAP", "50"))
+
+# Children retrieved per requested parent, since neighbouring children share a parent
+PARENT_FETCH_FACTOR = int(os.getenv("PARENT_FETCH_FACTOR", "4"))
+
+# Result selection in search(). Distances are ChromaDB's default squared L2;
+# for the normalized sentence-transformers embeddings that is 2 * (1 - cosine).
+# Chunks further than this from the query are dropped (0 disables)
+SEARCH_MAX_DISTANCE = float(os.getenv("SEARCH_MAX_DISTANCE", "0"))
+# Adaptive k: drop chunks further than this beyond the closest one (0 disables)
+SEARCH_ADAPTIVE_MARGIN = float(os.getenv("SEARCH_ADAPTIVE_MARGIN", "0"))
+# Maximal marginal relevance: pick chunks that are relevant but not redundant
+# with the ones already picked, from SEARCH_FETCH_FACTOR x n_results candidates
+SEARCH_MMR = os.getenv("SEARCH_MMR", "false").lower() in ("1", "true", "yes")
+SEARCH_MMR_LAMBDA = float(os.getenv("SEARCH_MMR_LAMBDA", "0.7"))
+SEARCH_FETCH_FACTOR = int(os.getenv("SEARCH_FETCH_FACTOR", "4"))
+
+# Longest heading recorded as a chunk's section
+SECTION_MAX_CHARS = int(os.getenv("SECTION_MAX_CHARS", "120"))
+
+# Maximum number of collection handles kept in memory by get_vector_db()
+VECTORDB_CACHE_SIZE = int(os.getenv("VECTORDB_CACHE_SIZE", "32"))
+
+# One PersistentClient per process, shared by every VectorDB instance
+_chroma_client = None
+
+# Embedding models are loaded once per model name
+_embedding_models: Dict[str, Union["SentenceTransformer", "OnnxEmbeddingModel"]] = {}
+_embedding_lock = threading.Lock()
+
+# Query micro-batchers, one per embedding model
+_query_batchers: Dict[str, EmbeddingBatcher] = {}
+
+# Open VectorDB handles by collection name, least recently used first
+_vector_dbs: "OrderedDict[str, VectorDB]" = OrderedDict()
+_vector_dbs_lock = threading.Lock()
+
+
+def get_chroma_client():
+    """
+    Get the shared ChromaDB client, creating it on first use.
+
+    Returns:
+        chromadb.PersistentClient
+    """
+    global _chroma_client
+    if _chroma_client is None:
+        # chromadb is imported on first use so importing this module stays cheap
+        import chromadb
+
+        with stage("client_open"):
+            _chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return _chroma_client
+
+
+def get_embedding_model(model_name: str) -> Union["SentenceTransformer", "OnnxEmbeddingModel"]:
+    """
+    Get a shared embedding model, loading it on first use.
+
+    The backend (torch or ONNX Runtime) is chosen by EMBEDDING_BACKEND.
+
+    Args:
+        model_name: HuggingFace model name
+
+    Returns:
+        SentenceTransformer or OnnxEmbeddingModel
+    """
+    with _embedding_lock:
+        model = _embedding_models.get(model_name)
+        if model is None:
+            logger.info(f"Loading embedding model: {model_name}")
+            with stage("model_load"):
+                model = load_embedding_model(model_name)
+            _embedding_models[model_name] = model
+        return model
+
+
+def get_query_batcher(model_name: str) -> EmbeddingBatcher:
+    """
+    Get the shared query-embedding batcher of a model, creating it on first use.
+
+    Args:
+        model_name: HuggingFace model name
+
+    Returns:
+        EmbeddingBatcher
+    """
+    model = get_embedding_model(model_name)
+    with _embedding_lock:
+        batcher = _query_batchers.get(model_name)
+        if batcher is None:
+            batcher = _query_batchers[model_name] = EmbeddingBatcher(model)
+        return batcher
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Open the ChromaDB client and load the default embedding model ahead of
+    the first request, running one encode so lazy kernels initialize too.
+
+    Returns:
+        dict: Seconds spent on each step
+    """
+    timings = {}
+    start_time = time.perf_counter()
+    get_chroma_client()
+    timings["chroma_client"] = round(time.perf_counter() - start_time, 3)
+
+    start_time = time.perf_counter()
+    model = get_embedding_model(os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL))
+    model.encode(["warm up"])
+    timings["embedding_model"] = round(time.perf_counter() - start_time, 3)
+    return timings
+
+
+def get_vector_db(collection_name: str) -> "VectorDB":
+    """
+    Get a cached VectorDB handle for a collection.
+
+    Handles are kept in a small LRU so repeat queries against the same
+    document skip collection setup. Cold handles are dropped with
+    evict_vector_db().
+
+    Args:
+        collection_name: Name of the ChromaDB collection
+
+    Returns:
+        VectorDB
+    """
+    with _vector_dbs_lock:
+        vector_db = _vector_dbs.get(collection_name)
+        if vector_db is not None:
+            _vector_dbs.move_to_end(collection_name)
+            return vector_db
+
+    vector_db = VectorDB(collection_name=collection_name)
+
+    with _vector_dbs_lock:
+        _vector_dbs[collection_name] = vector_db
+        _vector_dbs.move_to_end(collection_name)
+        while len(_vector_dbs) > VECTORDB_CACHE_SIZE:
+            _vector_dbs.popitem(last=False)
+    return vector_db
+
+
+def evict_vector_db(collection_name: str) -> bool:
+    """
+    Drop a cached VectorDB handle from memory (the collection stays on disk).
+
+    Args:
+        collection_name: Name of the ChromaDB collection
+
+    Returns:
+        bool: True if a handle was cached
+    """
+    with _vector_dbs_lock:
+        return _vector_dbs.pop(collection_name, None) is not None
+
+
+def delete_collection_by_name(collection_name: str) -> bool:
+    """
+    Delete a collection without loading an embedding model.
+
+    Args:
+        collection_name: Name of the ChromaDB collection
+
+    Returns:
+        bool: True if the collection was deleted, False otherwise
+    """
+    evict_vector_db(collection_name)
+    try:
+        get_chroma_client().delete_collection(name=collection_name)
+        logger.info(f"Deleted collection: {collection_name}")
+        return True
+    except Exception as e:
+        logger.warning(f"Could not delete collection {collection_name}: {e}")
+        return False
+
+
+class IndexingError(RuntimeError):
+    """A batch of chunks could not be embedded or written to the collection"""
+
+
+def mmr_select(query_embedding, embeddings, k: int, lambda_mult: float = SEARCH_MMR_LAMBDA) -> List[int]:
+    """
+    Maximal marginal relevance over candidate embeddings
+
+    Greedily picks the candidate maximizing
+    lambda_mult * sim(query, c) - (1 - lambda_mult) * max sim(c, picked),
+    keeping each candidate's similarity to the picked set as one vector
+    that is updated with a single matrix-vector product per pick.
+
+    Args:
+        query_embedding: Query vector
+        embeddings: (n, dim) candidate vectors
+        k: Number of candidates to pick
+        lambda_mult: 1 ranks by relevance only, 0 by diversity only
+
+    Returns:
+        List[int]: Indexes of the picked candidates, in pick order
+    """
+    candidates = np.asarray(embeddings, dtype=np.float32)
+    if candidates.ndim != 2 or not len(candidates):
+        return []
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32).ravel()
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = candidates @ query
+    picked = [int(np.argmax(relevance))]
+    redundancy = candidates @ candidates[picked[0]]
+    available = np.ones(len(candidates), dtype=bool)
+    available[picked[0]] = False
+
+    while len(picked) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, candidates @ candidates[best], out=redundancy)
+    return picked
+
+
+# Lines recorded as section headings: Markdown ('## Results'), numbered
+# ('2.3 Results', no sentence punctuation) or ALL CAPS ('RESULTS')
+_HEADING = re.compile(
+    r"^[ \t]*(?:"
+    r"#{1,6}[ \t]+(?P<markdown>[^\n]{1,200}?)"
+    r"|\d{1,3}(?:\.\d{1,3})*\.?[ \t]+[A-Z][^\n.;:!?]{1,100}"
+    r"|[A-Z][A-Z0-9 ,&'()/-]{3,100}"
+    r")[ \t]*$",
+    re.MULTILINE,
+)
+
+# Query filters accepted by build_where()
+FILTER_KEYS = ("page_from", "page_to", "section", "chunk_from", "chunk_to")
+
+
+def build_where(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Translate query filters into a ChromaDB where clause
+
+    Args:
+        filters: page_from / page_to (pages a chunk overlaps, 1-based),
+                 section (a heading, or a list of headings), chunk_from /
+                 chunk_to (chunk_index window); None values are ignored
+
+    Returns:
+        dict: where clause, or None if there is nothing to filter on
+
+    Raises:
+        ValueError: Unknown filter or empty range
+    """
+    filters = {key: value for key, value in (filters or {}).items() if value is not None}
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+
+    conditions = []
+    # A chunk overlaps pages [from, to] if it ends on or after 'from' and starts on or before 'to'
+    for low_key, high_key, low_field, high_field in (
+        ("page_from", "page_to", "page_end", "page_start"),
+        ("chunk_from", "chunk_to", "chunk_index", "chunk_index"),
+    ):
+        low, high = filters.get(low_key), filters.get(high_key)
+        if low is not None and high is not None and int(low) > int(high):
+            raise ValueError(f"{low_key} must not be greater than {high_key}")
+        if low is not None:
+            conditions.append({low_field: {"$gte": int(low)}})
+        if high is not None:
+            conditions.append({high_field: {"$lte": int(high)}})
+
+    section = filters.get("section")
+    if section:
+        sections = [" ".join(s.split()) for s in ([section] if isinstance(section, str) else section)]
+        conditions.append({"section": sections[0]} if len(sections) == 1 else {"section": {"$in": sections}})
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def _positions(text: str, chunks: List[str]) -> List[int]:
+    """Offset of each chunk in the text it was split from (chunks are in order and may overlap)"""
+    positions = []
+    cursor = 0
+    for chunk in chunks:
+        position = text.find(chunk, cursor)
+        if position < 0:
+            # The splitter changed the chunk (e.g. stripped separators): keep the order
+            position = cursor
+        positions.append(position)
+        cursor = position + 1
+    return positions
+
+
+# Where an overlong chunk may be cut, most preferred first
+_WINDOW_SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+
+def _token_windows(text: str, spans: List[Tuple[int, int]], size: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    Cut a tokenized text into windows of at most size tokens.
+
+    Each window ends after the last separator before the limit that keeps it
+    at least half full, or at the limit when there is none; the next window
+    repeats about overlap tokens, starting at a word.
+
+    Args:
+        text: The tokenized text
+        spans: (start, end) character span of every token, special tokens excluded
+        size: Tokens per window
+        overlap: Tokens repeated between consecutive windows
+
+    Returns:
+        (first token, end token) of every window, end exclusive
+    """
+    starts = [start for start, _ in spans]
+    windows = []
+    first = 0
+    while len(spans) - first > size:
+        # spans[first + size] is the first token that does not fit
+        end = first + size
+        for separator in _WINDOW_SEPARATORS:
+            cut = text.rfind(separator, starts[first], starts[first + size])
+            if cut <= starts[first]:
+                continue
+            candidate = bisect_left(starts, cut + len(separator), first + 1, first + size)
+            if candidate - first >= size // 2:
+                end = candidate
+                break
+        windows.append((first, end))
+
+        first = max(first + 1, end - overlap)
+        while first < end and not text[starts[first] - 1:starts[first]].isspace():
+            first += 1
+    windows.append((first, len(spans)))
+    return windows
+
+
+class TextLayout:
+    """
+    Where pieces (e.g. PDF pages) start in a document's joined text and
+    where section headings were seen, recorded as the text streams into the
+    chunker. Only offsets and headings are kept, never the text, and entries
+    the chunker has moved past are pruned so memory stays flat.
+    """
+
+    def __init__(self):
+        self._piece_starts: List[int] = []
+        self._piece_indexes: List[int] = []
+        self._heading_starts: List[int] = []
+        self._headings: List[str] = []
+
+    def add_piece(self, offset: int, piece_index: int, text: str):
+        self._piece_starts.append(offset)
+        self._piece_indexes.append(piece_index)
+        for match in _HEADING.finditer(text):
+            heading = " ".join((match.group("markdown") or match.group(0)).split())
+            self._heading_starts.append(offset + match.start())
+            self._headings.append(heading[:SECTION_MAX_CHARS])
+
+    def prune(self, offset: int):
+        """Forget what lies before an offset, keeping the piece and heading covering it"""
+        i = bisect_right(self._piece_starts, offset) - 1
+        if i > 0:
+            del self._piece_starts[:i]
+            del self._piece_indexes[:i]
+        i = bisect_right(self._heading_starts, offset) - 1
+        if i > 0:
+            del self._heading_starts[:i]
+            del self._headings[:i]
+
+    def pieces(self, start: int, end: int) -> Tuple[int, int]:
+        """Indexes of the pieces holding the first and last character of [start, end)"""
+        first = max(0, bisect_right(self._piece_starts, start) - 1)
+        last = max(0, bisect_right(self._piece_starts, max(start, end - 1)) - 1)
+        return self._piece_indexes[first], self._piece_indexes[last]
+
+    def section(self, offset: int) -> Optional[str]:
+        """Last heading at or before an offset"""
+        i = bisect_right(self._heading_starts, offset) - 1
+        return self._headings[i] if i >= 0 else None
+
+
+class TokenStats:
+    """Token-length and truncation statistics of one document's chunks"""
+
+    def __init__(self, max_seq_length: int):
+        self.max_seq_length = max_seq_length
+        self.chunks = 0
+        self.tokens = 0
+        self.max_tokens = 0
+        self.split_chunks = 0
+        self.truncated_chunks = 0
+        self.truncated_tokens = 0
+        self.padding = 0
+
+    def add(self, token_count: int, truncated_tokens: int):
+        self.chunks += 1
+        self.tokens += token_count
+        self.max_tokens = max(self.max_tokens, token_count)
+        if truncated_tokens:
+            self.truncated_chunks += 1
+            self.truncated_tokens += truncated_tokens
+
+    def as_dict(self) -> Dict[str, Any]:
+        embedded = self.tokens - self.truncated_tokens
+        return {
+            "chunks": self.chunks,
+            "max_seq_length": self.max_seq_length,
+            "mean_tokens": round(self.tokens / self.chunks, 1) if self.chunks else 0,
+            "max_tokens": self.max_tokens,
+            "split_chunks": self.split_chunks,
+            "truncated_chunks": self.truncated_chunks,
+            "truncated_tokens": self.truncated_tokens,
+            "padding_ratio": round(self.padding / (embedded + self.padding), 4) if embedded else 0.0,
+        }
+
 
 class VectorDB:
     """
@@ -26,22 +477,22 @@ class VectorDB:
             "CHROMA_COLLECTION_NAME", "rag_documents"
         )
         self.embedding_model_name = embedding_model or os.getenv(
-            "EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+            "EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL
         )
 
         try:
             # Initialize ChromaDB client
-            self.client = chromadb.PersistentClient(path="./chroma_db")
+            self.client = get_chroma_client()
 
-            # Load embedding model
-            logger.info(f"Loading embedding model: {self.embedding_model_name}")
-            self.embedding_model = SentenceTransformer(self.embedding_model_name)
+            # Load embedding model (shared across instances)
+            self.embedding_model = get_embedding_model(self.embedding_model_name)
 
             # Get or create collection
-            self.collection = self.client.get_or_create_collection(
-                name=self.collection_name,
-                metadata={"description": "RAG document collection"},
-            )
+            with stage("client_open"):
+                self.collection = self.client.get_or_create_collection(
+                    name=self.collection_name,
+                    metadata={"description": "RAG document collection"},
+                )
 
             logger.info(f"Vector database initialized with collection: {self.collection_name}")
         except Exception as e:
@@ -82,19 +533,137 @@ class VectorDB:
             logger.error(f"Error chunking text: {e}")
             return []
 
-    def add_document(self, document_text: str, document_id: str = None) -> int:
+    def chunk_stream(
+        self,
+        pieces: Iterable[str],
+        chunk_size: int = 1500,
+        chunk_overlap: int = 150,
+        window_chunks: int = 16,
+    ) -> Iterator[str]:
+        """
+        Split a stream of text pieces (e.g. PDF pages) into chunks as they arrive.
+
+        Pieces are joined with newlines into a rolling buffer. Once the buffer
+        holds about window_chunks chunks it is split, every chunk but the last
+        is emitted and the buffer restarts at the last chunk, which may still
+        continue in the next piece. Chunks match chunk_text() on the joined
+        text except near window boundaries, and memory stays bounded by the
+        window size.
+
+        Args:
+            pieces: Text pieces in document order
+            chunk_size: Approximate number of characters per chunk
+            chunk_overlap: Number of overlapping characters between chunks
+            window_chunks: Buffer size, in chunks, before splitting
+
+        Yields:
+            str: text chunks
+        """
+        for chunk, _, _ in self._chunk_spans(pieces, TextLayout(), chunk_size, chunk_overlap, window_chunks):
+            yield chunk
+
+    def _chunk_spans(
+        self,
+        pieces: Iterable[str],
+        layout: TextLayout,
+        chunk_size: int = 1500,
+        chunk_overlap: int = 150,
+        window_chunks: Optional[int] = 16,
+    ) -> Iterator[Tuple[str, int, int]]:
+        """
+        chunk_stream(), also yielding where each chunk lies in the joined text.
+
+        Args:
+            pieces: Text pieces in document order
+            layout: Records where pieces start and which headings they hold
+            chunk_size: Approximate number of characters per chunk
+            chunk_overlap: Number of overlapping characters between chunks
+            window_chunks: Buffer size, in chunks, before splitting (None:
+                           split once, at the end)
+
+        Yields:
+            (chunk, start offset, end offset)
+        """
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+        )
+        window = chunk_size * window_chunks if window_chunks else float("inf")
+        buffer = ""
+        # Offset of buffer[0] in the joined text
+        buffer_start = 0
+
+        for piece_index, piece in enumerate(pieces):
+            if not piece:
+                continue
+            layout.add_piece(buffer_start + len(buffer) + (1 if buffer else 0), piece_index, piece)
+            buffer = f"{buffer}\n{piece}" if buffer else piece
+
+            if len(buffer) < window:
+                continue
+
+            chunks = text_splitter.split_text(buffer)
+            if len(chunks) < 2:
+                continue
+
+            positions = _positions(buffer, chunks)
+            for chunk, position in zip(chunks[:-1], positions):
+                yield chunk, buffer_start + position, buffer_start + position + len(chunk)
+
+            # Restart the buffer at the last chunk so its overlap and continuation survive
+            tail_start = buffer.rfind(chunks[-1])
+            if tail_start < 0:
+                tail_start = positions[-1]
+            buffer_start += tail_start
+            buffer = buffer[tail_start:]
+            # Every chunk yielded from here on starts inside the buffer
+            layout.prune(buffer_start)
+
+        if buffer.strip():
+            chunks = text_splitter.split_text(buffer)
+            for chunk, position in zip(chunks, _positions(buffer, chunks)):
+                yield chunk, buffer_start + position, buffer_start + position + len(chunk)
+
+    def add_document(
+        self,
+        document_text: Union[str, Iterable[str]],
+        document_id: str = None,
+        completed_batches: Optional[Dict[int, Dict]] = None,
+        on_batch_committed: Optional[Callable[[int, int, int, str], None]] = None,
+        replace: bool = False,
+        on_parents: Optional[Callable[[Dict[int, str]], None]] = None,
+        on_sections: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    ) -> int:
         """
         Add a document to the vector database.
         
         Args:
-            document_text: Full text content of the document
+            document_text: Full text content of the document, or an iterable
+                           of text pieces (e.g. pages) that is chunked as it streams
             document_id: Unique identifier for the document (optional)
+            completed_batches: Batches an earlier, interrupted run already
+                               committed (batch_index -> first_chunk, chunk_count,
+                               digest); matching batches are not embedded again
+            on_batch_committed: Called with (batch_index, first_chunk, chunk_count,
+                                digest) after each batch is written
+            replace: Overwrite chunks that may exist from an earlier run
+                     (upsert, and remove chunks past the new end)
+            on_parents: With CHUNK_HIERARCHY, called with the parent spans
+                        (parent_index -> text) a batch refers to, before the
+                        batch is written; children store only parent_index
+            on_sections: Called before each batch is written with the points
+                         where a section starts or continues in it
+                         (section, first_chunk, page_start)
         
         Returns:
-            int: Number of chunks added (0 if failed)
+            int: Number of chunks added (0 if the document has no text)
+        
+        Raises:
+            IndexingError: If a batch could not be embedded or stored
+            Exception: Errors raised while reading a streamed document_text
         """
         # FIX: Validate inputs
-        if not document_text or not document_text.strip():
+        if not document_text or (isinstance(document_text, str) and not document_text.strip()):
             logger.warning("No content provided to add_document")
             return 0
 
@@ -103,17 +672,232 @@ class VectorDB:
             document_id = "doc_default"
             logger.warning("No document_id provided, using default")
 
+        # Chunk the text (errors from a streamed source propagate to the caller).
+        # Extraction runs inside the chunker's loop; timed_iter keeps the two apart.
+        # With CHUNK_HIERARCHY the chunker yields non-overlapping parent spans,
+        # which are split again into the child chunks that get embedded.
+        parent_texts: Dict[int, str] = {}
+        layout = TextLayout()
+        chunk_size, chunk_overlap = (PARENT_CHUNK_SIZE, 0) if CHUNK_HIERARCHY else (1500, 150)
+        if isinstance(document_text, str):
+            with stage("chunk"):
+                spans = self._chunk_spans([document_text], layout, chunk_size, chunk_overlap, window_chunks=None)
+                chunks = iter(list(self._child_chunks(spans, parent_texts)) if CHUNK_HIERARCHY
+                              else [(chunk, None, start, end) for chunk, start, end in spans])
+        else:
+            spans = self._chunk_spans(timed_iter(document_text, "extract"), layout, chunk_size, chunk_overlap)
+            chunks = timed_iter(self._child_chunks(spans, parent_texts) if CHUNK_HIERARCHY
+                                else ((chunk, None, start, end) for chunk, start, end in spans), "chunk")
+
+        # PDF streams record the page number of every piece (page) they yield
+        pages = getattr(document_text, "timings", None)
+
+        def chunk_metadata(parent_index: Optional[int], start: int, end: int) -> Dict[str, Any]:
+            metadata: Dict[str, Any] = {}
+            if parent_index is not None:
+                metadata["parent_index"] = parent_index
+            if pages is not None:
+                first, last = layout.pieces(start, end)
+                metadata["page_start"] = pages[first].page_number
+                metadata["page_end"] = pages[last].page_number
+            section = layout.section(start)
+            if section:
+                metadata["section"] = section
+            return metadata
+
+        # Embed and index in fixed-size batches so memory stays flat for any document size
+        completed_batches = dict(completed_batches or {})
+        chunk_count = 0
+        batch_index = 0
+        resumed = 0
+        batch: List[str] = []
+        batch_metadata: List[Dict[str, Any]] = []
+        stats = TokenStats(self.embedding_model.max_seq_length)
+
+        def commit(batch: List[str]) -> Optional[int]:
+            nonlocal resumed
+            # Parent spans are handed over once, with the first batch that refers to them
+            new_parents = {
+                i: parent_texts.pop(i)
+                for i in dict.fromkeys(m.get("parent_index") for m in batch_metadata)
+                if i in parent_texts
+            }
+            digest = self._batch_digest(batch, batch_metadata)
+            done = completed_batches.get(batch_index)
+            if done and done["digest"] == digest and done["first_chunk"] == chunk_count:
+                # Already in the collection from an interrupted run
+                resumed += 1
+                return done["chunk_count"]
+            if done:
+                # The document or the chunking changed: later checkpoints are stale too
+                completed_batches.clear()
+            if new_parents and on_parents:
+                on_parents(new_parents)
+            stored = self._index_batch(batch, document_id, chunk_count, stats, replace=replace,
+                                       extra_metadata=batch_metadata, on_sections=on_sections)
+            if stored is None:
+                # Batches committed so far stay in the collection for a resume
+                raise IndexingError(
+                    f"Indexing failed at chunk {chunk_count} (batch {batch_index}); "
+                    "upload the document again to resume"
+                )
+            if on_batch_committed:
+                on_batch_committed(batch_index, chunk_count, stored, digest)
+            return stored
+
+        for chunk, parent_index, start, end in chunks:
+            batch.append(chunk)
+            batch_metadata.append(chunk_metadata(parent_index, start, end))
+            if len(batch) >= EMBED_BATCH_SIZE:
+                chunk_count += commit(batch)
+                batch_index += 1
+                batch = []
+                batch_metadata = []
+
+        if batch:
+            chunk_count += commit(batch)
+
+        if not chunk_count:
+            logger.warning("No chunks generated from document")
+            return 0
+
+        if replace:
+            # A previous run may have written chunks past the new end
+            try:
+                self.collection.delete(where={"chunk_index": {"$gte": chunk_count}})
+            except Exception as e:
+                logger.warning(f"Could not remove stale chunks of {document_id}: {e}")
+
+        if resumed:
+            logger.info(f"Resumed ingestion: skipped {resumed} batches committed by an earlier run")
+            annotate("resumed_batches", resumed)
+
+        token_stats = stats.as_dict()
+        annotate("tokens", token_stats)
+        if stats.truncated_chunks:
+            logger.warning(
+                f"{stats.truncated_chunks} of {chunk_count} chunks exceed the embedding model's "
+                f"{stats.max_seq_length} tokens; {stats.truncated_tokens} tokens are not embedded "
+                f"(set EMBED_OVERLONG_CHUNKS=split or use smaller chunks)"
+            )
+        logger.info(f"Successfully added {chunk_count} chunks to vector database ({token_stats})")
+        return chunk_count
+
+    def _batch_digest(self, chunks: List[str], metadata: Optional[List[Dict[str, Any]]] = None) -> str:
+        """Fingerprint of a batch's input chunks and the settings that shape what gets stored"""
+        digest = hashlib.sha1(f"{self.embedding_model_name}|{EMBED_OVERLONG_CHUNKS}".encode("utf-8"))
+        for chunk in chunks:
+            digest.update(b"\0")
+            digest.update(chunk.encode("utf-8"))
+        if metadata and any(metadata):
+            digest.update(b"\0metadata:" + json.dumps(metadata, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _child_chunks(self, parents: Iterable[Tuple[str, int, int]],
+                      parent_texts: Dict[int, str]) -> Iterator[Tuple[str, int, int, int]]:
+        """
+        Split parent spans into the child chunks that get embedded.
+
+        Args:
+            parents: (parent span, start offset, end offset) in document order
+            parent_texts: Filled with parent_index -> text as parents are read
+
+        Yields:
+            (child chunk, parent_index, start offset, end offset)
+        """
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHILD_CHUNK_SIZE,
+            chunk_overlap=CHILD_CHUNK_OVERLAP,
+        )
+        for parent_index, (parent, parent_start, _) in enumerate(parents):
+            parent_texts[parent_index] = parent
+            children = splitter.split_text(parent)
+            for child, position in zip(children, _positions(parent, children)):
+                yield child, parent_index, parent_start + position, parent_start + position + len(child)
+
+    def _fit_chunks(self, chunks: List[str], stats: TokenStats):
+        """
+        Tokenize chunks once and make them fit the embedding model.
+
+        With EMBED_OVERLONG_CHUNKS=split, a chunk longer than max_seq_length
+        is cut into windows of whole tokens using the character offsets of
+        that one tokenization, each ending at the last separator before the
+        limit, so no text is silently left out of the embedding and no
+        candidate piece is tokenized again.
+
+        Args:
+            chunks: Chunk texts
+            stats: Accumulator for token statistics
+
+        Returns:
+            (chunk texts, token ids, tokens cut off per chunk, index of the
+            input chunk each output chunk came from)
+        """
+        limit = self.embedding_model.max_seq_length
+        if EMBED_OVERLONG_CHUNKS != "split":
+            token_ids = tokenize(self.embedding_model, chunks)
+            return (chunks, token_ids, [max(0, len(ids) - limit) for ids in token_ids],
+                    list(range(len(chunks))))
+
+        token_ids, offsets = tokenize_with_offsets(self.embedding_model, chunks)
+        if offsets is None or all(len(ids) <= limit for ids in token_ids):
+            return (chunks, token_ids, [max(0, len(ids) - limit) for ids in token_ids],
+                    list(range(len(chunks))))
+
+        leading, trailing = special_token_layout(self.embedding_model)
+        text_limit = limit - leading - trailing
+
+        fitted_chunks: List[str] = []
+        fitted_ids: List[List[int]] = []
+        origins: List[int] = []
+        for i, (chunk, ids, spans) in enumerate(zip(chunks, token_ids, offsets)):
+            if len(ids) <= limit:
+                fitted_chunks.append(chunk)
+                fitted_ids.append(ids)
+                origins.append(i)
+                continue
+            stats.split_chunks += 1
+            content_ids = ids[leading:len(ids) - trailing]
+            content_spans = spans[leading:len(ids) - trailing]
+            for first, end in _token_windows(chunk, content_spans, text_limit, text_limit // 10):
+                fitted_chunks.append(chunk[content_spans[first][0]:content_spans[end - 1][1]])
+                fitted_ids.append(ids[:leading] + content_ids[first:end] + ids[len(ids) - trailing:])
+                origins.append(i)
+
+        return fitted_chunks, fitted_ids, [max(0, len(ids) - limit) for ids in fitted_ids], origins
+
+    def _index_batch(self, chunks: List[str], document_id: str, first_index: int,
+                     stats: TokenStats, replace: bool = False,
+                     extra_metadata: Optional[List[Dict[str, Any]]] = None,
+                     on_sections: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> Optional[int]:
+        """
+        Embed one batch of chunks and write it to the collection.
+
+        Args:
+            chunks: Chunk texts
+            document_id: Document the chunks belong to
+            first_index: Document-wide index of the first chunk in the batch
+            stats: Accumulator for token statistics
+            replace: Upsert, overwriting chunks with the same ids
+            extra_metadata: Metadata of each chunk beyond its position (parent_index,
+                            page_start, page_end, section)
+            on_sections: Called with the section of the batch's first chunk and
+                         every section change, by final chunk_index
+
+        Returns:
+            int: Number of chunks stored (chunks may be split to fit the model), None on failure
+        """
         try:
-            # Chunk the text
-            chunks = self.chunk_text(document_text)
-            
-            if not chunks:
-                logger.warning("No chunks generated from document")
-                return 0
+            with stage("tokenize"):
+                chunks, token_ids, truncated, origins = self._fit_chunks(chunks, stats)
 
-            # Generate embeddings
-            logger.info(f"Generating embeddings for {len(chunks)} chunks...")
-            embeddings = self.embedding_model.encode(chunks)
+            # Generate embeddings, grouping chunks of similar token length
+            logger.info(f"Generating embeddings for chunks {first_index}-{first_index + len(chunks) - 1}...")
+            with stage("embed"):
+                embeddings, padding = encode_token_ids(self.embedding_model, token_ids)
+            stats.padding += padding
+            for ids, cut in zip(token_ids, truncated):
+                stats.add(len(ids), cut)
             
             # FIX: Safely convert to list
             try:
@@ -124,7 +908,7 @@ class VectorDB:
             # FIX: Check for existing chunks and handle duplicates
             # Generate unique IDs for each chunk
             ids = [
-                f"{document_id}_chunk_{i}"
+                f"{document_id}_chunk_{first_index + i}"
                 for i in range(len(chunks))
             ]
             
@@ -132,21 +916,37 @@ class VectorDB:
             metadatas = [
                 {
                     "source": document_id,
-                    "chunk_index": i,
-                    "chunk_size": len(chunks[i])
+                    "chunk_index": first_index + i,
+                    "chunk_size": len(chunks[i]),
+                    "token_count": len(token_ids[i]),
+                    "truncated_tokens": truncated[i],
                 }
                 for i in range(len(chunks))
             ]
+            if extra_metadata is not None:
+                # Pieces of a chunk split to fit the model keep the chunk's pages and section
+                for metadata, origin in zip(metadatas, origins):
+                    metadata.update(extra_metadata[origin])
+
+            if on_sections:
+                starts = [
+                    {"section": m["section"], "first_chunk": m["chunk_index"], "page_start": m.get("page_start")}
+                    for i, m in enumerate(metadatas)
+                    if m.get("section") and (i == 0 or m["section"] != metadatas[i - 1].get("section"))
+                ]
+                if starts:
+                    on_sections(starts)
 
             # FIX: Try to add, handle duplicates gracefully
             try:
-                self.collection.add(
-                    ids=ids,
-                    embeddings=emb_list,
-                    documents=chunks,
-                    metadatas=metadatas,
-                )
-                logger.info(f"Successfully added {len(chunks)} chunks to vector database")
+                with stage("index"):
+                    write = self.collection.upsert if replace else self.collection.add
+                    write(
+                        ids=ids,
+                        embeddings=emb_list,
+                        documents=chunks,
+                        metadatas=metadatas,
+                    )
                 return len(chunks)
             
             except Exception as add_error:
@@ -154,36 +954,51 @@ class VectorDB:
                 if "already exists" in str(add_error).lower():
                     logger.warning(f"Chunks already exist, attempting to update...")
                     try:
-                        self.collection.upsert(
-                            ids=ids,
-                            embeddings=emb_list,
-                            documents=chunks,
-                            metadatas=metadatas,
-                        )
-                        logger.info(f"Successfully updated {len(chunks)} chunks in vector database")
+                        with stage("index"):
+                            self.collection.upsert(
+                                ids=ids,
+                                embeddings=emb_list,
+                                documents=chunks,
+                                metadatas=metadatas,
+                            )
                         return len(chunks)
                     except Exception as upsert_error:
                         logger.error(f"Error upserting chunks: {upsert_error}")
-                        return 0
+                        return None
                 else:
                     logger.error(f"Error adding chunks: {add_error}")
-                    return 0
+                    return None
 
         except Exception as e:
             logger.error(f"Error in add_document: {e}")
-            return 0
+            return None
 
     def search(
         self, 
         query: Union[str, List[str]], 
-        n_results: int = 5
+        n_results: int = 5,
+        max_distance: Optional[float] = None,
+        adaptive_margin: Optional[float] = None,
+        mmr: Optional[bool] = None,
+        mmr_lambda: Optional[float] = None,
+        where: Optional[Dict[str, Any]] = None,
     ) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
         """
         Search for similar documents in the vector database.
 
+        Fewer than n_results chunks come back when the selection options
+        drop candidates, and none when nothing is close enough.
+
         Args:
             query: single query string or list of query strings
             n_results: number of results per query
+            max_distance: Drop chunks further away (default: SEARCH_MAX_DISTANCE, 0 disables)
+            adaptive_margin: Drop chunks further than this beyond the closest
+                             one (default: SEARCH_ADAPTIVE_MARGIN, 0 disables)
+            mmr: Diversify with maximal marginal relevance (default: SEARCH_MMR)
+            mmr_lambda: Relevance/diversity trade-off for MMR (default: SEARCH_MMR_LAMBDA)
+            where: ChromaDB metadata filter applied inside the vector search
+                   (see build_where()), e.g. a page range or a section
 
         Returns:
             If query is a string -> dict with keys: 
@@ -211,21 +1026,34 @@ class VectorDB:
             return {"ids": [], "documents": [], "metadatas": [], "distances": []}
 
         try:
-            # Encode queries as list
             logger.info(f"Searching for {len(queries)} quer{'y' if len(queries)==1 else 'ies'}...")
-            query_embeddings = self.embedding_model.encode(queries)
-            
-            # FIX: Safely convert to list
-            try:
-                emb_list = query_embeddings.tolist()
-            except Exception:
-                emb_list = list(query_embeddings)
-
-            # Query the collection
-            results = self.collection.query(
-                query_embeddings=emb_list,
-                n_results=n_results,
-            )
+            with stage("query_encode"):
+                if single_query and QUERY_BATCHING:
+                    # Share one encode() call with queries from concurrent requests
+                    emb_list = [get_query_batcher(self.embedding_model_name).encode(queries[0])]
+                else:
+                    # Encode queries as list
+                    query_embeddings = self.embedding_model.encode(queries)
+                    
+                    # FIX: Safely convert to list
+                    try:
+                        emb_list = query_embeddings.tolist()
+                    except Exception:
+                        emb_list = list(query_embeddings)
+
+            max_distance = SEARCH_MAX_DISTANCE if max_distance is None else max_distance
+            adaptive_margin = SEARCH_ADAPTIVE_MARGIN if adaptive_margin is None else adaptive_margin
+            mmr = SEARCH_MMR if mmr is None else mmr
+            mmr_lambda = SEARCH_MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+
+            # Query the collection (MMR picks from a larger candidate pool, by embedding)
+            with stage("vector_search"):
+                results = self.collection.query(
+                    query_embeddings=emb_list,
+                    n_results=n_results * max(1, SEARCH_FETCH_FACTOR) if mmr else n_results,
+                    include=["documents", "metadatas", "distances"] + (["embeddings"] if mmr else []),
+                    **({"where": where} if where else {}),
+                )
 
             # Extract results
             ids = results.get("ids", [])
@@ -238,6 +1066,8 @@ class VectorDB:
                 logger.warning("No results found for query")
                 return {"ids": [], "documents": [], "metadatas": [], "distances": []}
 
+            embeddings = results.get("embeddings") if mmr else None
+
             # Build output structure
             qcount = len(queries)
             out: List[Dict[str, Any]] = []
@@ -250,6 +1080,16 @@ class VectorDB:
                     "distances": distances[i] if i < len(distances) else [],
                 })
 
+            if max_distance > 0 or adaptive_margin > 0 or mmr:
+                with stage("result_select"):
+                    candidates = sum(len(result["ids"]) for result in out)
+                    out = [
+                        self._select(result, emb_list[i], embeddings[i] if embeddings is not None else None,
+                                     n_results, max_distance, adaptive_margin, mmr_lambda)
+                        for i, result in enumerate(out)
+                    ]
+                annotate("retrieval", {"candidates": candidates, "kept": sum(len(r["ids"]) for r in out)})
+
             result = out[0] if single_query else out
             
             # FIX: Log search results
@@ -264,6 +1104,61 @@ class VectorDB:
             empty_result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
             return empty_result if single_query else [empty_result]
 
+    def get_document_chunks(self, document_id: str) -> List[str]:
+        """
+        Get the stored chunks of a document in document order.
+
+        Args:
+            document_id: Document the chunks belong to
+
+        Returns:
+            List[str]: chunk texts ordered by chunk_index (empty on error)
+        """
+        try:
+            stored = self.collection.get(where={"source": document_id}, include=["documents", "metadatas"])
+            ordered = sorted(
+                zip(stored.get("metadatas") or [], stored.get("documents") or []),
+                key=lambda item: (item[0] or {}).get("chunk_index", 0),
+            )
+            return [document for _, document in ordered]
+        except Exception as e:
+            logger.error(f"Error reading chunks of {document_id}: {e}")
+            return []
+
+    @staticmethod
+    def _select(result: Dict[str, Any], query_embedding, embeddings, n_results: int,
+                max_distance: float, adaptive_margin: float, mmr_lambda: float) -> Dict[str, Any]:
+        """
+        Apply the distance cutoff, adaptive k and MMR to one query's results.
+
+        Args:
+            result: ids, documents, metadatas and distances, closest first
+            query_embedding: The query's vector
+            embeddings: Vectors of the results (None unless MMR is on)
+            n_results: Most results to keep
+            max_distance: Drop results further away (0 disables)
+            adaptive_margin: Drop results further than this beyond the closest (0 disables)
+            mmr_lambda: Relevance/diversity trade-off, used when embeddings are given
+
+        Returns:
+            dict: result with only the selected entries, in selection order
+        """
+        distances = np.asarray(result["distances"], dtype=np.float64)
+        keep = np.ones(len(distances), dtype=bool)
+        if max_distance > 0:
+            keep &= distances <= max_distance
+        if adaptive_margin > 0 and keep.any():
+            keep &= distances <= distances[keep].min() + adaptive_margin
+        indexes = np.flatnonzero(keep)
+
+        if embeddings is not None and len(indexes) > 1:
+            picked = mmr_select(query_embedding, np.asarray(embeddings)[indexes], n_results, mmr_lambda)
+            indexes = indexes[picked]
+        else:
+            indexes = indexes[:n_results]
+
+        return {key: [values[i] for i in indexes] for key, values in result.items()}
+
     def delete_collection(self) -> bool:
         """
         Delete the current collection from ChromaDB.
@@ -276,6 +1171,7 @@ class VectorDB:
             - Reset the database
         """
         try:
+            evict_vector_db(self.collection_name)
             self.client.delete_collection(name=self.collection_name)
             logger.info(f"Deleted collection: {self.collection_name}")
             return True